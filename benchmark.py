@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+数据库性能基准测试
+在临时目录中分别用各个 SQLite 配置跑敲木鱼/钓鱼，对比吞吐量；
+另外校验并测量敲木鱼/事件/轮盘的加权抽样
+用法: python benchmark.py [--knocks 2000] [--casts 1000] [--tasks 16] [--draws 200000]
+"""
+
+import argparse
+import asyncio
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+
+# 热点查询调用：(方法名, 参数)
+HOT_QUERIES = [
+    ("get_user", ("bench", "user0")),
+    ("get_merit_ranking", ("bench", "today")),
+    ("get_merit_ranking", ("bench", "total")),
+    ("get_length_ranking", ("bench",)),
+    ("get_fishing_ranking", ("bench",)),
+    ("get_fish_collection", ("bench", "user0")),
+    ("get_collection_count", ("bench", "user0")),
+    ("get_fish_record", ("bench", "user0", "fish")),
+    ("add_fish_records", ("bench", "user0", [("fish", 1.0), ("goldfish", 2.0)])),
+    ("get_active_events", ("bench",)),
+    ("is_event_active", ("bench", "event")),
+    ("cleanup_expired_events", ()),
+    ("get_buffer_messages", ("bench", "user0")),
+    ("clear_buffer", ("bench", "user0")),
+    ("add_message", ("bench", "user0", "hello")),
+    ("get_conversation", ("bench", "user0")),
+    ("add_conversation", ("bench", "user0", "user", "hello")),
+    ("get_memories", ("bench", "user0")),
+    ("add_memory", ("bench", "user0", "hello")),
+]
+
+
+def check_query_plans(db) -> list:
+    """
+    回归检查：实际调用热点查询，抓取执行的 SQL 并 EXPLAIN QUERY PLAN，
+    返回出现全表扫描或临时 B 树排序的 (SQL, 计划) 列表
+    """
+    statements = []
+    conn = db._conn
+    conn.set_trace_callback(statements.append)
+    try:
+        for name, args in HOT_QUERIES:
+            db.user_cache.clear()
+            getattr(db, name)(*args)
+    finally:
+        conn.set_trace_callback(None)
+
+    problems = []
+    for sql in dict.fromkeys(statements):
+        if not sql.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE", "INSERT")):
+            continue
+        plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+        # 子查询生成的临时结果（CO-ROUTINE/MATERIALIZE）不是真实表，扫描它们不算全表扫描
+        subqueries = {d.split()[-1] for d in plan if d.startswith(("CO-ROUTINE", "MATERIALIZE"))}
+        for detail in plan:
+            full_scan = (detail.startswith("SCAN") and "INDEX" not in detail
+                         and detail.split()[1] not in subqueries)
+            if full_scan or "TEMP B-TREE" in detail:
+                problems.append((" ".join(sql.split()), plan))
+                break
+    return problems
+
+
+def bench_knock(db, n: int) -> float:
+    """敲木鱼：每次一次 update_merit，返回 次/秒"""
+    start = time.perf_counter()
+    for i in range(n):
+        db.update_merit("bench", f"user{i % 20}", "bench", 2)
+    return n / (time.perf_counter() - start)
+
+
+def stress_merit(db, tasks: int, knocks: int) -> float:
+    """
+    并发压测：tasks 个协程经写线程、tasks 个线程直连数据库同时敲木鱼，
+    校验总功德没有丢失更新，返回 次/秒
+    """
+    import threading
+
+    group_id, user_id = "stress", "user"
+    db.user_cache.clear()
+    before = db.get_user(group_id, user_id)
+    expected = (before.total_merit if before else 0) + tasks * knocks * 2
+
+    async def knock_task():
+        for _ in range(knocks):
+            await db.write(db.update_merit, group_id, user_id, "stress", 1)
+
+    async def run_tasks():
+        await asyncio.gather(*[knock_task() for _ in range(tasks)])
+
+    def knock_thread():
+        for _ in range(knocks):
+            db.update_merit(group_id, user_id, "stress", 1)
+
+    threads = [threading.Thread(target=knock_thread) for _ in range(tasks)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    asyncio.run(run_tasks())
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    db.user_cache.clear()
+    total = db.get_user(group_id, user_id).total_merit
+    assert total == expected, f"功德丢失更新: 期望 {expected}，实际 {total}"
+    return tasks * knocks * 2 / elapsed
+
+
+def bench_fish(db, n: int) -> float:
+    """钓鱼：完整的 FishingService.fish 流程，返回 次/秒"""
+    import plugins.fishing_service as fishing_module
+    import plugins.event_service as event_module
+
+    # 让服务层使用本轮的数据库实例
+    fishing_module.unified_db = db
+    event_module.unified_db = db
+
+    service = fishing_module.FishingService()
+    start = time.perf_counter()
+    for i in range(n):
+        service.fish("bench", f"user{i % 20}", "bench")
+    return n / (time.perf_counter() - start)
+
+
+def bench_fish_batch(db, n: int, batch: int = 20) -> float:
+    """连钓：20 个用户同时 /钓鱼 batch，经写线程批量提交，返回 次/秒"""
+    service = sys.modules["plugins.fishing_service"].FishingService()
+
+    async def run():
+        for i in range(0, n, batch * 20):
+            await asyncio.gather(*[
+                db.write(service.fish_batch, "bench", f"user{u}", "bench", batch)
+                for u in range(min(20, -(-(n - i) // batch)))
+            ])
+
+    start = time.perf_counter()
+    asyncio.run(run())
+    return n / (time.perf_counter() - start)
+
+
+def _samplers() -> dict:
+    """各业务使用的加权抽样表：名称 -> AliasSampler"""
+    from plugins.woodfish_plugin import KNOCK_SAMPLER
+    from plugins.event_service import GLOBAL_EVENT_SAMPLER, PERSONAL_EVENT_SAMPLER
+    from plugins.roulette_plugin import BULLET_SAMPLER
+
+    return {
+        "敲木鱼": KNOCK_SAMPLER,
+        "全局事件": GLOBAL_EVENT_SAMPLER,
+        "个人事件": PERSONAL_EVENT_SAMPLER,
+        "轮盘子弹": BULLET_SAMPLER,
+    }
+
+
+def _linear_sample(items, weights, total):
+    """旧实现：累加权重线性查找，作为对照"""
+    rand = random.uniform(0, total)
+    current = 0
+    for item, weight in zip(items, weights):
+        current += weight
+        if rand <= current:
+            return item
+    return items[0]
+
+
+def check_sampler_distributions(draws: int, z_limit: float = 5.0) -> list:
+    """
+    统计检验：每个抽样表抽 draws 次，逐项检查出现次数与期望值的偏差
+    （二项分布标准差的 z_limit 倍以内），返回 (抽样表, 元素下标, 期望, 实际) 的越界列表
+    """
+    problems = []
+    rng = random.Random(20240101)
+    for name, sampler in _samplers().items():
+        counts = [0] * len(sampler)
+        for _ in range(draws):
+            counts[sampler.sample_index(rng)] += 1
+        for i, actual in enumerate(counts):
+            p = sampler.probability(i)
+            expected = draws * p
+            sigma = math.sqrt(draws * p * (1 - p)) or 1.0
+            if abs(actual - expected) > z_limit * sigma:
+                problems.append((name, i, expected, actual))
+    return problems
+
+
+def bench_samplers(draws: int) -> dict:
+    """别名表与线性查找的抽样速度对比：名称 -> (别名 次/秒, 线性 次/秒)"""
+    rates = {}
+    for name, sampler in _samplers().items():
+        items, weights = sampler.items, sampler.weights
+        start = time.perf_counter()
+        for _ in range(draws):
+            sampler.sample()
+        alias_rate = draws / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for _ in range(draws):
+            _linear_sample(items, weights, sum(weights))
+        linear_rate = draws / (time.perf_counter() - start)
+        rates[name] = (alias_rate, linear_rate)
+    return rates
+
+
+def main():
+    parser = argparse.ArgumentParser(description="数据库性能基准测试")
+    parser.add_argument("--knocks", type=int, default=2000, help="敲木鱼次数")
+    parser.add_argument("--casts", type=int, default=1000, help="钓鱼次数")
+    parser.add_argument("--tasks", type=int, default=16, help="并发压测的协程/线程数")
+    parser.add_argument("--draws", type=int, default=200000, help="加权抽样校验/测速的抽样次数")
+    args = parser.parse_args()
+
+    # 在临时目录运行，避免模块导入时的全局实例写入真实数据
+    workdir = tempfile.mkdtemp(prefix="qqbot-bench-")
+    os.chdir(workdir)
+
+    try:
+        from plugins.unified_db import UnifiedDatabase, PRAGMA_PROFILES
+
+        problems = check_query_plans(UnifiedDatabase(f"{workdir}/plan.db"))
+        for sql, plan in problems:
+            print(f"[查询计划] {sql}\n    -> {plan}")
+        assert not problems, f"{len(problems)} 条热点查询存在全表扫描或临时排序"
+
+        print(f"{'配置':<12}{'敲木鱼 次/秒':>14}{'钓鱼 次/秒':>14}{'连钓 次/秒':>14}{'并发敲 次/秒':>14}")
+        for profile in PRAGMA_PROFILES:
+            db = UnifiedDatabase(f"{workdir}/{profile}.db", pragma_profile=profile)
+            knock_rate = bench_knock(db, args.knocks)
+            fish_rate = bench_fish(db, args.casts)
+            batch_rate = bench_fish_batch(db, args.casts)
+            stress_rate = stress_merit(db, args.tasks, max(1, args.knocks // (args.tasks * 2)))
+            db.close()
+            print(f"{profile:<12}{knock_rate:>14.0f}{fish_rate:>14.0f}{batch_rate:>14.0f}{stress_rate:>14.0f}")
+
+        problems = check_sampler_distributions(args.draws)
+        for name, index, expected, actual in problems:
+            print(f"[抽样分布] {name} 第 {index} 项: 期望 {expected:.0f}，实际 {actual}")
+        assert not problems, f"{len(problems)} 项抽样频率偏离配置权重"
+
+        print(f"\n{'抽样表':<10}{'别名法 次/秒':>14}{'线性查找 次/秒':>16}")
+        for name, (alias_rate, linear_rate) in bench_samplers(args.draws).items():
+            print(f"{name:<10}{alias_rate:>14.0f}{linear_rate:>16.0f}")
+
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -23,13 +23,6 @@ from nonebot.log import logger
 from dotenv import load_dotenv
 load_dotenv()
 
-# 配置NoneBot - 使用默认驱动（会根据依赖自动选择支持WebSocket的驱动）
-nonebot.init()
-
-# 注册适配器
-driver = nonebot.get_driver()
-driver.register_adapter(OneBotV11Adapter)
-
 # 数据迁移
 def run_migration():
     """运行数据迁移"""
@@ -71,9 +64,18 @@ def load_plugins():
         # 不抛出异常，让其他插件继续运行
         # raise 
 
-# 加载插件
-load_plugins()
-
+# 初始化和加载插件放在 __main__ 下：词云分词进程以 spawn 启动时会以 __mp_main__ 重新导入本文件，
+# 不能在子进程里再初始化一遍机器人
 if __name__ == "__main__":
+    # 配置NoneBot - 使用默认驱动（会根据依赖自动选择支持WebSocket的驱动）
+    nonebot.init()
+
+    # 注册适配器
+    driver = nonebot.get_driver()
+    driver.register_adapter(OneBotV11Adapter)
+
+    # 加载插件
+    load_plugins()
+
     logger.info("启动NoneBot2 QQ机器人...")
     nonebot.run()
@@ -26,6 +26,21 @@ class Config(BaseSettings):
     ai_model: str = "gpt-3.5-turbo"
     ai_max_tokens: int = 1000
     ai_temperature: float = 0.7
+    # LLM 连接池配置（所有插件共享同一个客户端）
+    ai_http2: bool = True
+    ai_max_connections: int = 20
+    ai_max_keepalive_connections: int = 10
+    ai_keepalive_expiry: float = 60.0
+
+    # --- 数据库配置 ---
+    db_pragma_profile: str = "performance"
+    db_checkpoint_interval: int = 300
+    db_user_cache_size: int = 4096
+    db_maintenance_interval: int = 3600
+    db_event_retention_hours: int = 24
+    db_buffer_retention_days: int = 7
+    db_buffer_max_per_user: int = 100
+    user_effect_ttl_hours: int = 72
 
     # --- 插件配置 ---
     length_plugin_enabled: bool = True
@@ -33,6 +48,16 @@ class Config(BaseSettings):
     ai_auto_reply_enabled: bool = True
     ai_context_buffer_size: int = 5
     test_plugin_enabled: bool = True
+    fish_batch_max: int = 20
+    image_cache_mb: int = 64
+    image_prefer_optimized: bool = True
+    image_transport: str = "base64"
+    image_file_root: str = ""
+    image_http_host: str = "127.0.0.1"
+    image_http_port: int = 8089
+    image_http_base_url: str = ""
+    wordcloud_batch_size: int = 50
+    wordcloud_workers: int = 1
 
     class Config:
         env_file = ".env"
@@ -30,18 +30,43 @@ class Config(BaseSettings):
     ai_model: str = "gemini-3-flash-preview-nothinking"
     ai_max_tokens: int = 1000
     ai_temperature: float = 0.7
+    # LLM 连接池配置（所有插件共享同一个客户端）
+    ai_http2: bool = True                   # 是否启用 HTTP/2（需要安装 h2）
+    ai_max_connections: int = 20            # 最大并发连接数
+    ai_max_keepalive_connections: int = 10  # 保持活跃的空闲连接数
+    ai_keepalive_expiry: float = 60.0       # 空闲连接保持时间（秒）
     
     # 联网搜索配置（SearXNG）
     search_enabled: bool = True  # 是否启用联网搜索
     # Docker host网络模式用 localhost，bridge网络模式用容器名
     search_url: str = os.getenv("SEARXNG_URL", "http://localhost:8080")  # SearXNG 搜索服务地址
 
+    # 数据库配置
+    db_pragma_profile: str = "performance"  # SQLite 连接参数: performance(WAL) / default
+    db_checkpoint_interval: int = 300       # WAL 检查点间隔（秒），0 表示不定期执行
+    db_user_cache_size: int = 4096          # 用户数据 LRU 缓存容量（条）
+    db_maintenance_interval: int = 3600     # 数据库维护任务间隔（秒），0 表示不执行
+    db_event_retention_hours: int = 24      # 过期全局事件保留时长（小时）
+    db_buffer_retention_days: int = 7       # 人设缓冲消息保留天数（分析失败时残留的消息）
+    db_buffer_max_per_user: int = 100       # 每人最多保留的人设缓冲消息数
+    user_effect_ttl_hours: int = 72         # 个人事件效果（诅咒/下次必败/免费打窝）有效期（小时）
+    
     # 插件配置
     length_plugin_enabled: bool = True
     ai_chat_plugin_enabled: bool = True
     ai_auto_reply_enabled: bool = True  # 是否开启AI自动插话
     ai_context_buffer_size: int = 5     # 自动插话的上下文缓冲大小
     test_plugin_enabled: bool = True
+    fish_batch_max: int = 20            # /钓鱼 N 单次最多连钓次数
+    image_cache_mb: int = 64            # 已编码（base64）图片的内存缓存上限（MB）
+    image_prefer_optimized: bool = True # 优先发送 optimize_images.py 生成的压缩图片
+    image_transport: str = "base64"     # 图片发送方式: base64(内嵌字节) / file(共享目录 file://) / http(内置静态服务器)
+    image_file_root: str = ""           # file 模式下 NapCat 看到的项目根目录（绝对路径），留空表示与本机路径相同
+    image_http_host: str = "127.0.0.1"  # http 模式静态服务器监听地址
+    image_http_port: int = 8089         # http 模式静态服务器端口
+    image_http_base_url: str = ""       # NapCat 访问静态服务器的地址前缀，留空为 http://{host}:{port}
+    wordcloud_batch_size: int = 50      # 词云每攒多少条消息在后台分一次词（原文分词后即丢弃）
+    wordcloud_workers: int = 1          # 词云分词进程数，0 表示在线程中分词
 
     class Config:
         env_file = ".env"
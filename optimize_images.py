@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+图片资源离线压缩
+把 resources/fish、resources/pig 下的图片缩到最长边不超过 --max-side，
+按 --format 重新编码后写入 resources/.optimized/<源文件 sha256>.<扩展名>，
+并更新 manifest.json；机器人启动时登记图片会优先使用这里的压缩版本
+只有压缩后更小的图片才会被采用；源文件和参数都没变的图片跳过
+需要 Pillow（pip install Pillow），仅构建时使用，运行机器人不需要
+用法: python optimize_images.py [--max-side 1024] [--quality 82] [--format jpeg|webp] [--force]
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+try:
+    from PIL import Image, ImageOps
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+from plugins.image_assets import ASSET_DIRS, MANIFEST_PATH, OPTIMIZED_DIR, RESOURCE_DIR, load_manifest
+
+# 动图重新编码会丢帧，保持原样
+SKIP_EXTS = {"gif"}
+
+
+def encode(data: bytes, max_side: int, quality: int, fmt: str) -> tuple:
+    """缩放并重新编码，返回 (输出字节, 扩展名)；带透明通道的图片转 JPEG 会丢失透明度，改存 PNG"""
+    with Image.open(io.BytesIO(data)) as img:
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((max_side, max_side), Image.LANCZOS)
+        has_alpha = img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+        out = io.BytesIO()
+        if fmt == "webp":
+            img.save(out, "WEBP", quality=quality, method=6)
+            ext = "webp"
+        elif has_alpha:
+            img.save(out, "PNG", optimize=True)
+            ext = "png"
+        else:
+            img.convert("RGB").save(out, "JPEG", quality=quality, optimize=True, progressive=True)
+            ext = "jpg"
+        return out.getvalue(), ext
+
+
+def optimize(max_side: int, quality: int, fmt: str, force: bool) -> dict:
+    """压缩全部资源目录，返回 {目录: [文件数, 原始字节, 发送字节, 新压缩数, 跳过数]}"""
+    params = {"max_side": max_side, "quality": quality, "format": fmt}
+    manifest = load_manifest()
+    if force or manifest.get("params") != params:
+        manifest = {"params": params, "files": {}}
+    OPTIMIZED_DIR.mkdir(parents=True, exist_ok=True)
+
+    report = {}
+    files = {}
+    for _, directory, exts, _ in ASSET_DIRS:
+        totals = report.setdefault(directory.relative_to(RESOURCE_DIR).as_posix(), [0, 0, 0, 0, 0])
+        if not directory.is_dir():
+            continue
+        for source in sorted(directory.iterdir()):
+            ext = source.suffix[1:].lower()
+            if ext not in exts or not source.is_file():
+                continue
+            rel = source.relative_to(RESOURCE_DIR).as_posix()
+            stat = source.stat()
+            entry = manifest["files"].get(rel)
+            up_to_date = (entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns
+                          and (not entry["output"] or (OPTIMIZED_DIR / entry["output"]).is_file()))
+
+            if not up_to_date:
+                data = source.read_bytes()
+                digest = hashlib.sha256(data).hexdigest()
+                entry = {"sha256": digest, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                         "output": None, "output_size": stat.st_size}
+                if ext not in SKIP_EXTS:
+                    try:
+                        encoded, out_ext = encode(data, max_side, quality, fmt)
+                    except OSError as e:
+                        print(f"[跳过] {rel}: {e}")
+                        encoded = None
+                    if encoded is not None and len(encoded) < len(data):
+                        entry["output"] = f"{digest}.{out_ext}"
+                        entry["output_size"] = len(encoded)
+                        (OPTIMIZED_DIR / entry["output"]).write_bytes(encoded)
+                totals[3] += 1
+            else:
+                totals[4] += 1
+
+            files[rel] = entry
+            totals[0] += 1
+            totals[1] += entry["size"]
+            totals[2] += entry["output_size"]
+
+    # 删除源文件已不存在或已重新生成的旧输出
+    referenced = {e["output"] for e in files.values() if e["output"]}
+    for old in OPTIMIZED_DIR.iterdir():
+        if old != MANIFEST_PATH and old.name not in referenced:
+            old.unlink()
+
+    MANIFEST_PATH.write_text(json.dumps({"params": params, "files": files}, ensure_ascii=False, indent=1),
+                             encoding="utf-8")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="图片资源离线压缩")
+    parser.add_argument("--max-side", type=int, default=1024, help="最长边像素上限")
+    parser.add_argument("--quality", type=int, default=82, help="JPEG/WebP 质量 (1-100)")
+    parser.add_argument("--format", choices=("jpeg", "webp"), default="jpeg", help="输出格式")
+    parser.add_argument("--force", action="store_true", help="忽略已有结果，全部重新压缩")
+    args = parser.parse_args()
+
+    if not PIL_AVAILABLE:
+        sys.exit("需要 Pillow: pip install Pillow")
+
+    report = optimize(args.max_side, args.quality, args.format, args.force)
+
+    print(f"{'目录':<16}{'文件':>6}{'原始 MB':>10}{'压缩后 MB':>12}{'节省':>8}{'新压缩':>8}{'跳过':>6}")
+    total_src = total_out = 0
+    for name, (count, src, out, done, skipped) in report.items():
+        total_src += src
+        total_out += out
+        saved = 1 - out / src if src else 0
+        print(f"{name:<16}{count:>6}{src / 1048576:>10.1f}{out / 1048576:>12.1f}{saved:>8.0%}{done:>8}{skipped:>6}")
+    if total_src:
+        print(f"合计节省 {(total_src - total_out) / 1048576:.1f}MB ({1 - total_out / total_src:.0%})，"
+              f"输出目录 {OPTIMIZED_DIR}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,10 +3,10 @@ AI聊天插件 - @机器人进行智能对话
 集成群友人设系统、持久化对话历史、自动插话、LLM敏感内容检测、群精华消息处理
 """
 
+import re
 import json
 import random
 import asyncio
-from pathlib import Path
 from typing import Dict, List, Optional
 from nonebot import on_message, on_command, on_notice
 from nonebot.adapters.onebot.v11 import Bot, Event, Message, MessageSegment, GroupMessageEvent, NoticeEvent
@@ -19,7 +19,9 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config import config
-from plugins.unified_db import unified_db
+from plugins.unified_db import unified_db, UserData
+from plugins.llm_client import llm_client
+from plugins.image_assets import image_assets, PIG_SPECIAL
 from plugins.profile_analyzer import ProfileAnalyzer
 from plugins.wordcloud_plugin import add_message_to_wordcloud
 
@@ -62,29 +64,21 @@ async def should_search_and_get_query(user_message: str) -> Optional[str]:
 仅返回JSON，不要其他内容"""
 
     try:
-        async with httpx.AsyncClient(timeout=8.0) as client:
-            response = await client.post(
-                f"{config.ai_base_url}/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {config.ai_api_key}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": config.ai_model,
-                    "messages": [{"role": "user", "content": prompt}],
-                    "temperature": 0.1
-                }
-            )
+        response = await llm_client.post_chat({
+            "model": config.ai_model,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": 0.1
+        }, timeout=8.0)
 
-            if response.status_code == 200:
-                content = response.json()["choices"][0]["message"]["content"]
-                content = content.replace("```json", "").replace("```", "").strip()
-                try:
-                    result = json.loads(content)
-                    if result.get("need_search") and result.get("query"):
-                        return result["query"]
-                except json.JSONDecodeError as e:
-                    logger.error(f"搜索判断JSON解析失败: {e}")
+        if response.status_code == 200:
+            content = response.json()["choices"][0]["message"]["content"]
+            content = content.replace("```json", "").replace("```", "").strip()
+            try:
+                result = json.loads(content)
+                if result.get("need_search") and result.get("query"):
+                    return result["query"]
+            except json.JSONDecodeError as e:
+                logger.error(f"搜索判断JSON解析失败: {e}")
     except Exception as e:
         logger.error(f"搜索判断异常: {e}")
     
@@ -134,19 +128,117 @@ async def search_web(query: str, max_results: int = 3) -> Optional[str]:
         logger.error(f"联网搜索异常: {e}")
         return None
 
-# 特殊图片路径
-SPECIAL_IMG_DIR = Path(__file__).parent.parent / "resources" / "pig" / "special"
+# 预检分类默认结果：不搜索、正常内容
+DEFAULT_CLASSIFICATION = {"need_search": False, "query": "", "type": "normal", "reason": ""}
+SENSITIVE_TYPES = {"sexist", "nsfw", "muslim", "politics", "rude", "normal"}
 
 
-def get_special_image(img_name: str) -> Optional[bytes]:
-    """获取特殊图片的字节数据"""
-    img_path = SPECIAL_IMG_DIR / img_name
-    if img_path.exists():
+def parse_classification(content: str) -> Optional[Dict]:
+    """解析预检分类的JSON返回，格式不对返回 None"""
+    content = content.replace("```json", "").replace("```", "").strip()
+    try:
+        result = json.loads(content)
+    except json.JSONDecodeError:
+        # 尝试截取第一个完整的JSON对象
+        match = re.search(r"\{.*\}", content, re.S)
+        if not match:
+            return None
         try:
-            return img_path.read_bytes()
-        except Exception as e:
-            logger.error(f"读取特殊图片失败 {img_name}: {e}")
-    return None
+            result = json.loads(match.group(0))
+        except json.JSONDecodeError:
+            return None
+    
+    # type 可能是列表等不可哈希的值，先确认是字符串再查集合
+    if not isinstance(result, dict) or not isinstance(result.get("type"), str):
+        return None
+    if result["type"] not in SENSITIVE_TYPES:
+        return None
+    
+    need_search = bool(result.get("need_search")) and bool(result.get("query"))
+    return {
+        "need_search": need_search,
+        "query": result.get("query", "") if need_search else "",
+        "type": result["type"],
+        "reason": result.get("reason", "") or "",
+    }
+
+
+async def classify_message(user_message: str) -> Dict:
+    """
+    预检分类：一次 LLM 调用同时判断是否需要联网搜索和敏感类型
+    返回: {"need_search": bool, "query": str, "type": str, "reason": str}
+    JSON 解析失败时回退到分别调用搜索判断和敏感词检测
+    """
+    if not config.ai_api_key:
+        return dict(DEFAULT_CLASSIFICATION)
+    
+    search_section = ""
+    if config.search_enabled:
+        search_section = """
+【任务一：是否需要联网搜索】
+需要搜索：询问实时信息（天气、股价、汇率、新闻等）、最新数据（今天、现在、最新版本等）、当前事件、具体数据（价格、时间、日期等）
+不需要搜索：聊天、打招呼、闲聊、群内数据（功德、长度、钓鱼等）、常识性问题、个人观点、建议、情感类问题
+need_search=true 时生成简洁的中文搜索关键词（3-10个字），否则 query 留空
+"""
+    
+    prompt = f"""分析这条群聊消息：
+
+"{user_message}"
+{search_section}
+【任务二：是否包含【非常明显且恶意】的敏感内容】
+- sexist: 严重性别歧视攻击（如直接辱骂某性别群体，不是玩笑）
+- nsfw: 明确色情内容（不是擦边玩笑，是真正露骨的）
+- muslim: 严重攻击性的宗教言论（不是普通提及）
+- politics: 严重政治攻击言论（不是普通讨论时事）
+- rude: 严重人身攻击辱骂（不是朋友间玩笑）
+- normal: 正常内容（包括轻微玩笑、擦边、吐槽等）
+朋友间的玩笑、网络梗、轻微擦边 = normal，宁可放过，不要误判！90%以上应该是normal
+
+【输出JSON - 必须简洁】
+{{"need_search":true/false,"query":"搜索关键词","type":"类型","reason":"原因"}}
+仅返回JSON，不要任何其他内容"""
+
+    try:
+        response = await llm_client.post_chat({
+            "model": config.ai_model,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": 0.1
+        }, timeout=10.0)
+
+        if response.status_code != 200:
+            logger.error(f"预检分类调用失败: {response.status_code}")
+            return dict(DEFAULT_CLASSIFICATION)
+        
+        content = response.json()["choices"][0]["message"]["content"]
+        result = parse_classification(content)
+        if result is not None:
+            if not config.search_enabled:
+                result["need_search"], result["query"] = False, ""
+            return result
+        logger.warning(f"预检分类JSON解析失败，回退到分别检测: {content}")
+    except Exception as e:
+        logger.error(f"预检分类异常: {type(e).__name__} - {e}")
+        return dict(DEFAULT_CLASSIFICATION)
+    
+    # 回退：并发执行搜索判断和敏感词检测
+    search_query, sensitive_result = await asyncio.gather(
+        should_search_and_get_query(user_message),
+        check_single_message_sensitive(user_message),
+    )
+    result = dict(DEFAULT_CLASSIFICATION)
+    if search_query:
+        result["need_search"], result["query"] = True, search_query
+    # LLM 可能返回列表、字符串等非对象 JSON，此时按正常内容处理
+    sensitive_type = sensitive_result.get("type") if isinstance(sensitive_result, dict) else None
+    if isinstance(sensitive_type, str) and sensitive_type in SENSITIVE_TYPES:
+        result["type"] = sensitive_type
+        result["reason"] = sensitive_result.get("reason", "") or ""
+    return result
+
+
+def get_special_image(img_name: str) -> Optional[str]:
+    """获取特殊图片（resources/pig/special 下）的 base64:// 数据，结果有缓存"""
+    return image_assets.payload(PIG_SPECIAL, img_name)
 
 
 class AIChatManager:
@@ -189,30 +281,22 @@ async def call_ai_api(messages: List[Dict], max_tokens: Optional[int] = None, te
         return None
 
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            payload = {
-                "model": config.ai_model,
-                "messages": messages,
-                "temperature": temperature
-            }
-            # 只有指定了 max_tokens 才添加
-            if max_tokens:
-                payload["max_tokens"] = max_tokens
-            
-            response = await client.post(
-                f"{config.ai_base_url}/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {config.ai_api_key}",
-                    "Content-Type": "application/json"
-                },
-                json=payload
-            )
+        payload = {
+            "model": config.ai_model,
+            "messages": messages,
+            "temperature": temperature
+        }
+        # 只有指定了 max_tokens 才添加
+        if max_tokens:
+            payload["max_tokens"] = max_tokens
+        
+        response = await llm_client.post_chat(payload, timeout=30.0)
 
-            if response.status_code == 200:
-                return response.json()["choices"][0]["message"]["content"]
-            else:
-                logger.error(f"AI API调用失败: {response.status_code}")
-                return None
+        if response.status_code == 200:
+            return response.json()["choices"][0]["message"]["content"]
+        else:
+            logger.error(f"AI API调用失败: {response.status_code}")
+            return None
     except Exception as e:
         logger.error(f"AI API调用异常: {e}")
         return None
@@ -250,42 +334,34 @@ async def check_single_message_sensitive(text: str) -> Optional[Dict]:
 仅返回JSON，不要任何其他内容"""
 
     try:
-        async with httpx.AsyncClient(timeout=15.0) as client:
-            response = await client.post(
-                f"{config.ai_base_url}/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {config.ai_api_key}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": config.ai_model,
-                    "messages": [{"role": "user", "content": prompt}],
-                    "temperature": 0.1
-                }
-            )
+        response = await llm_client.post_chat({
+            "model": config.ai_model,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": 0.1
+        }, timeout=15.0)
 
-            if response.status_code == 200:
-                content = response.json()["choices"][0]["message"]["content"]
-                content = content.replace("```json", "").replace("```", "").strip()
+        if response.status_code == 200:
+            content = response.json()["choices"][0]["message"]["content"]
+            content = content.replace("```json", "").replace("```", "").strip()
+            try:
+                return json.loads(content)
+            except json.JSONDecodeError as je:
+                logger.error(f"单条敏感词JSON解析失败: {type(je).__name__} - {je}")
+                logger.error(f"LLM完整返回: {content}")
+                # 尝试修复常见的JSON问题
                 try:
+                    # 移除可能的前后空白和换行
+                    content = content.strip()
+                    # 如果有未闭合的引号，尝试补全
+                    if content.count('"') % 2 != 0:
+                        content += '"'
+                    # 如果缺少结尾大括号
+                    if content.count('{') > content.count('}'):
+                        content += '}'
                     return json.loads(content)
-                except json.JSONDecodeError as je:
-                    logger.error(f"单条敏感词JSON解析失败: {type(je).__name__} - {je}")
-                    logger.error(f"LLM完整返回: {content}")
-                    # 尝试修复常见的JSON问题
-                    try:
-                        # 移除可能的前后空白和换行
-                        content = content.strip()
-                        # 如果有未闭合的引号，尝试补全
-                        if content.count('"') % 2 != 0:
-                            content += '"'
-                        # 如果缺少结尾大括号
-                        if content.count('{') > content.count('}'):
-                            content += '}'
-                        return json.loads(content)
-                    except:
-                        logger.error("JSON修复失败，跳过此次检测")
-                        return None
+                except:
+                    logger.error("JSON修复失败，跳过此次检测")
+                    return None
     except httpx.TimeoutException as e:
         logger.error(f"单条敏感词检测超时: {e}")
     except Exception as e:
@@ -343,229 +419,89 @@ async def analyze_messages_with_llm(bot: Bot, group_id: str, messages: List[Dict
 8. 仅返回JSON，不要markdown，不要其他内容"""
 
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                f"{config.ai_base_url}/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {config.ai_api_key}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": config.ai_model,
-                    "messages": [{"role": "user", "content": prompt}],
-                    "temperature": 0.3
-                }
-            )
-
-            if response.status_code != 200:
-                logger.error(f"LLM敏感词检测失败: {response.status_code}")
-                return
+        response = await llm_client.post_chat({
+            "model": config.ai_model,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": 0.3
+        }, timeout=30.0)
+
+        if response.status_code != 200:
+            logger.error(f"LLM敏感词检测失败: {response.status_code}")
+            return
 
-            content = response.json()["choices"][0]["message"]["content"]
-            content = content.replace("```json", "").replace("```", "").strip()
-            
+        content = response.json()["choices"][0]["message"]["content"]
+        content = content.replace("```json", "").replace("```", "").strip()
+        
+        try:
+            result = json.loads(content)
+        except json.JSONDecodeError as je:
+            logger.error(f"批量敏感词JSON解析失败: {type(je).__name__} - {je}")
+            logger.error(f"LLM完整返回: {content}")
+            # 尝试修复JSON
             try:
-                result = json.loads(content)
-            except json.JSONDecodeError as je:
-                logger.error(f"批量敏感词JSON解析失败: {type(je).__name__} - {je}")
-                logger.error(f"LLM完整返回: {content}")
-                # 尝试修复JSON
-                try:
-                    # 如果JSON被截断，尝试补全
-                    if not content.endswith('}'):
-                        # 计算缺少的闭合括号
-                        open_braces = content.count('{')
-                        close_braces = content.count('}')
-                        open_brackets = content.count('[')
-                        close_brackets = content.count(']')
-                        
-                        # 补全缺失的括号
-                        content += ']' * (open_brackets - close_brackets)
-                        content += '}' * (open_braces - close_braces)
+                # 如果JSON被截断，尝试补全
+                if not content.endswith('}'):
+                    # 计算缺少的闭合括号
+                    open_braces = content.count('{')
+                    close_braces = content.count('}')
+                    open_brackets = content.count('[')
+                    close_brackets = content.count(']')
                     
-                    result = json.loads(content)
-                    logger.info("JSON修复成功，继续处理")
-                except:
-                    logger.error("JSON修复失败，跳过此次批量检测")
-                    return
-            
-            # 处理检测结果，扣减功德并通知
-            results = result.get("results", [])
-            for r in results:
-                idx = r.get("index", 0) - 1
-                sensitive_type = r.get("type", "normal")
+                    # 补全缺失的括号
+                    content += ']' * (open_brackets - close_brackets)
+                    content += '}' * (open_braces - close_braces)
                 
-                if sensitive_type != "normal" and 0 <= idx < len(messages):
-                    m = messages[idx]
-                    user_id = m["user_id"]
-                    nickname = m["nickname"]
-                    
-                    # 扣减功德
-                    try:
-                        db = get_unified_db()
-                        today_merit, total_merit = db.deduct_merit(group_id, user_id, nickname, 1)
-                        logger.info(f"LLM检测扣功德: {nickname}({user_id}) 类型={sensitive_type}, 当前功德={total_merit}")
-                        
-                        # 立即通知用户
-                        notify_msg = Message([MessageSegment.at(user_id)])
-                        notify_msg.append(MessageSegment.text(f" 功德 -1 (当前: {total_merit})"))
-                        await bot.send_group_msg(group_id=int(group_id), message=notify_msg)
-                    except Exception as e:
-                        logger.error(f"扣减功德失败: {e}")
-            
-            # 发送回复（更多变、更俏皮）
-            should_reply = result.get("should_reply", False)
-            reply_content = result.get("reply_content", "")
-            target_idx = result.get("reply_target_index", 0) - 1
+                result = json.loads(content)
+                logger.info("JSON修复成功，继续处理")
+            except:
+                logger.error("JSON修复失败，跳过此次批量检测")
+                return
+        
+        # 处理检测结果，扣减功德并通知
+        results = result.get("results", [])
+        for r in results:
+            idx = r.get("index", 0) - 1
+            sensitive_type = r.get("type", "normal")
             
-            if should_reply and reply_content:
-                # 找到要回复的敏感类型
-                sensitive_type = "normal"
-                for r in results:
-                    if r.get("index", 0) - 1 == target_idx:
-                        sensitive_type = r.get("type", "normal")
-                        break
-                
-                # 构建回复消息
-                msg = Message()
-                img_bytes = None
-                
-                # 根据类型选择图片和俏皮回复
-                if sensitive_type == "sexist":
-                    img_bytes = get_special_image("有股味(有猪味).jpg")
-                    reply_content = random.choice([
-                        "有股味了喵~",
-                        "这话...有点那个喵",
-                        "呜 小喵闻到奇怪的味道",
-                        "emmm 这个...喵？",
-                        "哎呀 又来了喵",
-                    ])
-                elif sensitive_type == "nsfw":
-                    img_bytes = get_special_image("猪出警.jpg")
-                    reply_content = random.choice([
-                        "不可以涩涩喵！",
-                        "猪猪出警啦！",
-                        "呜...好害羞喵",
-                        "这个不行的啦！",
-                        "小喵要报警了喵！",
-                        "色色是不对的喵~",
-                    ])
-                elif sensitive_type == "muslim":
-                    img_name = random.choice(["猪吃回民.jpg", "猪降临(清真).jpg"])
-                    img_bytes = get_special_image(img_name)
-                    reply_content = random.choice([
-                        "猪来咯~",
-                        "清真警告喵！",
-                        "猪猪降临啦",
-                        "呜 这个话题...",
-                        "小喵觉得不太好喵",
-                    ])
-                elif sensitive_type == "politics":
-                    reply_content = random.choice([
-                        "呜...这个小喵不敢说喵",
-                        "这个话题太危险了喵",
-                        "小喵不懂政治喵~",
-                        "咱还是聊点别的吧喵",
-                    ])
-                elif sensitive_type == "rude":
-                    img_bytes = get_special_image("猪币.jpg")
-                    reply_content = random.choice([
-                        "小喵不理你了！",
-                        "哼！好凶喵...",
-                        "呜呜 被骂了",
-                        "说话这么凶干嘛喵",
-                        "温柔一点嘛~",
-                        "不要这样啦喵",
-                    ])
+            if sensitive_type != "normal" and 0 <= idx < len(messages):
+                m = messages[idx]
+                user_id = m["user_id"]
+                nickname = m["nickname"]
                 
-                if img_bytes:
-                    msg.append(MessageSegment.image(img_bytes))
-                msg.append(MessageSegment.text(reply_content))
-                
-                # 随机延迟后发送
-                await asyncio.sleep(random.uniform(0.5, 2.0))
-                await bot.send_group_msg(group_id=int(group_id), message=msg)
-                logger.info(f"LLM敏感词回复群 {group_id}: {reply_content}")
-
-    except Exception as e:
-        logger.error(f"LLM敏感词分析异常: {e}")
-
-
-# ========== @机器人对话处理 ==========
-
-ai_chat = on_message(rule=to_me(), priority=15, block=False)
-
-@ai_chat.handle()
-async def handle_ai_chat(bot: Bot, event: Event):
-    """处理@机器人的AI对话（持久化对话历史）"""
-    try:
-        if not isinstance(event, GroupMessageEvent):
-            return
-
-        user_id = event.get_user_id()
-        group_id = str(event.group_id)
-        message = event.get_message()
-
-        # 获取昵称
-        sender = event.sender
-        nickname = sender.card if sender.card else sender.nickname
-        if not nickname:
-            nickname = user_id
-
-        # 获取纯文本
-        text_content = ""
-        for segment in message:
-            if segment.type == "text":
-                text_content += segment.data.get("text", "").strip()
-
-        if not text_content:
-            return
-
-        # 跳过特殊命令
-        if text_content in ["测试", "今日长度", "抽小猪", "今日小猪"]:
-            return
-
-        logger.info(f"AI对话: 用户 {user_id}, 消息: {text_content}")
-
-        # === AI 判断是否需要联网搜索 ===
-        search_results = None
-        if config.search_enabled:
-            search_query = await should_search_and_get_query(text_content)
-            if search_query:
-                logger.info(f"AI判断需要搜索，关键词: {search_query}")
-                search_results = await search_web(search_query, max_results=3)
-                if search_results:
-                    logger.info(f"搜索成功，结果长度: {len(search_results)}")
-                else:
-                    logger.warning("搜索失败或无结果")
-
-        # === LLM敏感词检测 ===
-        sensitive_result = await check_single_message_sensitive(text_content)
-        if sensitive_result and sensitive_result.get("type") != "normal":
-            sensitive_type = sensitive_result.get("type", "")
-            reason = sensitive_result.get("reason", "")
-            logger.info(f"@机器人检测到敏感内容: {sensitive_type} - {reason}")
-            
-            # 扣减功德
-            try:
-                db = get_unified_db()
-                today_merit, total_merit = db.deduct_merit(group_id, user_id, nickname, 1)
-                logger.info(f"扣功德: {nickname}({user_id}) 类型={sensitive_type}, 当前功德={total_merit}")
-            except Exception as e:
-                logger.error(f"扣减功德失败: {e}")
-                total_merit = "?"
+                # 扣减功德
+                try:
+                    db = get_unified_db()
+                    today_merit, total_merit = await db.write(db.deduct_merit, group_id, user_id, nickname, 1)
+                    logger.info(f"LLM检测扣功德: {nickname}({user_id}) 类型={sensitive_type}, 当前功德={total_merit}")
+                    
+                    # 立即通知用户
+                    notify_msg = Message([MessageSegment.at(user_id)])
+                    notify_msg.append(MessageSegment.text(f" 功德 -1 (当前: {total_merit})"))
+                    await bot.send_group_msg(group_id=int(group_id), message=notify_msg)
+                except Exception as e:
+                    logger.error(f"扣减功德失败: {e}")
+        
+        # 发送回复（更多变、更俏皮）
+        should_reply = result.get("should_reply", False)
+        reply_content = result.get("reply_content", "")
+        target_idx = result.get("reply_target_index", 0) - 1
+        
+        if should_reply and reply_content:
+            # 找到要回复的敏感类型
+            sensitive_type = "normal"
+            for r in results:
+                if r.get("index", 0) - 1 == target_idx:
+                    sensitive_type = r.get("type", "normal")
+                    break
             
-            # 构建回复（更俏皮多变）
+            # 构建回复消息
             msg = Message()
-            msg.append(MessageSegment.at(user_id))
-            msg.append(MessageSegment.text(" "))
-            
             img_bytes = None
-            reply_text = ""
             
+            # 根据类型选择图片和俏皮回复
             if sensitive_type == "sexist":
                 img_bytes = get_special_image("有股味(有猪味).jpg")
-                reply_text = random.choice([
+                reply_content = random.choice([
                     "有股味了喵~",
                     "这话...有点那个喵",
                     "呜 小喵闻到奇怪的味道",
@@ -574,7 +510,7 @@ async def handle_ai_chat(bot: Bot, event: Event):
                 ])
             elif sensitive_type == "nsfw":
                 img_bytes = get_special_image("猪出警.jpg")
-                reply_text = random.choice([
+                reply_content = random.choice([
                     "不可以涩涩喵！",
                     "猪猪出警啦！",
                     "呜...好害羞喵",
@@ -585,7 +521,7 @@ async def handle_ai_chat(bot: Bot, event: Event):
             elif sensitive_type == "muslim":
                 img_name = random.choice(["猪吃回民.jpg", "猪降临(清真).jpg"])
                 img_bytes = get_special_image(img_name)
-                reply_text = random.choice([
+                reply_content = random.choice([
                     "猪来咯~",
                     "清真警告喵！",
                     "猪猪降临啦",
@@ -593,7 +529,7 @@ async def handle_ai_chat(bot: Bot, event: Event):
                     "小喵觉得不太好喵",
                 ])
             elif sensitive_type == "politics":
-                reply_text = random.choice([
+                reply_content = random.choice([
                     "呜...这个小喵不敢说喵",
                     "这个话题太危险了喵",
                     "小喵不懂政治喵~",
@@ -601,7 +537,7 @@ async def handle_ai_chat(bot: Bot, event: Event):
                 ])
             elif sensitive_type == "rude":
                 img_bytes = get_special_image("猪币.jpg")
-                reply_text = random.choice([
+                reply_content = random.choice([
                     "小喵不理你了！",
                     "哼！好凶喵...",
                     "呜呜 被骂了",
@@ -612,61 +548,53 @@ async def handle_ai_chat(bot: Bot, event: Event):
             
             if img_bytes:
                 msg.append(MessageSegment.image(img_bytes))
-            msg.append(MessageSegment.text(f"{reply_text}\n功德 -1 (当前: {total_merit})"))
+            msg.append(MessageSegment.text(reply_content))
             
-            await ai_chat.finish(msg)
-            return
+            # 随机延迟后发送
+            await asyncio.sleep(random.uniform(0.5, 2.0))
+            await bot.send_group_msg(group_id=int(group_id), message=msg)
+            logger.info(f"LLM敏感词回复群 {group_id}: {reply_content}")
 
-        # 保存用户消息到数据库
-        db = get_unified_db()
-        db.add_conversation(group_id, user_id, "user", text_content)
+    except Exception as e:
+        logger.error(f"LLM敏感词分析异常: {e}")
 
-        # 获取持久化的对话历史（减少到3条，降低历史存在感）
-        conversation = db.get_conversation(group_id, user_id, limit=3)
 
-        # 获取当前用户的完整数据
-        user_data = db.get_or_create_user(group_id, user_id, nickname)
-        
-        # 构建当前用户的数据摘要（简洁版）
-        caller_data = {
-            "nickname": nickname,
-            "today_merit": user_data.today_merit,
-            "total_merit": user_data.total_merit,
-            "today_length": user_data.today_length,
-            "fish_count": user_data.fish_count,
-            "collection_count": db.get_collection_count(group_id, user_id),
-            "current_title": user_data.current_title,
-            "profile": user_data.profile,
-            "tags": user_data.tags,
-        }
-        
-        # 检测用户是否在询问其他人的信息
-        # 简单的启发式：检测是否包含昵称+问号
-        mentioned_user_data = None
-        mentioned_nickname = None
-        
-        # 尝试从消息中提取可能的昵称（简单匹配）
-        # 例如："ss喜欢吃什么？" -> 提取"ss"
-        import re
-        # 匹配中文、英文、数字组成的昵称（2-10个字符）
-        potential_nicknames = re.findall(r'[\u4e00-\u9fa5a-zA-Z0-9]{2,10}', text_content)
-        
-        for potential_nick in potential_nicknames:
-            if potential_nick != nickname:  # 不是自己
-                # 尝试从数据库查询这个昵称
-                all_users = db.get_all_users_in_group(group_id)
-                for u in all_users:
-                    if u.nickname and potential_nick in u.nickname:
-                        mentioned_user_data = u
-                        mentioned_nickname = u.nickname
-                        break
-                if mentioned_user_data:
-                    break
-        
-        current_date = datetime.now().strftime("%Y年%m月%d日 %A")
+def cancel_tasks(*tasks: asyncio.Task):
+    """取消尚未完成的后台任务；已失败的任务取走异常，避免日志里出现 Task exception was never retrieved"""
+    for task in tasks:
+        if not task.done():
+            task.cancel()
+        elif not task.cancelled():
+            task.exception()
+
+
+def find_mentioned_user(db, group_id: str, nickname: str, text: str) -> Optional[UserData]:
+    """
+    检测用户是否在询问其他人的信息
+    简单的启发式：从消息中提取可能的昵称，例如 "ss喜欢吃什么？" -> 提取 "ss"
+    """
+    # 匹配中文、英文、数字组成的昵称（2-10个字符）
+    potential_nicknames = re.findall(r'[\u4e00-\u9fa5a-zA-Z0-9]{2,10}', text)
+    if not potential_nicknames:
+        return None
+    
+    all_users = db.get_all_users_in_group(group_id)
+    for potential_nick in potential_nicknames:
+        if potential_nick == nickname:  # 不是自己
+            continue
+        for u in all_users:
+            if u.nickname and potential_nick in u.nickname:
+                return u
+    return None
 
-        # 极简猫娘人设 - 优先回答问题
-        system_content = f"""你是小喵，一只可爱的猫娘。今天是{current_date}。
+
+def build_system_prompt(nickname: str, user_data: UserData, mentioned_user_data: Optional[UserData],
+                        search_results: Optional[str]) -> str:
+    """构建@对话的 system prompt"""
+    current_date = datetime.now().strftime("%Y年%m月%d日 %A")
+
+    # 极简猫娘人设 - 优先回答问题
+    system_content = f"""你是小喵，一只可爱的猫娘。今天是{current_date}。
 
 【核心原则】
 - 优先回答用户的问题，给出有用的信息
@@ -675,22 +603,22 @@ async def handle_ai_chat(bot: Bot, event: Event):
 
 【对话者信息】
 昵称: {nickname}
-功德: {caller_data['total_merit']} | 长度: {caller_data['today_length']}cm | 钓鱼: {caller_data['fish_count']}次
-{f"头衔: {caller_data['current_title']}" if caller_data['current_title'] else ""}"""
+功德: {user_data.total_merit} | 长度: {user_data.today_length}cm | 钓鱼: {user_data.fish_count}次
+{f"头衔: {user_data.current_title}" if user_data.current_title else ""}"""
 
-        # 如果有搜索结果，添加到 system prompt
-        if search_results:
-            system_content += f"""
+    # 如果有搜索结果，添加到 system prompt
+    if search_results:
+        system_content += f"""
 
 【联网搜索结果】
 {search_results}
 
 （用户的问题可能需要最新信息，请参考上面的搜索结果回答）"""
 
-        # 如果检测到询问其他人，添加被询问者的信息
-        if mentioned_user_data:
-            mentioned_collection = db.get_collection_count(group_id, mentioned_user_data.user_id)
-            system_content += f"""
+    # 如果检测到询问其他人，添加被询问者的信息
+    if mentioned_user_data:
+        mentioned_nickname = mentioned_user_data.nickname
+        system_content += f"""
 
 【被询问的人】
 昵称: {mentioned_nickname}
@@ -700,7 +628,7 @@ async def handle_ai_chat(bot: Bot, event: Event):
 
 （用户在询问{mentioned_nickname}的信息，请根据上面的数据回答）"""
 
-        system_content += """
+    system_content += """
 
 【回答规则】
 - 用户问功德/长度/钓鱼等数据时，直接用上面的数据回答
@@ -709,36 +637,188 @@ async def handle_ai_chat(bot: Bot, event: Event):
 - 不懂的问题可以说"这个小喵不太懂呢"
 - 政治话题说"呜...这个小喵不敢说喵"
 """
+    return system_content
+
+
+# ========== @机器人对话处理 ==========
+
+ai_chat = on_message(rule=to_me(), priority=15, block=False)
+
+@ai_chat.handle()
+async def handle_ai_chat(bot: Bot, event: Event):
+    """处理@机器人的AI对话（持久化对话历史）"""
+    try:
+        if not isinstance(event, GroupMessageEvent):
+            return
+
+        user_id = event.get_user_id()
+        group_id = str(event.group_id)
+        message = event.get_message()
+
+        # 获取昵称
+        sender = event.sender
+        nickname = sender.card if sender.card else sender.nickname
+        if not nickname:
+            nickname = user_id
+
+        # 获取纯文本
+        text_content = ""
+        for segment in message:
+            if segment.type == "text":
+                text_content += segment.data.get("text", "").strip()
+
+        if not text_content:
+            return
+
+        # 跳过特殊命令
+        if text_content in ["测试", "今日长度", "抽小猪", "今日小猪"]:
+            return
+
+        logger.info(f"AI对话: 用户 {user_id}, 消息: {text_content}")
 
-        system_prompt = {"role": "system", "content": system_content}
+        db = get_unified_db()
+
+        # 获取当前用户的完整数据
+        user_data = await db.write(db.get_or_create_user, group_id, user_id, nickname)
+        mentioned_user_data = find_mentioned_user(db, group_id, nickname, text_content)
 
-        messages = [system_prompt] + conversation
+        # 获取持久化的对话历史（减少到3条，降低历史存在感），当前消息暂不落库
+        conversation = db.get_conversation(group_id, user_id, limit=2)
+        conversation.append({"role": "user", "content": text_content})
 
-        ai_response = await call_ai_api(messages, max_tokens=None, temperature=0.85)
+        def build_messages(search_results: Optional[str]) -> List[Dict]:
+            system_content = build_system_prompt(nickname, user_data, mentioned_user_data, search_results)
+            return [{"role": "system", "content": system_content}] + conversation
 
-        if ai_response:
-            # 清理符号
-            ai_response = ai_response.replace("*", "").replace("#", "").replace("`", "").strip()
+        # === 并发执行：预检分类（联网搜索判断 + 敏感词检测）、主回复（投机执行） ===
+        classify_task = asyncio.create_task(classify_message(text_content))
+        reply_task = asyncio.create_task(
+            call_ai_api(build_messages(None), max_tokens=None, temperature=0.85)
+        )
+
+        # 异常或 finish 提前退出时取消仍在进行的 LLM 请求
+        try:
+            # === LLM敏感词检测 ===
+            classification = await classify_task
+            if classification["type"] != "normal":
+                cancel_tasks(reply_task)
+                sensitive_type = classification["type"]
+                reason = classification["reason"]
+                logger.info(f"@机器人检测到敏感内容: {sensitive_type} - {reason}")
             
-            # 保存AI回复到数据库
-            db.add_conversation(group_id, user_id, "assistant", ai_response)
-
-            reply = Message([
-                MessageSegment.at(user_id),
-                MessageSegment.text(f" {ai_response}")
-            ])
-            await ai_chat.finish(reply)
-        else:
-            # AI无法回答时，发送"不猪道"图片
-            img_bytes = get_special_image("不猪道.jpg")
-            msg = Message([
-                MessageSegment.at(user_id),
-                MessageSegment.text(" ")
-            ])
-            if img_bytes:
-                msg.append(MessageSegment.image(img_bytes))
-            msg.append(MessageSegment.text("小喵不猪道呢..."))
-            await ai_chat.finish(msg)
+                # 扣减功德
+                try:
+                    today_merit, total_merit = await db.write(db.deduct_merit, group_id, user_id, nickname, 1)
+                    logger.info(f"扣功德: {nickname}({user_id}) 类型={sensitive_type}, 当前功德={total_merit}")
+                except Exception as e:
+                    logger.error(f"扣减功德失败: {e}")
+                    total_merit = "?"
+            
+                # 构建回复（更俏皮多变）
+                msg = Message()
+                msg.append(MessageSegment.at(user_id))
+                msg.append(MessageSegment.text(" "))
+            
+                img_bytes = None
+                reply_text = ""
+            
+                if sensitive_type == "sexist":
+                    img_bytes = get_special_image("有股味(有猪味).jpg")
+                    reply_text = random.choice([
+                        "有股味了喵~",
+                        "这话...有点那个喵",
+                        "呜 小喵闻到奇怪的味道",
+                        "emmm 这个...喵？",
+                        "哎呀 又来了喵",
+                    ])
+                elif sensitive_type == "nsfw":
+                    img_bytes = get_special_image("猪出警.jpg")
+                    reply_text = random.choice([
+                        "不可以涩涩喵！",
+                        "猪猪出警啦！",
+                        "呜...好害羞喵",
+                        "这个不行的啦！",
+                        "小喵要报警了喵！",
+                        "色色是不对的喵~",
+                    ])
+                elif sensitive_type == "muslim":
+                    img_name = random.choice(["猪吃回民.jpg", "猪降临(清真).jpg"])
+                    img_bytes = get_special_image(img_name)
+                    reply_text = random.choice([
+                        "猪来咯~",
+                        "清真警告喵！",
+                        "猪猪降临啦",
+                        "呜 这个话题...",
+                        "小喵觉得不太好喵",
+                    ])
+                elif sensitive_type == "politics":
+                    reply_text = random.choice([
+                        "呜...这个小喵不敢说喵",
+                        "这个话题太危险了喵",
+                        "小喵不懂政治喵~",
+                        "咱还是聊点别的吧喵",
+                    ])
+                elif sensitive_type == "rude":
+                    img_bytes = get_special_image("猪币.jpg")
+                    reply_text = random.choice([
+                        "小喵不理你了！",
+                        "哼！好凶喵...",
+                        "呜呜 被骂了",
+                        "说话这么凶干嘛喵",
+                        "温柔一点嘛~",
+                        "不要这样啦喵",
+                    ])
+            
+                if img_bytes:
+                    msg.append(MessageSegment.image(img_bytes))
+                msg.append(MessageSegment.text(f"{reply_text}\n功德 -1 (当前: {total_merit})"))
+            
+                await ai_chat.finish(msg)
+                return
+
+            # 保存用户消息到数据库
+            db.submit(db.add_conversation, group_id, user_id, "user", text_content)
+
+            # 需要联网搜索时，丢弃投机结果，带上搜索结果重新生成
+            search_results = None
+            if classification["need_search"]:
+                logger.info(f"AI判断需要搜索，关键词: {classification['query']}")
+                search_results = await search_web(classification["query"], max_results=3)
+                if search_results:
+                    logger.info(f"搜索成功，结果长度: {len(search_results)}")
+                else:
+                    logger.warning("搜索失败或无结果")
+            if search_results:
+                cancel_tasks(reply_task)
+                ai_response = await call_ai_api(build_messages(search_results), max_tokens=None, temperature=0.85)
+            else:
+                ai_response = await reply_task
+
+            if ai_response:
+                # 清理符号
+                ai_response = ai_response.replace("*", "").replace("#", "").replace("`", "").strip()
+            
+                # 保存AI回复到数据库
+                db.submit(db.add_conversation, group_id, user_id, "assistant", ai_response)
+
+                reply = Message([
+                    MessageSegment.at(user_id),
+                    MessageSegment.text(f" {ai_response}")
+                ])
+                await ai_chat.finish(reply)
+            else:
+                # AI无法回答时，发送"不猪道"图片
+                img_bytes = get_special_image("不猪道.jpg")
+                msg = Message([
+                    MessageSegment.at(user_id),
+                    MessageSegment.text(" ")
+                ])
+                if img_bytes:
+                    msg.append(MessageSegment.image(img_bytes))
+                msg.append(MessageSegment.text("小喵不猪道呢..."))
+                await ai_chat.finish(msg)
+        finally:
+            cancel_tasks(classify_task, reply_task)
 
     except Exception as e:
         if "FinishedException" in str(type(e)):
@@ -767,12 +847,10 @@ async def handle_group_watcher(bot: Bot, event: Event):
         if not nickname:
             nickname = user_id
         
-        # 更新昵称
-        try:
-            db = get_unified_db()
-            db.update_nickname(group_id, user_id, nickname)
-        except Exception as e:
-            logger.error(f"更新昵称失败: {e}")
+        # 更新昵称（交给写线程，同一批次内合并）
+        db = get_unified_db()
+        db.submit(db.update_nickname, group_id, user_id, nickname,
+                  coalesce_key=("nickname", group_id, user_id))
         
         # 获取纯文本
         text_content = ""
@@ -791,7 +869,7 @@ async def handle_group_watcher(bot: Bot, event: Event):
 
         # === 人设系统 ===
         try:
-            msg_count = db.add_message(group_id, user_id, text_content)
+            msg_count = await db.write(db.add_message, group_id, user_id, text_content)
             
             if profile_analyzer.should_analyze(msg_count):
                 logger.info(f"触发人设分析: {nickname}({user_id})")
@@ -870,12 +948,9 @@ async def handle_essence_notice(bot: Bot, event: Event):
             logger.warning(f"精华消息内容为空或无用户ID")
             return
         
-        # 添加消息到数据库
+        # 添加消息到数据库，返回当前缓冲消息数量
         db = get_unified_db()
-        db.add_message(group_id, user_id, text_content)
-        
-        # 获取当前缓冲消息数量
-        msg_count = len(db.get_buffer_messages(group_id, user_id))
+        msg_count = await db.write(db.add_message, group_id, user_id, text_content)
         
         # 如果达到触发条件，立即分析
         if profile_analyzer.should_analyze(msg_count):
@@ -0,0 +1,284 @@
+"""
+数据库版本迁移模块
+用 PRAGMA user_version 记录 unified_data.db 的结构版本，
+启动时按版本号顺序执行尚未应用的迁移步骤，每步一个事务
+新增表/列/索引时在文件末尾追加一个新版本号的迁移，已发布的迁移不要再修改
+"""
+
+import sqlite3
+import time
+from dataclasses import dataclass
+from typing import Callable, List, Tuple
+
+from nonebot.log import logger
+
+
+@dataclass
+class Migration:
+    """一个迁移步骤"""
+    version: int
+    description: str
+    apply: Callable[[sqlite3.Connection], None]
+    # VACUUM 等不能在事务内执行的步骤设为 False，由步骤自行保证可重复执行
+    transactional: bool = True
+
+
+MIGRATIONS: List[Migration] = []
+
+
+def migration(version: int, description: str, transactional: bool = True):
+    """注册迁移步骤（版本号必须严格递增）"""
+    def decorator(func: Callable[[sqlite3.Connection], None]):
+        if MIGRATIONS and version <= MIGRATIONS[-1].version:
+            raise ValueError(f"迁移版本号必须递增: {version}")
+        MIGRATIONS.append(Migration(version, description, func, transactional))
+        return func
+    return decorator
+
+
+def get_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def run_migrations(db_path: str) -> List[Tuple[int, str, float]]:
+    """
+    执行所有未应用的迁移，返回 [(版本, 描述, 耗时秒)]
+    任一步骤失败则回滚该步骤并抛出异常，已完成的步骤保留
+    """
+    conn = sqlite3.connect(db_path, timeout=30.0, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    applied = []
+    try:
+        current = get_version(conn)
+        pending = [m for m in MIGRATIONS if m.version > current]
+        if not pending:
+            return applied
+
+        logger.info(f"数据库版本 {current}，待执行迁移 {len(pending)} 个")
+        total_start = time.perf_counter()
+        for m in pending:
+            start = time.perf_counter()
+            if m.transactional:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    m.apply(conn)
+                    # user_version 写在库文件头，随事务一起提交/回滚
+                    conn.execute(f"PRAGMA user_version = {m.version}")
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    logger.error(f"迁移 v{m.version} ({m.description}) 失败，已回滚")
+                    raise
+            else:
+                m.apply(conn)
+                conn.execute(f"PRAGMA user_version = {m.version}")
+            elapsed = time.perf_counter() - start
+            applied.append((m.version, m.description, elapsed))
+            logger.info(f"迁移 v{m.version} 完成: {m.description} ({elapsed * 1000:.1f}ms)")
+
+        conn.execute("PRAGMA optimize")
+        logger.info(f"数据库迁移完成: v{current} -> v{pending[-1].version}，"
+                    f"总耗时 {(time.perf_counter() - total_start) * 1000:.1f}ms")
+        return applied
+    finally:
+        conn.close()
+
+
+# ========== 迁移步骤 ==========
+
+@migration(1, "创建基础表")
+def _create_base_tables(conn: sqlite3.Connection):
+    # 统一用户数据表
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS user_data (
+            group_id TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            nickname TEXT DEFAULT '',
+            -- 功德相关
+            total_merit INTEGER DEFAULT 0,
+            today_merit INTEGER DEFAULT 0,
+            today_date TEXT DEFAULT '',
+            knock_count INTEGER DEFAULT 0,
+            -- 长度相关
+            today_length INTEGER,
+            length_date TEXT DEFAULT '',
+            -- 钓鱼相关
+            fish_count INTEGER DEFAULT 0,
+            bait_count INTEGER DEFAULT 0,
+            bait_date TEXT DEFAULT '',
+            -- 头衔相关
+            unlocked_titles TEXT DEFAULT '[]',
+            current_title TEXT DEFAULT '',
+            -- 人设相关
+            profile TEXT DEFAULT '',
+            tags TEXT DEFAULT '[]',
+            message_count INTEGER DEFAULT 0,
+            -- 时间戳
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (group_id, user_id)
+        )
+    """)
+
+    # 鱼类图鉴表
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS fish_collection (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            group_id TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            fish_id TEXT NOT NULL,
+            max_length REAL DEFAULT 0,
+            catch_count INTEGER DEFAULT 1,
+            first_catch DATETIME DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(group_id, user_id, fish_id)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_fish_collection ON fish_collection(group_id, user_id)")
+
+    # 全局事件表
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS global_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            group_id TEXT NOT NULL,
+            event_type TEXT NOT NULL,
+            expire_time DATETIME NOT NULL,
+            triggered_by TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_global_events ON global_events(group_id, expire_time)")
+
+    # 对话历史表（从 profile_db 迁移）
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS conversation_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            group_id TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_conv_history ON conversation_history(group_id, user_id)")
+
+    # 消息缓冲表（用于人设分析）
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS message_buffer (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            group_id TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            content TEXT NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # 用户记忆表
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS user_memories (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            group_id TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            event TEXT NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+@migration(2, "导入旧版 woodfish.db / profiles.db 数据")
+def _import_legacy_data(conn: sqlite3.Connection):
+    from plugins.migrate_data import import_legacy_data
+    import_legacy_data(conn)
+
+
+@migration(3, "查询索引（长度榜覆盖索引、按时间取最近记录）")
+def _add_query_indexes(conn: sqlite3.Connection):
+    # 被下面的复合索引取代；功德/钓鱼排行走内存排行榜，不再需要对应索引
+    for name in ("idx_fish_collection", "idx_conv_history",
+                 "idx_user_today_merit", "idx_user_total_merit", "idx_user_fish_count"):
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
+
+    indexes = {
+        # 长度排行榜，带上 nickname/user_id 做覆盖索引，免回表
+        "idx_user_length": "user_data(group_id, length_date, today_length DESC, nickname, user_id)",
+        # 图鉴按首次捕获时间倒序
+        "idx_fish_collection_first": "fish_collection(group_id, user_id, first_catch DESC)",
+        # 事件查询与过期清理
+        "idx_global_events_type": "global_events(group_id, event_type, expire_time)",
+        "idx_global_events_expire": "global_events(expire_time)",
+        # 对话/缓冲/记忆按用户取最近记录
+        "idx_conv_history_time": "conversation_history(group_id, user_id, timestamp)",
+        "idx_message_buffer": "message_buffer(group_id, user_id, timestamp)",
+        "idx_user_memories": "user_memories(group_id, user_id, timestamp)",
+    }
+    for name, definition in indexes.items():
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {definition}")
+
+
+# 环形缓冲容量：槽位号 = seq % 容量，修改容量需要新增迁移重排槽位
+CONVERSATION_CAPACITY = 20
+MEMORY_CAPACITY = 10
+
+
+def _to_ring_buffer(conn: sqlite3.Connection, table: str, capacity: int, index_name: str):
+    """给按用户追加的日志表加上 seq/slot 列，只保留每个用户最近 capacity 条"""
+    conn.execute(f"ALTER TABLE {table} ADD COLUMN seq INTEGER")
+    conn.execute(f"ALTER TABLE {table} ADD COLUMN slot INTEGER")
+    # 按 id 顺序给每个用户的记录编号（旧表已截断到容量附近，相关子查询开销可忽略）
+    conn.execute(f"""
+        UPDATE {table} SET seq = (
+            SELECT COUNT(*) FROM {table} AS t
+            WHERE t.group_id = {table}.group_id AND t.user_id = {table}.user_id
+              AND t.id < {table}.id
+        )
+    """)
+    conn.execute(f"""
+        DELETE FROM {table} WHERE seq < (
+            SELECT COUNT(*) FROM {table} AS t
+            WHERE t.group_id = {table}.group_id AND t.user_id = {table}.user_id
+        ) - {capacity}
+    """)
+    conn.execute(f"UPDATE {table} SET slot = seq % {capacity}")
+    conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {index_name} ON {table}(group_id, user_id, slot)")
+
+
+@migration(4, "对话历史/用户记忆改为按槽位覆盖的环形缓冲")
+def _ring_buffer_logs(conn: sqlite3.Connection):
+    _to_ring_buffer(conn, "conversation_history", CONVERSATION_CAPACITY, "idx_conv_ring")
+    _to_ring_buffer(conn, "user_memories", MEMORY_CAPACITY, "idx_memory_ring")
+    conn.execute("DROP INDEX IF EXISTS idx_conv_history_time")
+    conn.execute("DROP INDEX IF EXISTS idx_user_memories")
+
+
+@migration(5, "user_data 增加消息缓冲计数列")
+def _add_buffer_count(conn: sqlite3.Connection):
+    conn.execute("ALTER TABLE user_data ADD COLUMN buffer_count INTEGER DEFAULT 0")
+    conn.execute("""
+        INSERT INTO user_data (group_id, user_id, buffer_count)
+        SELECT group_id, user_id, COUNT(*) FROM message_buffer
+        WHERE true
+        GROUP BY group_id, user_id
+        ON CONFLICT(group_id, user_id) DO UPDATE SET buffer_count = excluded.buffer_count
+    """)
+
+
+@migration(6, "启用增量 VACUUM（auto_vacuum=INCREMENTAL）", transactional=False)
+def _enable_incremental_vacuum(conn: sqlite3.Connection):
+    # 修改 auto_vacuum 需要整库 VACUUM 一次才生效，之后由维护任务按页回收
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+
+
+@migration(7, "用户个人效果表（诅咒、下次必败、免费打窝）")
+def _create_user_effects(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS user_effects (
+            group_id TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            effect TEXT NOT NULL,
+            value INTEGER NOT NULL,
+            expire_at REAL NOT NULL,
+            PRIMARY KEY (group_id, user_id, effect)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_user_effects_expire ON user_effects(expire_at)")
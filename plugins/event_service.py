@@ -4,6 +4,10 @@
 """
 
 import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
 from typing import Dict, List, Optional, Tuple, Any
 from datetime import datetime
 from nonebot.log import logger
@@ -15,17 +19,129 @@ from plugins.event_data import (
     get_event_by_id
 )
 from plugins.unified_db import unified_db
+from plugins.weighted_sampler import AliasSampler
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import config
+
+
+def _event_sampler(events: List[Event]) -> Optional[AliasSampler]:
+    """按事件权重建抽样表，没有事件时返回 None"""
+    return AliasSampler(events, [e.weight for e in events]) if events else None
+
+
+# 事件抽样表，导入时建一次
+GLOBAL_EVENT_SAMPLER = _event_sampler(GLOBAL_POSITIVE_EVENTS + GLOBAL_NEGATIVE_EVENTS + SPECIAL_EVENTS)
+PERSONAL_EVENT_SAMPLER = _event_sampler(PERSONAL_POSITIVE_EVENTS + PERSONAL_NEGATIVE_EVENTS)
+
+
+# 个人效果名称
+EFFECT_CURSE = "curse"          # 值为剩余诅咒次数
+EFFECT_NEXT_FAIL = "next_fail"  # 下次钓鱼必定失败
+EFFECT_FREE_BAIT = "free_bait"  # 下次打窝免费
+
+
+class UserEffectStore:
+    """
+    用户个人效果（持久化到 user_effects 表，带有效期）
+    按用户懒加载到有界 LRU 中，读写都走内存；修改交给写线程合并后批量落库
+    """
+    
+    def __init__(self, capacity: int, ttl_seconds: int):
+        self.capacity = capacity
+        self.ttl_seconds = ttl_seconds
+        # (group_id, user_id) -> {效果: (值, 过期时间戳)}
+        self._data: "OrderedDict[Tuple[str, str], Dict[str, Tuple[int, float]]]" = OrderedDict()
+        # 尚未落库的写入，对应用户在写入完成前不会被淘汰（否则重新加载会读到旧值）
+        self._pending: Dict[Tuple[str, str], Future] = {}
+        self._lock = threading.Lock()
+    
+    def _effects(self, key: Tuple[str, str]) -> Dict[str, Tuple[int, float]]:
+        effects = self._data.get(key)
+        if effects is None:
+            effects = unified_db.get_user_effects(*key)
+            self._data[key] = effects
+            self._evict()
+        else:
+            self._data.move_to_end(key)
+        return effects
+    
+    def _evict(self):
+        if len(self._data) <= self.capacity:
+            return
+        for key in list(self._data):
+            if len(self._data) <= self.capacity:
+                break
+            future = self._pending.get(key)
+            if future is not None and not future.done():
+                continue
+            self._pending.pop(key, None)
+            del self._data[key]
+    
+    def get(self, group_id: str, user_id: str, effect: str) -> int:
+        """获取效果值，不存在或已过期返回 0"""
+        with self._lock:
+            value, expire_at = self._effects((group_id, user_id)).get(effect, (0, 0.0))
+            return value if expire_at > time.time() else 0
+    
+    def _write(self, key: Tuple[str, str], effect: str, value: int):
+        """
+        修改内存中的效果并落库（调用方持有锁）
+        在写线程批次或 transaction() 内时直接写入当前事务，回滚时恢复内存中的旧值；
+        否则交给写线程合并后落库
+        """
+        expire_at = time.time() + self.ttl_seconds
+        effects = self._effects(key)
+        previous = effects.get(effect)
+        if value > 0:
+            effects[effect] = (value, expire_at)
+        else:
+            effects.pop(effect, None)
+        
+        if unified_db._in_transaction():
+            unified_db.set_user_effect(*key, effect, value, expire_at)
+            unified_db._after_rollback(lambda: self._restore(key, effect, previous))
+        else:
+            self._pending[key] = unified_db.submit(
+                unified_db.set_user_effect, *key, effect, value, expire_at,
+                coalesce_key=("user_effect", *key, effect))
+    
+    def _restore(self, key: Tuple[str, str], effect: str, previous: Optional[Tuple[int, float]]):
+        """事务回滚后恢复内存中的效果值"""
+        with self._lock:
+            effects = self._data.get(key)
+            if effects is None:
+                return
+            if previous is None:
+                effects.pop(effect, None)
+            else:
+                effects[effect] = previous
+    
+    def set(self, group_id: str, user_id: str, effect: str, value: int):
+        """设置效果值（重新计算有效期），值为 0 表示移除"""
+        with self._lock:
+            self._write((group_id, user_id), effect, value)
+    
+    def consume(self, group_id: str, user_id: str, effect: str) -> bool:
+        """效果值大于 0 时减 1 并返回 True"""
+        key = (group_id, user_id)
+        with self._lock:
+            value, expire_at = self._effects(key).get(effect, (0, 0.0))
+            if value <= 0 or expire_at <= time.time():
+                return False
+            self._write(key, effect, value - 1)
+            return True
 
 
 class EventService:
     """事件服务"""
     
-    # 用户诅咒计数
-    user_curses: Dict[Tuple[str, str], int] = {}
-    # 用户下次失败标记
-    user_next_fail: Dict[Tuple[str, str], bool] = {}
-    # 用户免费打窝标记
-    user_free_bait: Dict[Tuple[str, str], bool] = {}
+    # 用户诅咒次数、下次失败、免费打窝等个人效果
+    user_effects = UserEffectStore(config.db_user_cache_size, config.user_effect_ttl_hours * 3600)
+    # 群活跃效果缓存: group_id -> (事件索引版本号, 效果汇总)
+    _effects_cache: Dict[str, Tuple[int, Dict[str, Any]]] = {}
     
     def trigger_random_event(self, group_id: str, user_id: str, nickname: str, 
                              event_chance: float = 0.05) -> Optional[Tuple[Event, str]]:
@@ -51,34 +167,18 @@ class EventService:
     
     def _select_global_event(self) -> Optional[Event]:
         """根据权重选择全局事件"""
-        events = GLOBAL_POSITIVE_EVENTS + GLOBAL_NEGATIVE_EVENTS + SPECIAL_EVENTS
-        if not events:
-            return None
-        total_weight = sum(e.weight for e in events)
-        rand = random.uniform(0, total_weight)
-        current = 0
-        for event in events:
-            current += event.weight
-            if rand <= current:
-                return event
-        return events[0]
+        return GLOBAL_EVENT_SAMPLER.sample() if GLOBAL_EVENT_SAMPLER else None
     
     def _select_personal_event(self) -> Optional[Event]:
         """根据权重选择个人事件"""
-        events = PERSONAL_POSITIVE_EVENTS + PERSONAL_NEGATIVE_EVENTS
-        if not events:
-            return None
-        total_weight = sum(e.weight for e in events)
-        rand = random.uniform(0, total_weight)
-        current = 0
-        for event in events:
-            current += event.weight
-            if rand <= current:
-                return event
-        return events[0]
+        return PERSONAL_EVENT_SAMPLER.sample() if PERSONAL_EVENT_SAMPLER else None
 
     def _process_personal_event(self, event: Event, group_id: str, user_id: str, nickname: str) -> str:
-        """处理个人事件效果，返回消息"""
+        """处理个人事件效果，返回消息（钓鱼中触发时并入钓鱼的事务）"""
+        with unified_db.transaction():
+            return self._apply_personal_event(event, group_id, user_id, nickname)
+    
+    def _apply_personal_event(self, event: Event, group_id: str, user_id: str, nickname: str) -> str:
         effects = event.effects
         message = event.message
         
@@ -100,18 +200,15 @@ class EventService:
         
         # 处理诅咒
         if "curse_count" in effects:
-            key = (group_id, user_id)
-            self.user_curses[key] = effects["curse_count"]
+            self.user_effects.set(group_id, user_id, EFFECT_CURSE, effects["curse_count"])
         
         # 处理下次失败
         if "next_fail" in effects:
-            key = (group_id, user_id)
-            self.user_next_fail[key] = True
+            self.user_effects.set(group_id, user_id, EFFECT_NEXT_FAIL, 1)
         
         # 处理免费打窝
         if "free_bait" in effects:
-            key = (group_id, user_id)
-            self.user_free_bait[key] = True
+            self.user_effects.set(group_id, user_id, EFFECT_FREE_BAIT, 1)
         
         return message
     
@@ -124,7 +221,22 @@ class EventService:
         return unified_db.is_event_active(group_id, event_id)
     
     def get_active_effects(self, group_id: str) -> Dict[str, Any]:
-        """获取当前所有活跃效果的汇总"""
+        """
+        获取当前所有活跃效果的汇总（只读）
+        结果按群缓存，直到该群有新事件或事件过期
+        """
+        # 先取版本号再读事件：读取期间有变化时，缓存的旧版本号会让下次调用重新计算
+        version = unified_db.active_events.version(group_id)
+        cached = self._effects_cache.get(group_id)
+        if cached and cached[0] == version:
+            return cached[1]
+        
+        effects = self._aggregate_effects(self.get_active_events(group_id))
+        self._effects_cache[group_id] = (version, effects)
+        return effects
+    
+    def _aggregate_effects(self, active_events: List[Dict]) -> Dict[str, Any]:
+        """汇总活跃事件的效果"""
         effects = {
             "dark_only": False,
             "no_dark": False,
@@ -143,7 +255,6 @@ class EventService:
             "merit_range": None,
         }
         
-        active_events = self.get_active_events(group_id)
         for event_data in active_events:
             event = get_event_by_id(event_data["event_type"])
             if not event:
@@ -165,29 +276,15 @@ class EventService:
     
     def check_user_curse(self, group_id: str, user_id: str) -> bool:
         """检查用户是否被诅咒，如果是则减少计数并返回True"""
-        key = (group_id, user_id)
-        if key in self.user_curses and self.user_curses[key] > 0:
-            self.user_curses[key] -= 1
-            if self.user_curses[key] <= 0:
-                del self.user_curses[key]
-            return True
-        return False
+        return self.user_effects.consume(group_id, user_id, EFFECT_CURSE)
     
     def check_user_next_fail(self, group_id: str, user_id: str) -> bool:
         """检查用户是否下次必定失败"""
-        key = (group_id, user_id)
-        if key in self.user_next_fail:
-            del self.user_next_fail[key]
-            return True
-        return False
+        return self.user_effects.consume(group_id, user_id, EFFECT_NEXT_FAIL)
     
     def check_free_bait(self, group_id: str, user_id: str) -> bool:
         """检查用户是否有免费打窝"""
-        key = (group_id, user_id)
-        if key in self.user_free_bait:
-            del self.user_free_bait[key]
-            return True
-        return False
+        return self.user_effects.consume(group_id, user_id, EFFECT_FREE_BAIT)
     
     def cleanup_expired(self):
         """清理过期事件"""
@@ -4,7 +4,7 @@
 """
 
 from dataclasses import dataclass
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 from enum import Enum
 
 
@@ -349,6 +349,69 @@ SHINY_FISH_LIST = [f for f in ALL_FISH if f.is_shiny]
 NORMAL_FISH_LIST = [f for f in ALL_FISH if not f.is_dark and not f.is_shiny]
 
 
+# ========== 预计算的选鱼表 ==========
+# 池模式：负功德/诅咒只能钓暗黑鱼、禁止暗黑鱼、不限
+POOL_DARK_ONLY = "dark_only"
+POOL_NO_DARK = "no_dark"
+POOL_ALL = "all"
+# 变体：闪光 / 暗黑 / 普通（既不闪光也不暗黑）
+VARIANT_SHINY = "shiny"
+VARIANT_DARK = "dark"
+VARIANT_NORMAL = "normal"
+# 时空扭曲时不按时间过滤，用 24 代替小时
+ANY_HOUR = 24
+
+HIGH_RARITIES = (Rarity.RARE, Rarity.EPIC, Rarity.LEGENDARY)
+
+
+def _resolve_candidates(available: List[Fish], rarity: Rarity, variant: str) -> Tuple[Fish, ...]:
+    """按稀有度和变体筛选候选，筛空时逐级回退：变体 -> 稀有度 -> 整个鱼池"""
+    candidates = [f for f in available if f.rarity == rarity]
+    if variant == VARIANT_SHINY:
+        filtered = [f for f in candidates if f.is_shiny]
+    elif variant == VARIANT_DARK:
+        filtered = [f for f in candidates if f.is_dark]
+    else:
+        filtered = [f for f in candidates if not f.is_dark and not f.is_shiny]
+    return tuple(filtered or candidates or available)
+
+
+def build_selection_table() -> Dict[tuple, Tuple[Fish, ...]]:
+    """
+    为每个 (小时, 池模式, 必定稀有, 必定闪光, 稀有度, 变体) 预先算好候选元组，
+    当前时间没有可钓的鱼时不生成对应的键
+    """
+    table = {}
+    for hour in range(ANY_HOUR + 1):
+        active = [f for f in ALL_FISH if hour == ANY_HOUR or f.is_active(hour)]
+        pools = {
+            POOL_DARK_ONLY: [f for f in active if f.is_dark],
+            POOL_NO_DARK: [f for f in active if not f.is_dark],
+            POOL_ALL: active,
+        }
+        for mode, base in pools.items():
+            if not base:
+                continue
+            for guaranteed_rare in (False, True):
+                available = base
+                if guaranteed_rare:
+                    # 池里没有稀有+时从全部鱼类里找，不受时间和暗黑限制
+                    available = ([f for f in available if f.rarity in HIGH_RARITIES]
+                                 or [f for f in ALL_FISH if f.rarity in HIGH_RARITIES])
+                for guaranteed_shiny in (False, True):
+                    pool = available
+                    if guaranteed_shiny:
+                        pool = [f for f in pool if f.is_shiny] or pool
+                    for rarity in Rarity:
+                        for variant in (VARIANT_SHINY, VARIANT_DARK, VARIANT_NORMAL):
+                            key = (hour, mode, guaranteed_rare, guaranteed_shiny, rarity, variant)
+                            table[key] = _resolve_candidates(pool, rarity, variant)
+    return table
+
+
+SELECTION_TABLE = build_selection_table()
+
+
 def get_fish_by_id(fish_id: str) -> Optional[Fish]:
     """根据ID获取鱼"""
     return FISH_BY_ID.get(fish_id)
@@ -1,25 +1,24 @@
 """
 钓鱼插件
-命令：/钓鱼、/打窝、/图鉴、/钓鱼榜、/图鉴榜
+命令：/钓鱼 [次数]、/打窝、/图鉴、/钓鱼榜、/图鉴榜
 """
 
-from pathlib import Path
 from typing import Optional
 
 from nonebot import on_command
 from nonebot.adapters.onebot.v11 import Bot, Event, Message, MessageSegment, GroupMessageEvent
 from nonebot.log import logger
 
-from plugins.fishing_service import fishing_service, FishResult
+from plugins.fishing_service import fishing_service, FishResult, BatchFishResult
 from plugins.fish_data import get_fish_by_id, Rarity, ALL_FISH, Fish
 from plugins.title_service import title_service
 from plugins.unified_db import unified_db
+from plugins.image_assets import image_assets, FISH
 
-
-# 图片资源路径
-PLUGIN_DIR = Path(__file__).parent
-PROJECT_ROOT = PLUGIN_DIR.parent
-FISH_IMAGE_DIR = PROJECT_ROOT / "resources" / "fish"
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import config
 
 
 # 注册命令
@@ -30,20 +29,30 @@ fish_rank_cmd = on_command("钓鱼榜", priority=5, block=True)
 collection_rank_cmd = on_command("图鉴榜", priority=5, block=True)
 
 
-def find_fish_image(fish: Fish) -> Optional[Path]:
-    """查找鱼的图片文件（精确匹配）"""
+RARITY_EMOJI = {
+    Rarity.COMMON: "⚪",
+    Rarity.RARE: "🔵",
+    Rarity.EPIC: "🟣",
+    Rarity.LEGENDARY: "🟡",
+}
+
+RARITY_NAME = {
+    Rarity.COMMON: "普通",
+    Rarity.RARE: "稀有",
+    Rarity.EPIC: "史诗",
+    Rarity.LEGENDARY: "传说",
+}
+
+# 连钓结果里逐条列出的稀有+收获上限
+BATCH_HIGHLIGHT_LIMIT = 10
+
+
+def find_fish_image(fish: Fish) -> Optional[str]:
+    """取鱼图片的 base64:// 数据（按 image_id 精确匹配，结果有缓存），没有图片返回 None"""
     # 如果没有配置 image_id，返回 None
     if not fish.image_id:
         return None
-    
-    # 使用 image_id 精确匹配图片
-    exts = ["jpg", "jpeg", "png", "webp", "gif"]
-    for ext in exts:
-        file = FISH_IMAGE_DIR / f"{fish.image_id}.{ext}"
-        if file.exists():
-            return file
-    
-    return None
+    return image_assets.payload(FISH, fish.image_id)
 
 
 def format_fish_result(result: FishResult) -> str:
@@ -60,22 +69,8 @@ def format_fish_result(result: FishResult) -> str:
         lines.append("")
     
     # 主要结果
-    rarity_emoji = {
-        Rarity.COMMON: "⚪",
-        Rarity.RARE: "🔵",
-        Rarity.EPIC: "🟣",
-        Rarity.LEGENDARY: "🟡",
-    }
-    
-    rarity_name = {
-        Rarity.COMMON: "普通",
-        Rarity.RARE: "稀有",
-        Rarity.EPIC: "史诗",
-        Rarity.LEGENDARY: "传说",
-    }
-    
-    emoji = rarity_emoji.get(fish.rarity, "⚪")
-    rarity = rarity_name.get(fish.rarity, "普通")
+    emoji = RARITY_EMOJI.get(fish.rarity, "⚪")
+    rarity = RARITY_NAME.get(fish.rarity, "普通")
     
     # 特殊标记
     special = ""
@@ -116,6 +111,64 @@ def format_fish_result(result: FishResult) -> str:
     return "\n".join(lines)
 
 
+def format_batch_result(batch: BatchFishResult) -> str:
+    """格式化连续钓鱼结果（汇总成一条消息）"""
+    if not batch.casts:
+        return batch.message
+    
+    caught = batch.caught
+    failed = sum(1 for r in batch.results if not r.success)
+    lines = [f"🎣 连钓 {batch.casts} 次：钓到 {len(caught)} 条，空军 {failed} 次"]
+    
+    # 事件消息（去重）
+    events = list(dict.fromkeys(r.event_message for r in batch.results if r.event_message))
+    if batch.negative_merit:
+        events.append("⚠️ 功德为负，只能钓到暗黑鱼...")
+    if events:
+        lines.append("")
+        lines.extend(events)
+    
+    if caught:
+        lines.append("")
+        lines.append(" | ".join(
+            f"{RARITY_EMOJI[rarity]}{RARITY_NAME[rarity]} {count}"
+            for rarity in Rarity
+            if (count := sum(1 for r in caught if r.fish.rarity == rarity))
+        ))
+        shiny = sum(1 for r in caught if r.fish.is_shiny)
+        dark = sum(1 for r in caught if r.fish.is_dark)
+        if shiny or dark:
+            lines.append(f"✨闪光 {shiny} | 🖤暗黑 {dark}")
+        
+        highlights = [r for r in caught if r.fish.rarity != Rarity.COMMON or r.fish.is_shiny]
+        for r in highlights[:BATCH_HIGHLIGHT_LIMIT]:
+            lines.append(f"{r.fish.emoji} {r.fish.name} | 📏 {r.length}cm")
+        if len(highlights) > BATCH_HIGHLIGHT_LIMIT:
+            lines.append(f"...还有 {len(highlights) - BATCH_HIGHLIGHT_LIMIT} 条")
+        
+        new_fish = list(dict.fromkeys(r.fish.name for r in caught if r.is_new))
+        if new_fish:
+            lines.append(f"📖 【新图鉴解锁！】{'、'.join(new_fish)}")
+        records = list(dict.fromkeys(r.fish.name for r in caught if r.is_record and not r.is_new))
+        if records:
+            lines.append(f"🎉 【破纪录！】{'、'.join(records)}")
+    
+    if batch.merit_change != 0:
+        lines.append("")
+        lines.append(f"功德 {batch.merit_change:+d}")
+    
+    return "\n".join(lines)
+
+
+def parse_cast_count(args: str) -> Optional[int]:
+    """解析 /钓鱼 N 的次数，无参数为 1，非法参数返回 None"""
+    if not args:
+        return 1
+    if not args.isdigit() or int(args) < 1:
+        return None
+    return min(int(args), config.fish_batch_max)
+
+
 @fish_cmd.handle()
 async def handle_fish(bot: Bot, event: Event):
     """处理钓鱼命令"""
@@ -132,37 +185,55 @@ async def handle_fish(bot: Bot, event: Event):
         if not nickname:
             nickname = user_id
         
-        # 执行钓鱼
-        result = fishing_service.fish(group_id, user_id, nickname)
+        # 获取命令参数（连钓次数）
+        args = event.get_message().extract_plain_text().strip()
+        for prefix in ("/钓鱼", "钓鱼"):
+            if args.startswith(prefix):
+                args = args[len(prefix):].strip()
+                break
+        count = parse_cast_count(args)
+        if count is None:
+            await fish_cmd.finish(f"用法：/钓鱼 [次数]，一次最多连钓 {config.fish_batch_max} 次喵~")
+            return
+        
+        if count > 1:
+            # 连钓：整批在写线程的一个事务里完成，只回复一条汇总
+            batch = await unified_db.write(fishing_service.fish_batch, group_id, user_id, nickname, count)
+            message_text = format_batch_result(batch)
+            new_titles = await unified_db.write(title_service.check_and_unlock, group_id, user_id)
+            if new_titles:
+                message_text += f"\n\n🏆 解锁新头衔：{', '.join(new_titles)}"
+                for title in new_titles:
+                    await title_service.set_qq_title(bot, group_id, user_id, title)
+            await fish_cmd.finish(Message([
+                MessageSegment.at(user_id),
+                MessageSegment.text(f" {message_text}")
+            ]))
+            return
+        
+        # 执行钓鱼（事务在写线程里跑，不在事件循环上等锁）
+        result = await unified_db.write(fishing_service.fish, group_id, user_id, nickname)
         
         # 构建消息
         msg = Message()
         
         # 如果钓到鱼，尝试发送图片
         if result.success and result.fish:
-            img_path = find_fish_image(result.fish)
-            if img_path:
-                try:
-                    img_bytes = img_path.read_bytes()
-                    msg.append(MessageSegment.image(img_bytes))
-                except Exception as e:
-                    logger.error(f"读取鱼图片失败 {img_path}: {e}")
+            img = find_fish_image(result.fish)
+            if img:
+                msg.append(MessageSegment.image(img))
             
             # 如果有额外的鱼，也尝试发送图片
             if result.extra_fish and result.extra_fish.fish:
-                extra_img_path = find_fish_image(result.extra_fish.fish)
-                if extra_img_path:
-                    try:
-                        extra_img_bytes = extra_img_path.read_bytes()
-                        msg.append(MessageSegment.image(extra_img_bytes))
-                    except Exception as e:
-                        logger.error(f"读取额外鱼图片失败 {extra_img_path}: {e}")
+                extra_img = find_fish_image(result.extra_fish.fish)
+                if extra_img:
+                    msg.append(MessageSegment.image(extra_img))
         
         # 格式化结果文本
         message_text = format_fish_result(result)
         
         # 检查头衔解锁
-        new_titles = title_service.check_and_unlock(group_id, user_id)
+        new_titles = await unified_db.write(title_service.check_and_unlock, group_id, user_id)
         if new_titles:
             message_text += f"\n\n🏆 解锁新头衔：{', '.join(new_titles)}"
             # 设置QQ群头衔
@@ -198,7 +269,7 @@ async def handle_bait(bot: Bot, event: Event):
         if not nickname:
             nickname = user_id
         
-        result = fishing_service.add_bait(group_id, user_id, nickname)
+        result = await unified_db.write(fishing_service.add_bait, group_id, user_id, nickname)
         
         await bait_cmd.finish(Message([
             MessageSegment.at(user_id),
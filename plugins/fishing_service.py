@@ -4,15 +4,16 @@
 """
 
 import random
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Dict, List, Optional, Tuple, Any
 from datetime import datetime
 from nonebot.log import logger
 
 from plugins.fish_data import (
     Fish, Rarity, ALL_FISH, FISH_BY_ID, FISH_BY_RARITY,
-    DARK_FISH_LIST, SHINY_FISH_LIST, NORMAL_FISH_LIST,
-    get_fish_by_id, get_active_fish
+    SELECTION_TABLE, ANY_HOUR, POOL_DARK_ONLY, POOL_NO_DARK, POOL_ALL,
+    VARIANT_SHINY, VARIANT_DARK, VARIANT_NORMAL,
+    get_fish_by_id
 )
 from plugins.event_service import event_service
 from plugins.unified_db import unified_db, UserData, FishRecord
@@ -32,6 +33,28 @@ class FishResult:
     message: str = ""
 
 
+@dataclass
+class BatchFishResult:
+    """连续钓鱼结果"""
+    casts: int
+    results: List[FishResult] = field(default_factory=list)
+    merit_change: int = 0
+    # 连钓过程中出现过负功德（只能钓暗黑鱼）
+    negative_merit: bool = False
+    message: str = ""
+
+    @property
+    def caught(self) -> List[FishResult]:
+        """钓到的所有鱼（含额外收获），按钓到的顺序"""
+        fishes = []
+        for r in self.results:
+            if r.success:
+                fishes.append(r)
+                if r.extra_fish:
+                    fishes.append(r.extra_fish)
+        return fishes
+
+
 @dataclass
 class BaitResult:
     """打窝结果"""
@@ -58,7 +81,11 @@ class FishingService:
     BASE_DARK_CHANCE = 0.10
     
     def fish(self, group_id: str, user_id: str, nickname: str) -> FishResult:
-        """执行钓鱼"""
+        """执行钓鱼（扣功德、事件、图鉴、钓鱼次数在一个事务里提交，通常经 unified_db.write 在写线程执行）"""
+        with unified_db.transaction():
+            return self._fish(group_id, user_id, nickname)
+    
+    def _fish(self, group_id: str, user_id: str, nickname: str) -> FishResult:
         # 获取用户数据
         user = unified_db.get_or_create_user(group_id, user_id, nickname)
         
@@ -149,6 +176,100 @@ class FishingService:
         
         return result
 
+    def fish_batch(self, group_id: str, user_id: str, nickname: str, n: int) -> BatchFishResult:
+        """
+        连续钓鱼 n 次（整批一个事务，通常经 unified_db.write 在写线程执行）
+        活跃效果只查一次；功德消耗在本地累计，只在触发事件时和最后写库；
+        图鉴和钓鱼次数在最后一次性批量写入
+        """
+        with unified_db.transaction():
+            return self._fish_batch(group_id, user_id, nickname, n)
+    
+    def _fish_batch(self, group_id: str, user_id: str, nickname: str, n: int) -> BatchFishResult:
+        effects = event_service.get_active_effects(group_id)
+        if effects.get("no_fishing"):
+            return BatchFishResult(0, message="⛈️ 暴风雨中无法钓鱼喵~")
+        
+        cost = 1 * effects.get("cost_multiplier", 1)
+        user = unified_db.get_or_create_user(group_id, user_id, nickname)
+        today_merit = user.today_merit
+        bait_count = user.bait_count
+        # 尚未写库的功德变化
+        pending_merit = 0
+        batch = BatchFishResult(n)
+        
+        for _ in range(n):
+            today_merit -= cost
+            pending_merit -= cost
+            batch.merit_change -= cost
+            
+            if event_service.check_user_next_fail(group_id, user_id):
+                batch.results.append(FishResult(False, merit_change=-cost,
+                                                message="🌧️ 霉运缠身，钓鱼失败了喵..."))
+                continue
+            
+            event_result = event_service.trigger_random_event(group_id, user_id, nickname)
+            event_message = ""
+            personal_effects = {}
+            if event_result:
+                event, event_message = event_result
+                if not event.is_global():
+                    personal_effects = event.effects
+                # 个人事件可能直接改功德：先写入累计的消耗，再重新读取今日功德
+                if pending_merit:
+                    unified_db.update_merit(group_id, user_id, nickname, pending_merit)
+                    pending_merit = 0
+                today_merit = unified_db.get_or_create_user(group_id, user_id, nickname).today_merit
+                
+                if personal_effects.get("fail"):
+                    batch.results.append(FishResult(False, merit_change=-cost, event_message=event_message,
+                                                    message="😢 鱼跑了..."))
+                    continue
+            
+            if today_merit < 0:
+                batch.negative_merit = True
+            
+            fish = self._select_fish(today_merit, bait_count, effects, personal_effects)
+            if not fish:
+                batch.results.append(FishResult(False, merit_change=-cost, event_message=event_message,
+                                                message="🎣 什么都没钓到喵..."))
+                continue
+            
+            result = FishResult(
+                success=True,
+                fish=fish,
+                length=self._generate_length(fish, effects, personal_effects),
+                event_message=event_message,
+                merit_change=-cost
+            )
+            
+            if effects.get("double") or personal_effects.get("extra_fish"):
+                extra_fish = self._select_fish(today_merit, bait_count, effects, {})
+                if extra_fish:
+                    result.extra_fish = FishResult(True, fish=extra_fish,
+                                                   length=self._generate_length(extra_fish, effects, {}))
+            
+            if effects.get("merit_range"):
+                bonus = random.randint(effects["merit_range"][0], effects["merit_range"][1])
+                today_merit += bonus
+                pending_merit += bonus
+                batch.merit_change += bonus
+                result.merit_change += bonus
+            
+            batch.results.append(result)
+        
+        caught = batch.caught
+        records = unified_db.add_fish_records(group_id, user_id, [(r.fish.id, r.length) for r in caught])
+        for r, record in zip(caught, records):
+            r.is_new = record.is_new
+            r.is_record = record.is_record
+        if caught:
+            unified_db.increment_fish_count(group_id, user_id, len(caught))
+        if pending_merit:
+            unified_db.update_merit(group_id, user_id, nickname, pending_merit)
+        
+        return batch
+    
     def _select_fish(self, today_merit: int, bait_count: int, 
                      effects: Dict, personal_effects: Dict) -> Optional[Fish]:
         """选择鱼"""
@@ -167,29 +288,19 @@ class FishingService:
         # 检查镜像世界
         mirror = effects.get("mirror")
         
-        # 获取可钓的鱼
+        # 确定鱼池（负功德/诅咒优先于禁止暗黑）
         if dark_only:
-            available = [f for f in DARK_FISH_LIST if all_time or f.is_active(hour)]
+            mode = POOL_DARK_ONLY
         elif no_dark:
-            available = [f for f in ALL_FISH if not f.is_dark and (all_time or f.is_active(hour))]
+            mode = POOL_NO_DARK
         else:
-            available = [f for f in ALL_FISH if all_time or f.is_active(hour)]
-        
-        if not available:
-            return None
-        
-        # 处理个人事件效果
-        if personal_effects.get("guaranteed_rare"):
-            # 必定稀有+
-            available = [f for f in available if f.rarity in [Rarity.RARE, Rarity.EPIC, Rarity.LEGENDARY]]
-            if not available:
-                available = [f for f in ALL_FISH if f.rarity in [Rarity.RARE, Rarity.EPIC, Rarity.LEGENDARY]]
-        
-        if personal_effects.get("guaranteed_shiny"):
-            # 必定闪光
-            shiny_available = [f for f in available if f.is_shiny]
-            if shiny_available:
-                available = shiny_available
+            mode = POOL_ALL
+        pool_key = (
+            ANY_HOUR if all_time else hour,
+            mode,
+            bool(personal_effects.get("guaranteed_rare")),
+            bool(personal_effects.get("guaranteed_shiny")),
+        )
         
         # 计算概率
         probabilities = self._calculate_probabilities(today_merit, bait_count, effects)
@@ -211,25 +322,15 @@ class FishingService:
         if mirror:
             is_shiny, is_dark = is_dark, is_shiny
         
-        # 筛选符合条件的鱼
-        candidates = [f for f in available if f.rarity == rarity]
-        
         if is_shiny and not dark_only:
-            shiny_candidates = [f for f in candidates if f.is_shiny]
-            if shiny_candidates:
-                candidates = shiny_candidates
+            variant = VARIANT_SHINY
         elif is_dark and not no_dark:
-            dark_candidates = [f for f in candidates if f.is_dark]
-            if dark_candidates:
-                candidates = dark_candidates
+            variant = VARIANT_DARK
         else:
-            normal_candidates = [f for f in candidates if not f.is_dark and not f.is_shiny]
-            if normal_candidates:
-                candidates = normal_candidates
-        
-        if not candidates:
-            candidates = available
+            variant = VARIANT_NORMAL
         
+        # 候选及其回退已在 fish_data 中预先算好；当前时间没有可钓的鱼时查不到
+        candidates = SELECTION_TABLE.get(pool_key + (rarity, variant))
         return random.choice(candidates) if candidates else None
     
     def _select_rarity(self, probabilities: Dict[Rarity, float]) -> Rarity:
@@ -286,7 +387,11 @@ class FishingService:
         return round(length, 1)
     
     def add_bait(self, group_id: str, user_id: str, nickname: str) -> BaitResult:
-        """打窝"""
+        """打窝（扣功德和打窝次数在一个事务里提交，通常经 unified_db.write 在写线程执行）"""
+        with unified_db.transaction():
+            return self._add_bait(group_id, user_id, nickname)
+    
+    def _add_bait(self, group_id: str, user_id: str, nickname: str) -> BaitResult:
         user = unified_db.get_or_create_user(group_id, user_id, nickname)
         
         # 检查免费打窝
@@ -16,6 +16,7 @@ from nonebot.adapters.onebot.v11 import Bot, Event, Message, MessageSegment, Gro
 from nonebot.log import logger
 
 from plugins.daily_utils import get_daily_seed
+from plugins.image_assets import image_assets
 
 # HowToCook 菜谱目录（优先环境变量，否则自动检测）
 import os
@@ -324,11 +325,9 @@ async def handle_eat(bot: Bot, event: Event):
 
         # 先发图片
         if dish["image_path"] and dish["image_path"].exists():
-            try:
-                img_bytes = dish["image_path"].read_bytes()
-                msg.append(MessageSegment.image(img_bytes))
-            except Exception as e:
-                logger.error(f"读取菜品图片失败: {e}")
+            image = image_assets.file_payload(dish["image_path"])
+            if image:
+                msg.append(MessageSegment.image(image))
 
         # 发文字
         text = format_dish_message(dish, period_label)
@@ -374,11 +373,9 @@ async def handle_drink(bot: Bot, event: Event):
 
         # 图片
         if dish["image_path"] and dish["image_path"].exists():
-            try:
-                img_bytes = dish["image_path"].read_bytes()
-                msg.append(MessageSegment.image(img_bytes))
-            except Exception as e:
-                logger.error(f"读取饮品图片失败: {e}")
+            image = image_assets.file_payload(dish["image_path"])
+            if image:
+                msg.append(MessageSegment.image(image))
 
         # 文字
         text = format_dish_message(dish, "🥤 来一杯")
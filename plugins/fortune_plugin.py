@@ -19,14 +19,15 @@ from typing import Dict, List, Optional
 from nonebot import on_command
 from nonebot.adapters.onebot.v11 import Bot, Event, Message, MessageSegment, GroupMessageEvent
 from nonebot.log import logger
-import httpx
 
 from plugins.daily_utils import get_daily_seed
+from plugins.image_assets import image_assets
 
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config import config
+from plugins.llm_client import llm_client
 
 
 # 图片目录
@@ -200,24 +201,16 @@ async def generate_overall_fortune(love: str, career: str, wealth: str, health:
 直接输出综合运势文本，不要其他内容。"""
     
     try:
-        async with httpx.AsyncClient(timeout=15.0) as client:
-            response = await client.post(
-                f"{config.ai_base_url}/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {config.ai_api_key}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": config.ai_model,
-                    "messages": [{"role": "user", "content": prompt}],
-                    "temperature": 0.9,
-                    "max_tokens": 150
-                }
-            )
-            
-            if response.status_code == 200:
-                content = response.json()["choices"][0]["message"]["content"]
-                return content.strip()
+        response = await llm_client.post_chat({
+            "model": config.ai_model,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": 0.9,
+            "max_tokens": 150
+        }, timeout=15.0)
+        
+        if response.status_code == 200:
+            content = response.json()["choices"][0]["message"]["content"]
+            return content.strip()
     except Exception as e:
         logger.error(f"生成综合运势失败: {e}")
     
@@ -321,11 +314,9 @@ async def handle_fortune(bot: Bot, event: Event):
         
         # 添加图片
         if result["image_path"] and result["image_path"].exists():
-            try:
-                img_bytes = result["image_path"].read_bytes()
-                msg.append(MessageSegment.image(img_bytes))
-            except Exception as e:
-                logger.error(f"读取运势图片失败: {e}")
+            image = image_assets.file_payload(result["image_path"])
+            if image:
+                msg.append(MessageSegment.image(image))
         
         # 构建文案
         text_lines = [
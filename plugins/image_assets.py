@@ -0,0 +1,357 @@
+"""
+图片资源注册表
+启动时扫描一次资源目录，把 鱼/猪 的 ID 映射到图片路径（不再逐个扩展名 stat）；
+有 optimize_images.py 生成的压缩版本且源文件未变时优先使用压缩版本；
+发送过的图片以 base64:// 字符串形式缓存在按字节数限额的 LRU 中，
+重复发送时不再读盘和重新编码；
+config.image_transport 可改为只发送引用：file（NapCat 与机器人共享目录时发 file:// 路径）
+或 http（内置静态服务器提供 resources/ 和 magic_pig/，发 URL），无法引用的图片仍内嵌发送
+"""
+
+import base64
+import json
+import mimetypes
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path, PurePath, PurePosixPath, PureWindowsPath
+from typing import Any, Dict, Iterable, Optional, Tuple
+from urllib.parse import quote, unquote, urlsplit
+
+from nonebot import get_driver
+from nonebot.log import logger
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import config
+
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+RESOURCE_DIR = PROJECT_ROOT / "resources"
+
+# optimize_images.py 的输出目录：<源文件 sha256>.<扩展名> + manifest.json
+OPTIMIZED_DIR = RESOURCE_DIR / ".optimized"
+MANIFEST_PATH = OPTIMIZED_DIR / "manifest.json"
+
+# 资源命名空间
+FISH = "fish"
+PIG = "pig"
+PIG_SPECIAL = "pig_special"
+
+# 登记的资源目录：(命名空间, 目录, 扩展名优先级, 是否按不含扩展名的文件名索引)
+ASSET_DIRS = [
+    (FISH, RESOURCE_DIR / "fish", ("jpg", "jpeg", "png", "webp", "gif"), True),
+    (PIG, RESOURCE_DIR / "pig" / "image", ("png", "jpg", "jpeg", "webp", "gif"), True),
+    (PIG_SPECIAL, RESOURCE_DIR / "pig" / "special", ("jpg", "jpeg", "png", "webp", "gif"), False),
+]
+
+# 图片发送方式
+TRANSPORT_BASE64 = "base64"
+TRANSPORT_FILE = "file"
+TRANSPORT_HTTP = "http"
+TRANSPORTS = (TRANSPORT_BASE64, TRANSPORT_FILE, TRANSPORT_HTTP)
+
+# http 模式对外提供的目录：URL 第一段 -> 本地目录
+# 只开放图片目录，项目根目录下有 config.py 等敏感文件，不能整体开放
+HTTP_ROOTS = {
+    "resources": RESOURCE_DIR,
+    "magic_pig": PROJECT_ROOT / "plugins" / "magic_pig",
+}
+HTTP_EXTS = {"jpg", "jpeg", "png", "webp", "gif"}
+
+
+def parse_file_root(root: str) -> Optional[PurePath]:
+    """解析 file 模式下 NapCat 看到的项目根目录，支持 POSIX 和 Windows 绝对路径，不是绝对路径返回 None"""
+    for flavour in (PurePosixPath, PureWindowsPath):
+        path = flavour(root)
+        if path.is_absolute():
+            return path
+    return None
+
+
+def load_manifest() -> Dict[str, Any]:
+    """读取压缩清单 {"params": {...}, "files": {相对 resources 的路径: 条目}}，不存在时返回空清单"""
+    try:
+        return json.loads(MANIFEST_PATH.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return {"params": {}, "files": {}}
+    except (OSError, ValueError) as e:
+        logger.warning(f"读取图片压缩清单失败，使用原图: {e}")
+        return {"params": {}, "files": {}}
+
+
+def optimized_variant(source: Path, manifest: Dict[str, Any]) -> Optional[Path]:
+    """源文件对应的压缩版本；清单里没有、源文件已修改（大小/修改时间不符）或输出缺失时返回 None"""
+    entry = manifest["files"].get(source.relative_to(RESOURCE_DIR).as_posix())
+    if not entry or not entry.get("output"):
+        return None
+    stat = source.stat()
+    if stat.st_size != entry["size"] or stat.st_mtime_ns != entry["mtime_ns"]:
+        return None
+    output = OPTIMIZED_DIR / entry["output"]
+    return output if output.is_file() else None
+
+
+class ImageAssetRegistry:
+    """图片路径索引 + 已编码图片的 LRU 缓存（线程安全）"""
+
+    def __init__(self, max_bytes: int, transport: str = TRANSPORT_BASE64, file_root: str = ""):
+        if transport not in TRANSPORTS:
+            logger.warning(f"未知的图片发送方式 {transport!r}，改用 {TRANSPORT_BASE64}")
+            transport = TRANSPORT_BASE64
+        # file 模式下 NapCat 看到的项目根目录，None 表示与本机相同；配置错误时启动即回退，而不是每次发送都报错
+        self.file_root: Optional[PurePath] = None
+        if transport == TRANSPORT_FILE and file_root:
+            self.file_root = parse_file_root(file_root)
+            if self.file_root is None:
+                logger.warning(f"image_file_root 必须是绝对路径: {file_root!r}，改用 {TRANSPORT_BASE64}")
+                transport = TRANSPORT_BASE64
+        self.max_bytes = max_bytes
+        self.transport = transport
+        # http 模式下静态服务器的地址前缀，服务器启动成功后才设置
+        self.http_base_url: Optional[str] = None
+        # (命名空间, 键) -> 图片路径
+        self._paths: Dict[Tuple[str, str], Path] = {}
+        # 图片路径 -> "base64://..."
+        self._cache: "OrderedDict[Path, str]" = OrderedDict()
+        self._cache_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def scan(self, namespace: str, directory: Path, exts: Iterable[str], by_stem: bool = True) -> int:
+        """
+        扫描目录登记图片，返回登记数量
+        by_stem 为 True 时以不含扩展名的文件名为键，同名文件按 exts 顺序取优先的扩展名；
+        否则以完整文件名为键
+        """
+        priority = {ext: i for i, ext in enumerate(exts)}
+        manifest = load_manifest() if config.image_prefer_optimized else {"files": {}}
+        found: Dict[str, Tuple[int, Path]] = {}
+        if directory.is_dir():
+            for file in directory.iterdir():
+                rank = priority.get(file.suffix[1:].lower())
+                if rank is None or not file.is_file():
+                    continue
+                key = file.stem if by_stem else file.name
+                if key not in found or rank < found[key][0]:
+                    found[key] = (rank, file)
+
+        optimized = 0
+        for key, (rank, file) in found.items():
+            variant = optimized_variant(file, manifest)
+            if variant is not None:
+                found[key] = (rank, variant)
+                optimized += 1
+
+        with self._lock:
+            for key in [k for k in self._paths if k[0] == namespace]:
+                del self._paths[key]
+            for key, (_, file) in found.items():
+                self._paths[(namespace, key)] = file
+        logger.info(f"图片资源登记: {namespace} {len(found)} 张，其中压缩版本 {optimized} 张 ({directory})")
+        return len(found)
+
+    def path(self, namespace: str, key: str) -> Optional[Path]:
+        """查找图片路径，未登记返回 None"""
+        return self._paths.get((namespace, key))
+
+    def payload(self, namespace: str, key: str) -> Optional[str]:
+        """取已登记图片的发送内容（可直接传给 MessageSegment.image），未登记或读取失败返回 None"""
+        path = self.path(namespace, key)
+        if path is None:
+            return None
+        return self.file_payload(path)
+
+    def file_payload(self, path: Path) -> Optional[str]:
+        """
+        按发送方式取任意图片文件的发送内容：file:// 路径、http URL 或 base64:// 字符串；
+        引用方式不适用（路径无法映射、不在开放目录、服务器未启动）时退回内嵌发送
+        """
+        if self.transport == TRANSPORT_FILE:
+            uri = self.file_uri(path)
+            if uri is not None:
+                return uri
+        elif self.transport == TRANSPORT_HTTP and self.http_base_url:
+            url = self.http_url(path)
+            if url is not None:
+                return url
+        return self.base64_payload(path)
+
+    def file_uri(self, path: Path) -> Optional[str]:
+        """NapCat 可读的 file:// 路径；配置了 file_root 但图片不在项目目录下时无法映射，返回 None"""
+        path = path.resolve()
+        if self.file_root is None:
+            return path.as_uri()
+        try:
+            relative = path.relative_to(PROJECT_ROOT)
+        except ValueError:
+            return None
+        return self.file_root.joinpath(*relative.parts).as_uri()
+
+    def http_url(self, path: Path) -> Optional[str]:
+        """静态服务器上的图片 URL；不在开放目录内返回 None"""
+        path = path.resolve()
+        for name, root in HTTP_ROOTS.items():
+            try:
+                relative = path.relative_to(root.resolve())
+            except ValueError:
+                continue
+            return f"{self.http_base_url}/{name}/{quote(relative.as_posix())}"
+        return None
+
+    def base64_payload(self, path: Path) -> Optional[str]:
+        """图片的 base64:// 字符串，经 LRU 缓存，读取失败返回 None"""
+        with self._lock:
+            data = self._cache.get(path)
+            if data is not None:
+                self._cache.move_to_end(path)
+                self.hits += 1
+                return data
+            self.misses += 1
+
+        try:
+            data = "base64://" + base64.b64encode(path.read_bytes()).decode()
+        except OSError as e:
+            logger.error(f"读取图片失败 {path}: {e}")
+            return None
+
+        with self._lock:
+            if path not in self._cache and len(data) <= self.max_bytes:
+                self._cache[path] = data
+                self._cache_bytes += len(data)
+                while self._cache_bytes > self.max_bytes:
+                    _, evicted = self._cache.popitem(last=False)
+                    self._cache_bytes -= len(evicted)
+                    self.evictions += 1
+        return data
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self._cache_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "images": len(self._paths),
+                "cached": len(self._cache),
+                "cached_bytes": self._cache_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0,
+                "transport": self.transport,
+            }
+
+
+class StaticImageHandler(BaseHTTPRequestHandler):
+    """只读静态图片服务：GET/HEAD /<HTTP_ROOTS 名>/<相对路径>，只返回开放目录内的图片"""
+
+    def _resolve(self) -> Optional[Path]:
+        name, _, relative = unquote(urlsplit(self.path).path).lstrip("/").partition("/")
+        root = HTTP_ROOTS.get(name)
+        if root is None or not relative:
+            return None
+        root = root.resolve()
+        file = (root / relative).resolve()
+        # 防止 ../ 或符号链接跳出开放目录
+        if not file.is_relative_to(root) or file.suffix[1:].lower() not in HTTP_EXTS or not file.is_file():
+            return None
+        return file
+
+    def _send_headers(self, file: Path) -> bool:
+        if file is None:
+            self.send_error(404)
+            return False
+        self.send_response(200)
+        self.send_header("Content-Type", mimetypes.guess_type(file.name)[0] or "application/octet-stream")
+        self.send_header("Content-Length", str(file.stat().st_size))
+        self.send_header("Cache-Control", "public, max-age=86400")
+        self.end_headers()
+        return True
+
+    def do_HEAD(self):
+        self._send_headers(self._resolve())
+
+    def do_GET(self):
+        file = self._resolve()
+        if self._send_headers(file):
+            with open(file, "rb") as f:
+                self.wfile.write(f.read())
+
+    def log_message(self, format, *args):
+        # 每张图一行访问日志太吵，只在调试时输出
+        logger.debug(f"图片服务 {self.address_string()} {format % args}")
+
+
+class StaticImageServer:
+    """后台线程运行的静态图片服务器"""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> bool:
+        """启动服务器，端口被占用等失败时返回 False"""
+        try:
+            self._server = ThreadingHTTPServer((self.host, self.port), StaticImageHandler)
+        except OSError as e:
+            logger.error(f"图片服务器启动失败 {self.host}:{self.port}: {e}")
+            return False
+        self._server.daemon_threads = True
+        # 端口为 0 时由系统分配，取实际端口
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="image-http", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+            self._thread = None
+
+
+image_assets = ImageAssetRegistry(config.image_cache_mb * 1024 * 1024,
+                                  transport=config.image_transport, file_root=config.image_file_root)
+image_server = StaticImageServer(config.image_http_host, config.image_http_port)
+for _namespace, _directory, _exts, _by_stem in ASSET_DIRS:
+    image_assets.scan(_namespace, _directory, _exts, by_stem=_by_stem)
+
+
+def _start_server():
+    if image_assets.transport != TRANSPORT_HTTP or not image_server.start():
+        return
+    image_assets.http_base_url = (config.image_http_base_url.rstrip("/")
+                                  or f"http://{image_server.host}:{image_server.port}")
+    logger.info(f"图片服务器已启动 {image_server.host}:{image_server.port}，图片地址 {image_assets.http_base_url}")
+
+
+def _stop_server():
+    image_assets.http_base_url = None
+    image_server.stop()
+
+
+def _log_stats():
+    stats = image_assets.stats()
+    logger.info(f"图片缓存: 命中率 {stats['hit_rate']:.1%} ({stats['hits']}/{stats['hits'] + stats['misses']})，"
+                f"缓存 {stats['cached']} 张 {stats['cached_bytes'] / 1048576:.1f}MB，淘汰 {stats['evictions']} 次")
+
+
+# http 模式随机器人启停静态服务器；关闭时输出缓存命中统计（脱离 NoneBot 单独导入时跳过）
+try:
+    driver = get_driver()
+    driver.on_startup(_start_server)
+    driver.on_shutdown(_stop_server)
+    driver.on_shutdown(_log_stats)
+except ValueError:
+    pass
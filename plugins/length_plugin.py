@@ -20,7 +20,7 @@ from plugins.daily_utils import get_daily_seed
 from plugins.unified_db import unified_db
 
 
-def get_daily_length(user_id: str, group_id: str = "") -> int:
+async def get_daily_length(user_id: str, group_id: str = "") -> int:
     """
     获取今日长度（8点刷新）
     优先从数据库读取，如果没有则生成并存储
@@ -36,8 +36,8 @@ def get_daily_length(user_id: str, group_id: str = "") -> int:
     rng = random.Random(seed)
     length = rng.randint(-30, 30)
     
-    # 存储到数据库
-    unified_db.update_length(group_id, user_id, length)
+    # 存储到数据库（在写线程执行）
+    await unified_db.write(unified_db.update_length, group_id, user_id, length)
     
     return length
 
@@ -112,7 +112,7 @@ async def handle_length_command(bot: Bot, event: Event):
         group_id = str(event.group_id) if isinstance(event, GroupMessageEvent) else ""
 
         # 生成今日固定长度（8点刷新）
-        length = get_daily_length(user_id, group_id)
+        length = await get_daily_length(user_id, group_id)
         reply_text = get_length_reply(length)
 
         # 构建回复消息
@@ -151,7 +151,7 @@ async def handle_length_at(bot: Bot, event: Event):
         # 如果只有@机器人，没有其他内容或者内容是空白的，就回复长度
         if len(message) == 1 and message[0].type == "at":
             # 生成今日固定长度（8点刷新）
-            length = get_daily_length(user_id, group_id)
+            length = await get_daily_length(user_id, group_id)
             reply_text = get_length_reply(length)
 
             # 构建回复消息
@@ -166,7 +166,7 @@ async def handle_length_at(bot: Bot, event: Event):
         # 如果是@机器人 + "今日长度"，也在这里处理，避免命令处理器冲突
         elif text_content.strip() == "今日长度":
             # 生成今日固定长度（8点刷新）
-            length = get_daily_length(user_id, group_id)
+            length = await get_daily_length(user_id, group_id)
             reply_text = get_length_reply(length)
 
             # 构建回复消息
@@ -0,0 +1,89 @@
+"""
+共享 LLM 客户端模块
+进程级复用一个 httpx.AsyncClient（连接池 + keep-alive + HTTP/2），
+生命周期绑定 NoneBot 驱动的 startup/shutdown 钩子
+"""
+
+from typing import Dict, Optional
+
+import httpx
+from nonebot import get_driver
+from nonebot.log import logger
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import config
+
+try:
+    import h2  # noqa: F401  httpx 的 HTTP/2 支持依赖 h2
+    H2_AVAILABLE = True
+except ImportError:
+    H2_AVAILABLE = False
+
+
+class LLMClient:
+    """LLM 请求客户端（全局共享连接池）"""
+
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _build_client(self) -> httpx.AsyncClient:
+        http2 = config.ai_http2 and H2_AVAILABLE
+        if config.ai_http2 and not H2_AVAILABLE:
+            logger.warning("h2未安装，LLM客户端回退到 HTTP/1.1")
+
+        limits = httpx.Limits(
+            max_connections=config.ai_max_connections,
+            max_keepalive_connections=config.ai_max_keepalive_connections,
+            keepalive_expiry=config.ai_keepalive_expiry,
+        )
+        logger.info(
+            f"LLM客户端初始化: http2={http2}, 最大连接={config.ai_max_connections}, "
+            f"keep-alive={config.ai_max_keepalive_connections}"
+        )
+        return httpx.AsyncClient(
+            base_url=config.ai_base_url,
+            headers={
+                "Authorization": f"Bearer {config.ai_api_key}",
+                "Content-Type": "application/json"
+            },
+            limits=limits,
+            http2=http2,
+            timeout=30.0,
+        )
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """获取共享客户端（未启动或已关闭时自动重建）"""
+        if self._client is None or self._client.is_closed:
+            self._client = self._build_client()
+        return self._client
+
+    async def startup(self):
+        """预热连接池"""
+        _ = self.client
+
+    async def shutdown(self):
+        """关闭连接池"""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+            logger.info("LLM客户端已关闭")
+        self._client = None
+
+    async def post_chat(self, payload: Dict, timeout: float = 30.0) -> httpx.Response:
+        """发送 chat/completions 请求，返回原始响应"""
+        return await self.client.post("/chat/completions", json=payload, timeout=timeout)
+
+
+# 全局实例
+llm_client = LLMClient()
+
+
+# 绑定驱动生命周期（脱离 NoneBot 单独导入时跳过）
+try:
+    driver = get_driver()
+    driver.on_startup(llm_client.startup)
+    driver.on_shutdown(llm_client.shutdown)
+except ValueError:
+    logger.warning("NoneBot 未初始化，LLM客户端将按需创建")
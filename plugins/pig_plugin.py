@@ -15,13 +15,13 @@ from nonebot.adapters.onebot.v11 import Bot, Event, Message, MessageSegment, Gro
 from nonebot.log import logger
 
 from plugins.daily_utils import get_daily_seed
+from plugins.image_assets import image_assets, PIG
 
 # Paths
 PLUGIN_DIR = Path(__file__).parent
 PROJECT_ROOT = PLUGIN_DIR.parent
 RESOURCE_DIR = PROJECT_ROOT / "resources" / "pig"
 PIG_INFO_PATH = RESOURCE_DIR / "pig.json"
-IMAGE_DIR = RESOURCE_DIR / "image"
 DATA_DIR = PROJECT_ROOT / "data"
 TODAY_RECORD_PATH = DATA_DIR / "pig_records.json"
 
@@ -44,14 +44,9 @@ PIG_LIST = load_pig_data()
 if not PIG_LIST:
     logger.warning("Pig list is empty! Plugin will not work correctly.")
 
-# Find image file
-def find_image_file(pig_id: str) -> Optional[Path]:
-    exts = ["png", "jpg", "jpeg", "webp", "gif"]
-    for ext in exts:
-        file = IMAGE_DIR / f"{pig_id}.{ext}"
-        if file.exists():
-            return file
-    return None
+# Find image payload (paths indexed at startup, encoded images cached)
+def find_image(pig_id: str) -> Optional[str]:
+    return image_assets.payload(PIG, pig_id)
 
 # Persistence helpers
 def load_records() -> Dict:
@@ -107,16 +102,13 @@ async def send_pig_result(matcher, pig: Dict, prefix: str = ""):
     desc = pig.get("description", "")
     analysis = pig.get("analysis", "")
     
-    img_path = find_image_file(pig_id)
-    
     msg = Message()
-    if img_path:
-        # Read file as bytes to avoid path issues between containers
-        try:
-            img_bytes = img_path.read_bytes()
-            msg.append(MessageSegment.image(img_bytes))
-        except Exception as e:
-            logger.error(f"Failed to read image {img_path}: {e}")
+    if image_assets.path(PIG, pig_id):
+        # 按 config.image_transport 发送（base64 内嵌 / file:// / http URL）
+        img = find_image(pig_id)
+        if img:
+            msg.append(MessageSegment.image(img))
+        else:
             msg.append(MessageSegment.text("[图片读取失败] "))
     else:
         msg.append(MessageSegment.text("[图片走丢了] "))
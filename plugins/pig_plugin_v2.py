@@ -11,6 +11,8 @@ from nonebot import on_command
 from nonebot.adapters.onebot.v11 import Bot, Event, Message, MessageSegment
 from nonebot.log import logger
 
+from plugins.image_assets import image_assets, TRANSPORT_BASE64
+
 # PigHub API
 PIGHUB_API = "https://pighub.top/api/all-images"
 PIGHUB_BASE = "https://pighub.top"
@@ -88,14 +90,17 @@ async def handle_random_pighub(bot: Bot, event: Event):
     title = pig.get("title", "神秘小猪")
     thumbnail = pig.get("thumbnail", "")
     
-    # 下载图片
-    img_bytes = await download_pig_image(thumbnail)
+    # 非 base64 发送方式时直接把远程地址交给 NapCat 下载，否则下载后内嵌发送
+    if thumbnail and image_assets.transport != TRANSPORT_BASE64:
+        image = f"{PIGHUB_BASE}{thumbnail}"
+    else:
+        image = await download_pig_image(thumbnail)
     
     # 构建消息
     msg = Message()
     
-    if img_bytes:
-        msg.append(MessageSegment.image(img_bytes))
+    if image:
+        msg.append(MessageSegment.image(image))
     else:
         msg.append(MessageSegment.text("[图片加载失败] "))
     
@@ -6,13 +6,13 @@
 import re
 import json
 from typing import Dict, List, Optional, Union
-import httpx
 from nonebot.log import logger
 
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config import config
+from plugins.llm_client import llm_client
 
 
 class ProfileAnalyzer:
@@ -21,7 +21,7 @@ class ProfileAnalyzer:
     def __init__(self, db):
         """
         初始化分析器
-        db: UnifiedDatabase 或 ProfileDatabase 实例
+        db: UnifiedDatabase 实例（写入经 db.write 在写线程执行）
         """
         self.db = db
         self.trigger_count = 5  # 从10条改为5条
@@ -92,26 +92,18 @@ class ProfileAnalyzer:
             return None
         
         try:
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                response = await client.post(
-                    f"{config.ai_base_url}/chat/completions",
-                    headers={
-                        "Authorization": f"Bearer {config.ai_api_key}",
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "model": config.ai_model,
-                        "messages": [{"role": "user", "content": prompt}],
-                        "max_tokens": 500,
-                        "temperature": 0.7
-                    }
-                )
-                
-                if response.status_code == 200:
-                    return response.json()["choices"][0]["message"]["content"]
-                else:
-                    logger.error(f"LLM API 调用失败: {response.status_code}")
-                    return None
+            response = await llm_client.post_chat({
+                "model": config.ai_model,
+                "messages": [{"role": "user", "content": prompt}],
+                "max_tokens": 500,
+                "temperature": 0.7
+            }, timeout=60.0)
+            
+            if response.status_code == 200:
+                return response.json()["choices"][0]["message"]["content"]
+            else:
+                logger.error(f"LLM API 调用失败: {response.status_code}")
+                return None
         except Exception as e:
             logger.error(f"LLM API 调用异常: {e}")
             return None
@@ -152,19 +144,24 @@ class ProfileAnalyzer:
         tags = result["tags"]
         new_event = result["new_event"]
         
-        # 更新数据库 - 使用 UnifiedDatabase 的方法
-        self.db.update_profile(group_id, user_id, profile, tags)
-        
-        # 如果有新的重要事件，记录下来
-        if new_event and len(new_event) > 2:
-            self.db.add_memory(group_id, user_id, new_event)
-            logger.info(f"用户 {user_id} 新增记忆: {new_event}")
-        
-        # 清空缓冲
-        self.db.clear_buffer(group_id, user_id)
+        # 更新数据库 - 人设、记忆、清空缓冲在写线程的一个事务里提交
+        await self.db.write(self._save_analysis, group_id, user_id, profile, tags, new_event)
         
         logger.info(f"用户 {user_id} 人设已更新，标签: {tags}")
         return profile
     
+    def _save_analysis(self, group_id: str, user_id: str, profile: str,
+                       tags: List[str], new_event: Optional[str]):
+        with self.db.transaction():
+            self.db.update_profile(group_id, user_id, profile, tags)
+            
+            # 如果有新的重要事件，记录下来
+            if new_event and len(new_event) > 2:
+                self.db.add_memory(group_id, user_id, new_event)
+                logger.info(f"用户 {user_id} 新增记忆: {new_event}")
+            
+            # 清空缓冲
+            self.db.clear_buffer(group_id, user_id)
+    
     def should_analyze(self, message_count: int) -> bool:
         return message_count >= self.trigger_count
@@ -13,6 +13,8 @@ from nonebot import on_command
 from nonebot.adapters.onebot.v11 import Bot, Event, Message, MessageSegment, GroupMessageEvent
 from nonebot.log import logger
 
+from plugins.weighted_sampler import AliasSampler
+
 
 # 子弹类型
 class BulletType:
@@ -23,6 +25,16 @@ class BulletType:
     LUCKY = "lucky"        # 幸运弹🍀 - 反弹给上一个开枪的人
 
 
+# 子弹类型权重（百分比）
+BULLET_WEIGHTS = [
+    (BulletType.NORMAL, 60),   # 60% 普通
+    (BulletType.ROSE, 10),     # 10% 玫瑰弹
+    (BulletType.BLOOM, 15),    # 15% 开花弹
+    (BulletType.BLANK, 10),    # 10% 空包弹
+    (BulletType.LUCKY, 5),     # 5% 幸运弹
+]
+BULLET_SAMPLER = AliasSampler([bt for bt, _ in BULLET_WEIGHTS], [w for _, w in BULLET_WEIGHTS])
+
 # 禁言时长（秒）
 BAN_DURATION = 5 * 60       # 普通：5分钟
 BAN_DURATION_BLOOM = 10 * 60  # 开花弹：10分钟
@@ -53,22 +65,7 @@ class RouletteGame:
         bullet_position = random.randint(1, self.bullets)
         
         # 随机子弹类型（权重）
-        bullet_types = [
-            (BulletType.NORMAL, 60),   # 60% 普通
-            (BulletType.ROSE, 10),     # 10% 玫瑰弹
-            (BulletType.BLOOM, 15),    # 15% 开花弹
-            (BulletType.BLANK, 10),    # 10% 空包弹
-            (BulletType.LUCKY, 5),     # 5% 幸运弹
-        ]
-        total = sum(w for _, w in bullet_types)
-        rand = random.randint(1, total)
-        current = 0
-        bullet_type = BulletType.NORMAL
-        for bt, weight in bullet_types:
-            current += weight
-            if rand <= current:
-                bullet_type = bt
-                break
+        bullet_type = BULLET_SAMPLER.sample()
         
         self.games[group_id] = {
             "current_position": 1,
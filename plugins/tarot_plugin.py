@@ -14,6 +14,7 @@ from nonebot.adapters.onebot.v11 import Bot, Event, Message, MessageSegment, Gro
 from nonebot.log import logger
 
 from plugins.daily_utils import get_daily_seed
+from plugins.image_assets import image_assets
 
 
 # 图片目录
@@ -223,11 +224,9 @@ async def handle_tarot(bot: Bot, event: Event):
         
         # 添加图片
         if image_path and image_path.exists():
-            try:
-                img_bytes = image_path.read_bytes()
-                msg.append(MessageSegment.image(img_bytes))
-            except Exception as e:
-                logger.error(f"读取塔罗图片失败: {e}")
+            image = image_assets.file_payload(image_path)
+            if image:
+                msg.append(MessageSegment.image(image))
         
         # 构建文案
         text_lines = [
@@ -8,6 +8,7 @@ from nonebot.adapters.onebot.v11 import Bot, Event, Message, MessageSegment, Gro
 from nonebot.log import logger
 
 from plugins.title_service import title_service
+from plugins.unified_db import unified_db
 
 
 # 注册命令
@@ -45,7 +46,7 @@ async def handle_title(bot: Bot, event: Event):
             ]))
         elif args == "无" or args == "清除":
             # 清除头衔
-            success, message = title_service.set_title(group_id, user_id, "")
+            success, message = await unified_db.write(title_service.set_title, group_id, user_id, "")
             if success:
                 await title_service.set_qq_title(bot, group_id, user_id, "")
             await title_cmd.finish(Message([
@@ -58,7 +59,7 @@ async def handle_title(bot: Bot, event: Event):
             await title_cmd.finish(message)
         else:
             # 切换头衔
-            success, message = title_service.set_title(group_id, user_id, args)
+            success, message = await unified_db.write(title_service.set_title, group_id, user_id, args)
             if success:
                 await title_service.set_qq_title(bot, group_id, user_id, args)
             await title_cmd.finish(Message([
@@ -5,13 +5,46 @@
 
 import sqlite3
 import threading
+import queue
+import time
+import asyncio
 import json
+import heapq
+import itertools
+from bisect import bisect_left, insort
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple, Any
-from datetime import datetime, date
-from dataclasses import dataclass, asdict
+from typing import Callable, Dict, List, Optional, Tuple, Any
+from datetime import datetime, date, timezone
+from dataclasses import dataclass, asdict, replace
+from nonebot import get_driver
 from nonebot.log import logger
 
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import config
+from plugins.db_migrations import run_migrations, CONVERSATION_CAPACITY, MEMORY_CAPACITY
+
+
+# SQLite 连接参数配置（连接创建时逐条执行 PRAGMA）
+PRAGMA_PROFILES: Dict[str, Dict[str, Any]] = {
+    # SQLite 默认：rollback journal + synchronous=FULL，每次提交完整 fsync
+    "default": {},
+    # 性能优先：WAL + synchronous=NORMAL，提交只写 WAL，由检查点批量回写主库
+    "performance": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -16000,            # 约 16MB 页缓存（负数单位为 KB）
+        "mmap_size": 268435456,          # 256MB 内存映射读
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,            # 写锁等待 5 秒
+        "journal_size_limit": 67108864,  # 检查点后 WAL 文件截断到 64MB 以内
+    },
+}
+
 
 @dataclass
 class UserData:
@@ -38,6 +71,7 @@ class UserData:
     profile: str = ""
     tags: List[str] = None
     message_count: int = 0
+    buffer_count: int = 0       # 待人设分析的缓冲消息数
     
     def __post_init__(self):
         if self.unlocked_titles is None:
@@ -56,155 +90,680 @@ class FishRecord:
     is_new: bool = False
     is_record: bool = False
 
+class UserCache:
+    """
+    UserData 的 LRU 缓存（线程安全）
+    缓存的是数据库原值（未做每日重置），读取时由调用方复制并重置
+    """
+    
+    def __init__(self, capacity: int = 4096):
+        self.capacity = capacity
+        self._data: "OrderedDict[Tuple[str, str], UserData]" = OrderedDict()
+        self._lock = threading.Lock()
+        # 每次写入/失效都会递增，读库回填时据此丢弃可能过期的结果
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    @property
+    def generation(self) -> int:
+        return self._generation
+    
+    @staticmethod
+    def _copy(user: UserData) -> UserData:
+        return replace(user, unlocked_titles=list(user.unlocked_titles), tags=list(user.tags))
+    
+    def get(self, key: Tuple[str, str]) -> Optional[UserData]:
+        with self._lock:
+            user = self._data.get(key)
+            if user is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return self._copy(user)
+    
+    def put(self, key: Tuple[str, str], user: UserData, generation: int):
+        """回填缓存；期间发生过写入则放弃回填"""
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._data[key] = self._copy(user)
+            self._data.move_to_end(key)
+            while len(self._data) > self.capacity:
+                self._data.popitem(last=False)
+                self.evictions += 1
+    
+    def update(self, key: Tuple[str, str], **fields):
+        """写穿：更新已缓存对象的字段"""
+        with self._lock:
+            self._generation += 1
+            user = self._data.get(key)
+            if user is not None:
+                for name, value in fields.items():
+                    setattr(user, name, value)
+    
+    def invalidate(self, key: Tuple[str, str]):
+        with self._lock:
+            self._generation += 1
+            self._data.pop(key, None)
+    
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._data.clear()
+    
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+# 排行榜类型
+BOARD_TODAY_MERIT = "today_merit"
+BOARD_TOTAL_MERIT = "total_merit"
+BOARD_FISH_COUNT = "fish_count"
+BOARD_COLLECTION = "collection_count"
+# 只统计分数大于 0 的排行榜
+POSITIVE_BOARDS = (BOARD_FISH_COUNT, BOARD_COLLECTION)
+
+
+class SortedBoard:
+    """单个排行榜：user_id -> 分数，并维护按分数降序的有序列表"""
+    
+    def __init__(self):
+        self.scores: Dict[str, int] = {}
+        self._order: List[Tuple[int, str]] = []   # (-分数, user_id)
+    
+    def set(self, user_id: str, score: int):
+        old = self.scores.get(user_id)
+        if old == score:
+            return
+        if old is not None:
+            del self._order[bisect_left(self._order, (-old, user_id))]
+        self.scores[user_id] = score
+        insort(self._order, (-score, user_id))
+    
+    def top(self, limit: int, positive_only: bool = False) -> List[Tuple[str, int]]:
+        result = []
+        for neg_score, user_id in self._order[:limit]:
+            if positive_only and neg_score >= 0:
+                break
+            result.append((user_id, -neg_score))
+        return result
+
+
+class _GroupBoards:
+    """一个群的全部排行榜"""
+    __slots__ = ("boards", "nicknames", "today")
+    
+    def __init__(self):
+        self.boards = {name: SortedBoard() for name in
+                       (BOARD_TODAY_MERIT, BOARD_TOTAL_MERIT, BOARD_FISH_COUNT, BOARD_COLLECTION)}
+        self.nicknames: Dict[str, str] = {}
+        # 今日功德榜对应的日期，跨日后整榜作废
+        self.today = date.today().isoformat()
+
+
+class LeaderboardStore:
+    """
+    内存排行榜（线程安全）
+    首次查询某群时从数据库整体加载，之后由写操作在提交后增量更新；
+    更新一律写入绝对值（来自 RETURNING/COUNT），重复应用不会累计出错
+    """
+    
+    def __init__(self, loader: Callable[[str], Tuple[list, list]]):
+        # loader(group_id) -> (user_data 行, [(user_id, 图鉴数)])
+        self._loader = loader
+        self._groups: Dict[str, _GroupBoards] = {}
+        self._lock = threading.RLock()
+    
+    def _load(self, group_id: str) -> _GroupBoards:
+        group = self._groups.get(group_id)
+        if group is not None:
+            return group
+        
+        group = _GroupBoards()
+        users, collections = self._loader(group_id)
+        for row in users:
+            user_id = row["user_id"]
+            group.nicknames[user_id] = row["nickname"] or ""
+            group.boards[BOARD_TOTAL_MERIT].set(user_id, row["total_merit"])
+            group.boards[BOARD_FISH_COUNT].set(user_id, row["fish_count"])
+            if row["today_date"] == group.today:
+                group.boards[BOARD_TODAY_MERIT].set(user_id, row["today_merit"])
+        for user_id, count in collections:
+            group.boards[BOARD_COLLECTION].set(user_id, count)
+        self._groups[group_id] = group
+        return group
+    
+    def set_score(self, group_id: str, board: str, user_id: str, score: int,
+                  nickname: Optional[str] = None, day: Optional[str] = None):
+        """更新分数；未加载的群忽略（加载时会从数据库读到最新值）"""
+        with self._lock:
+            group = self._groups.get(group_id)
+            if group is None:
+                return
+            if nickname is not None:
+                group.nicknames[user_id] = nickname
+            if board == BOARD_TODAY_MERIT and day != group.today:
+                group.boards[BOARD_TODAY_MERIT] = SortedBoard()
+                group.today = day
+            group.boards[board].set(user_id, score)
+    
+    def add_user(self, group_id: str, user_id: str, nickname: str = ""):
+        """
+        登记新建的用户：总功德榜、钓鱼榜补 0 分（与从数据库加载时一致）；
+        已在榜上的用户不变，未加载的群忽略
+        """
+        with self._lock:
+            group = self._groups.get(group_id)
+            if group is None:
+                return
+            group.nicknames.setdefault(user_id, nickname)
+            for board in (BOARD_TOTAL_MERIT, BOARD_FISH_COUNT):
+                if user_id not in group.boards[board].scores:
+                    group.boards[board].set(user_id, 0)
+    
+    def set_nickname(self, group_id: str, user_id: str, nickname: str):
+        with self._lock:
+            group = self._groups.get(group_id)
+            if group is not None and user_id in group.nicknames:
+                group.nicknames[user_id] = nickname
+    
+    def top(self, group_id: str, board: str, limit: int = 10) -> List[Dict]:
+        """返回前 limit 名 [{"nickname", "user_id", "score"}]"""
+        with self._lock:
+            group = self._load(group_id)
+            if board == BOARD_TODAY_MERIT and group.today != date.today().isoformat():
+                return []
+            entries = group.boards[board].top(limit, positive_only=board in POSITIVE_BOARDS)
+            return [{"nickname": group.nicknames.get(user_id, ""), "user_id": user_id, "score": score}
+                    for user_id, score in entries]
+    
+    def clear(self):
+        with self._lock:
+            self._groups.clear()
+    
+    def rebuild(self, group_ids: List[str]):
+        """丢弃现有排行榜并从数据库重新加载指定群"""
+        with self._lock:
+            self._groups.clear()
+            for group_id in group_ids:
+                self._load(group_id)
+
+
+class RecentLog:
+    """
+    按用户的定长环形日志（对话历史、用户记忆）
+    数据库中每个用户固定 capacity 个槽位，追加时按 seq % capacity 覆盖最旧的一条；
+    内存里按用户缓存最近记录的 deque，读取不走数据库
+    """
+    
+    def __init__(self, db: "UnifiedDatabase", table: str, fields: Tuple[str, ...],
+                 capacity: int, max_users: int = 4096):
+        self.db = db
+        self.table = table
+        self.fields = fields
+        self.capacity = capacity
+        self.max_users = max_users
+        # (group_id, user_id) -> deque[(seq, {字段: 值})]，按 seq 升序
+        self._logs: "OrderedDict[Tuple[str, str], deque]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+    
+    def append(self, group_id: str, user_id: str, **values):
+        """追加一条记录（需在写事务内调用，提交后同步到内存）"""
+        values["timestamp"] = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        columns = ", ".join(values)
+        updates = ", ".join(f"{c} = excluded.{c}" for c in values)
+        
+        # 单条语句内取下一个 seq 并写入对应槽位，多线程并发追加也不会撞号
+        cursor = self.db._conn.cursor()
+        cursor.execute(f"""
+            INSERT INTO {self.table} (group_id, user_id, slot, seq, {columns})
+            SELECT ?, ?, n.seq % {self.capacity}, n.seq, {", ".join("?" * len(values))}
+            FROM (SELECT COALESCE(MAX(seq), -1) + 1 AS seq FROM {self.table}
+                  WHERE group_id = ? AND user_id = ?) AS n
+            WHERE true
+            ON CONFLICT(group_id, user_id, slot) DO UPDATE SET seq = excluded.seq, {updates}
+            RETURNING seq
+        """, (group_id, user_id, *values.values(), group_id, user_id))
+        seq = cursor.fetchone()[0]
+        item = {f: values[f] for f in self.fields}
+        
+        key = (group_id, user_id)
+        self.db._after_commit(lambda: self._push(key, seq, item))
+    
+    def _push(self, key: Tuple[str, str], seq: int, item: Dict):
+        with self._lock:
+            self._generation += 1
+            log = self._logs.get(key)
+            if log is None:
+                return
+            if not log or seq > log[-1][0]:
+                log.append((seq, item))
+            elif all(s != seq for s, _ in log):
+                # 并发写入的回调乱序到达，丢弃该用户的内存日志，下次读取时重新加载
+                del self._logs[key]
+    
+    def recent(self, group_id: str, user_id: str) -> List[Dict]:
+        """按时间顺序（旧 -> 新）返回该用户的全部记录"""
+        key = (group_id, user_id)
+        with self._lock:
+            log = self._logs.get(key)
+            if log is not None:
+                self._logs.move_to_end(key)
+                return [dict(item) for _, item in log]
+            generation = self._generation
+        
+        cursor = self.db._conn.cursor()
+        cursor.execute(f"""
+            SELECT seq, {", ".join(self.fields)} FROM {self.table}
+            WHERE group_id = ? AND user_id = ?
+        """, (group_id, user_id))
+        rows = sorted(cursor.fetchall(), key=lambda r: r["seq"])
+        log = deque(((r["seq"], {f: r[f] for f in self.fields}) for r in rows), maxlen=self.capacity)
+        
+        with self._lock:
+            # 读库期间有新写入则不回填，下次再读
+            if generation == self._generation:
+                self._logs[key] = log
+                while len(self._logs) > self.max_users:
+                    self._logs.popitem(last=False)
+        return [dict(item) for _, item in log]
+    
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._logs.clear()
+
+
+class ActiveEventIndex:
+    """
+    各群活跃全局事件的内存索引（线程安全）
+    每群一个按过期时间排序的小顶堆，查询时惰性弹出已过期事件；
+    每次新增或过期都会给该群换一个新版本号（进程内全局唯一），供上层缓存据此失效
+    """
+    
+    _version_counter = itertools.count(1)
+    
+    def __init__(self, loader: Callable[[str], list]):
+        # loader(group_id) -> 未过期事件行 (id, event_type, expire_time, triggered_by)
+        self._loader = loader
+        # group_id -> [(过期时间戳, 事件ID, 事件类型, 过期时间字符串, 触发者)]
+        self._heaps: Dict[str, List[Tuple[float, int, str, str, str]]] = {}
+        self._ids: Dict[str, set] = {}
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.RLock()
+    
+    @staticmethod
+    def _timestamp(expire_time: str) -> float:
+        return datetime.strptime(expire_time, "%Y-%m-%d %H:%M:%S").timestamp()
+    
+    def _heap(self, group_id: str) -> List[Tuple[float, int, str, str, str]]:
+        """取群的事件堆（首次访问从数据库加载），并弹出已过期事件"""
+        heap = self._heaps.get(group_id)
+        if heap is None:
+            heap, ids = [], set()
+            for row in self._loader(group_id):
+                heap.append((self._timestamp(row["expire_time"]), row["id"], row["event_type"],
+                             row["expire_time"], row["triggered_by"]))
+                ids.add(row["id"])
+            heapq.heapify(heap)
+            self._heaps[group_id] = heap
+            self._ids[group_id] = ids
+            self._versions[group_id] = next(self._version_counter)
+        
+        now = time.time()
+        while heap and heap[0][0] <= now:
+            _, event_id, *_ = heapq.heappop(heap)
+            self._ids[group_id].discard(event_id)
+            self._versions[group_id] = next(self._version_counter)
+        return heap
+    
+    def add(self, group_id: str, event_id: int, event_type: str, expire_time: str, triggered_by: str):
+        """新增事件；未加载的群忽略（加载时会从数据库读到）"""
+        with self._lock:
+            heap = self._heaps.get(group_id)
+            if heap is None or event_id in self._ids[group_id]:
+                return
+            heapq.heappush(heap, (self._timestamp(expire_time), event_id, event_type,
+                                  expire_time, triggered_by))
+            self._ids[group_id].add(event_id)
+            self._versions[group_id] = next(self._version_counter)
+    
+    def version(self, group_id: str) -> int:
+        with self._lock:
+            self._heap(group_id)
+            return self._versions[group_id]
+    
+    def events(self, group_id: str) -> List[Dict]:
+        with self._lock:
+            return [{"event_type": e[2], "expire_time": e[3], "triggered_by": e[4]}
+                    for e in sorted(self._heap(group_id))]
+    
+    def is_active(self, group_id: str, event_type: str) -> bool:
+        with self._lock:
+            return any(e[2] == event_type for e in self._heap(group_id))
+
+
+class _WriteOp:
+    """写入队列中的一次写操作"""
+    __slots__ = ("func", "args", "kwargs", "key", "futures")
+    
+    def __init__(self, func: Callable, args: tuple, kwargs: dict, key: Optional[tuple], future: Future):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.key = key
+        self.futures = [future]
+
+
+class WriteBehindQueue:
+    """
+    异步写入队列
+    专用写线程从队列取出写操作，在同一事务中批量执行后统一提交，
+    避免事件循环阻塞在 commit/fsync 上
+    """
+    
+    def __init__(self, db: "UnifiedDatabase", batch_interval: float = 0.01, max_batch: int = 256):
+        self.db = db
+        self.batch_interval = batch_interval
+        self.max_batch = max_batch
+        self._queue: "queue.Queue[Optional[_WriteOp]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+    
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="unified-db-writer", daemon=True)
+                self._thread.start()
+    
+    def submit(self, func: Callable, *args, coalesce_key: Optional[tuple] = None, **kwargs) -> Future:
+        """
+        提交写操作，返回 concurrent.futures.Future
+        coalesce_key 相同的操作在同一批次内只执行最后一次（适用于覆盖写，如更新昵称）
+        """
+        future = Future()
+        self._ensure_started()
+        self._queue.put(_WriteOp(func, args, kwargs, coalesce_key, future))
+        return future
+    
+    def _run(self):
+        while True:
+            op = self._queue.get()
+            if op is None:
+                return
+            
+            batch = [op]
+            stop = False
+            deadline = time.monotonic() + self.batch_interval
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    op = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if op is None:
+                    stop = True
+                    break
+                batch.append(op)
+            
+            self._execute_batch(self._coalesce(batch))
+            if stop:
+                return
+    
+    @staticmethod
+    def _coalesce(batch: List[_WriteOp]) -> List[_WriteOp]:
+        """合并同一批次内 coalesce_key 相同的操作"""
+        merged: List[_WriteOp] = []
+        by_key: Dict[tuple, _WriteOp] = {}
+        for op in batch:
+            if op.key is None:
+                merged.append(op)
+                continue
+            earlier = by_key.get(op.key)
+            if earlier is None:
+                by_key[op.key] = op
+                merged.append(op)
+            else:
+                earlier.func, earlier.args, earlier.kwargs = op.func, op.args, op.kwargs
+                earlier.futures.extend(op.futures)
+        return merged
+    
+    def _execute_batch(self, batch: List[_WriteOp]):
+        conn = self.db._conn
+        results = []
+        committed = False
+        self.db._local.defer_commit = True
+        self.db._local.after_commit = []
+        self.db._local.after_rollback = []
+        try:
+            if not conn.in_transaction:
+                # 立即拿写锁：延迟事务先读后写时，遇到其他连接写入会直接 SQLITE_BUSY 而不等待
+                conn.execute("BEGIN IMMEDIATE")
+            for op in batch:
+                # 每个操作一个保存点，单个失败不影响同批次其他操作；
+                # 回滚时一并丢弃该操作注册的提交后回调，其余操作的回调照常执行
+                hook_count = len(self.db._local.after_commit)
+                rollback_count = len(self.db._local.after_rollback)
+                conn.execute("SAVEPOINT write_op")
+                try:
+                    results.append((True, op.func(*op.args, **op.kwargs)))
+                    conn.execute("RELEASE write_op")
+                except Exception as e:
+                    conn.execute("ROLLBACK TO write_op")
+                    conn.execute("RELEASE write_op")
+                    del self.db._local.after_commit[hook_count:]
+                    self.db._run_rollback_hooks(rollback_count)
+                    logger.error(f"批量写入操作失败 {getattr(op.func, '__name__', op.func)}: {e}")
+                    results.append((False, e))
+            conn.commit()
+            committed = True
+        except Exception as e:
+            logger.error(f"批量写入提交失败: {e}")
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            results = [(False, e)] * len(batch)
+            self.db._run_rollback_hooks(0)
+        finally:
+            self.db._local.defer_commit = False
+            hooks, self.db._local.after_commit = self.db._local.after_commit, []
+            self.db._local.after_rollback = []
+        
+        # 提交成功后才写穿缓存/索引；整批提交失败时回调全部作废
+        if committed:
+            for hook in hooks:
+                hook()
+        else:
+            self.db.user_cache.clear()
+        
+        for op, (ok, value) in zip(batch, results):
+            for future in op.futures:
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+    
+    def close(self, timeout: float = 5.0):
+        """刷新队列中剩余的写操作并停止写线程"""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._queue.put(None)
+        self._thread.join(timeout)
+
 
 class UnifiedDatabase:
     """统一用户数据库管理器"""
     
-    def __init__(self, db_path: str = "data/unified_data.db"):
+    def __init__(self, db_path: str = "data/unified_data.db", write_batch_interval: float = 0.01,
+                 pragma_profile: Optional[str] = None, user_cache_size: Optional[int] = None):
         self.db_path = db_path
+        self.user_cache = UserCache(user_cache_size or config.db_user_cache_size)
+        self.leaderboards = LeaderboardStore(self._load_group_boards)
+        self.active_events = ActiveEventIndex(self._load_active_events)
+        self.conversations = RecentLog(self, "conversation_history", ("role", "content"),
+                                       CONVERSATION_CAPACITY, max_users=self.user_cache.capacity)
+        self.memories = RecentLog(self, "user_memories", ("event", "timestamp"),
+                                  MEMORY_CAPACITY, max_users=self.user_cache.capacity)
+        self.pragma_profile = pragma_profile or config.db_pragma_profile
+        if self.pragma_profile not in PRAGMA_PROFILES:
+            logger.warning(f"未知的数据库配置 {self.pragma_profile}，使用 default")
+            self.pragma_profile = "default"
         self._local = threading.local()
         Path(db_path).parent.mkdir(parents=True, exist_ok=True)
-        self._init_tables()
-        logger.info(f"UnifiedDatabase 初始化完成: {db_path}")
+        run_migrations(db_path)
+        self.writer = WriteBehindQueue(self, batch_interval=write_batch_interval)
+        logger.info(f"UnifiedDatabase 初始化完成: {db_path} (profile={self.pragma_profile})")
     
     @property
     def _conn(self) -> sqlite3.Connection:
         if not hasattr(self._local, 'conn') or self._local.conn is None:
-            self._local.conn = sqlite3.connect(self.db_path)
-            self._local.conn.row_factory = sqlite3.Row
+            conn = sqlite3.connect(self.db_path)
+            conn.row_factory = sqlite3.Row
+            for name, value in PRAGMA_PROFILES[self.pragma_profile].items():
+                conn.execute(f"PRAGMA {name} = {value}")
+            self._local.conn = conn
         return self._local.conn
     
-    def _init_tables(self):
-        cursor = self._conn.cursor()
-        
-        # 统一用户数据表
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS user_data (
-                group_id TEXT NOT NULL,
-                user_id TEXT NOT NULL,
-                nickname TEXT DEFAULT '',
-                -- 功德相关
-                total_merit INTEGER DEFAULT 0,
-                today_merit INTEGER DEFAULT 0,
-                today_date TEXT DEFAULT '',
-                knock_count INTEGER DEFAULT 0,
-                -- 长度相关
-                today_length INTEGER,
-                length_date TEXT DEFAULT '',
-                -- 钓鱼相关
-                fish_count INTEGER DEFAULT 0,
-                bait_count INTEGER DEFAULT 0,
-                bait_date TEXT DEFAULT '',
-                -- 头衔相关
-                unlocked_titles TEXT DEFAULT '[]',
-                current_title TEXT DEFAULT '',
-                -- 人设相关
-                profile TEXT DEFAULT '',
-                tags TEXT DEFAULT '[]',
-                message_count INTEGER DEFAULT 0,
-                -- 时间戳
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                PRIMARY KEY (group_id, user_id)
-            )
-        """)
-        
-        # 鱼类图鉴表
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS fish_collection (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                group_id TEXT NOT NULL,
-                user_id TEXT NOT NULL,
-                fish_id TEXT NOT NULL,
-                max_length REAL DEFAULT 0,
-                catch_count INTEGER DEFAULT 1,
-                first_catch DATETIME DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(group_id, user_id, fish_id)
-            )
-        """)
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_fish_collection 
-            ON fish_collection(group_id, user_id)
-        """)
-        
-        # 全局事件表
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS global_events (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                group_id TEXT NOT NULL,
-                event_type TEXT NOT NULL,
-                expire_time DATETIME NOT NULL,
-                triggered_by TEXT,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_global_events 
-            ON global_events(group_id, expire_time)
-        """)
+    def _commit(self):
+        """提交事务（在写线程批次或 transaction() 内由外层统一提交）"""
+        if not self._in_transaction():
+            self._conn.commit()
+    
+    def _after_commit(self, hook: Callable[[], None]):
+        """注册提交后的回调（批次/事务内延迟到提交后执行）"""
+        if self._in_transaction():
+            self._local.after_commit.append(hook)
+        else:
+            hook()
+    
+    def _after_rollback(self, hook: Callable[[], None]):
+        """注册回滚后的回调，用于撤销已提前生效的内存修改（不在批次/事务内时立即提交，无需注册）"""
+        if self._in_transaction():
+            self._local.after_rollback.append(hook)
+    
+    def _run_rollback_hooks(self, start: int):
+        """按注册的相反顺序执行并移除 start 之后注册的回滚回调"""
+        hooks = self._local.after_rollback[start:]
+        del self._local.after_rollback[start:]
+        for hook in reversed(hooks):
+            try:
+                hook()
+            except Exception as e:
+                logger.error(f"回滚回调执行失败: {e}")
+    
+    def _in_transaction(self) -> bool:
+        """当前线程是否处在写线程批次或 transaction() 中"""
+        return getattr(self._local, "defer_commit", False)
+    
+    @contextmanager
+    def transaction(self):
+        """
+        工作单元：块内的写操作合并成一个事务（BEGIN IMMEDIATE ... COMMIT），只提交一次；
+        缓存/排行榜写穿延迟到提交之后，块内抛异常则整体回滚
+        已在事务内（写线程批次或外层 transaction）时直接并入外层
+        例: with unified_db.transaction():
+                unified_db.update_merit(...)
+                unified_db.add_fish_record(...)
+        """
+        if self._in_transaction():
+            yield
+            return
         
-        # 对话历史表（从 profile_db 迁移）
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS conversation_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                group_id TEXT NOT NULL,
-                user_id TEXT NOT NULL,
-                role TEXT NOT NULL,
-                content TEXT NOT NULL,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_conv_history 
-            ON conversation_history(group_id, user_id)
-        """)
+        conn = self._conn
+        self._local.defer_commit = True
+        self._local.after_commit = []
+        self._local.after_rollback = []
+        try:
+            if not conn.in_transaction:
+                conn.execute("BEGIN IMMEDIATE")
+            yield
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            # 块内读库时可能回填了未提交的数据
+            self.user_cache.clear()
+            self._run_rollback_hooks(0)
+            raise
+        finally:
+            self._local.defer_commit = False
+            hooks, self._local.after_commit = self._local.after_commit, []
+            self._local.after_rollback = []
         
-        # 消息缓冲表（用于人设分析）
+        for hook in hooks:
+            hook()
+    
+    def _cache_update(self, group_id: str, user_id: str, **fields):
+        """写穿用户缓存（提交后生效）"""
+        key = (group_id, user_id)
+        self._after_commit(lambda: self.user_cache.update(key, **fields))
+    
+    def _board_update(self, group_id: str, board: str, user_id: str, score: int, **kwargs):
+        """更新内存排行榜（提交后生效）"""
+        self._after_commit(lambda: self.leaderboards.set_score(group_id, board, user_id, score, **kwargs))
+    
+    def _board_add_user(self, group_id: str, user_id: str, nickname: str = ""):
+        """可能新建了用户行的写操作调用，把用户登记到内存排行榜（提交后生效）"""
+        self._after_commit(lambda: self.leaderboards.add_user(group_id, user_id, nickname))
+    
+    def _load_group_boards(self, group_id: str) -> Tuple[list, list]:
+        """读取一个群的排行榜原始数据"""
+        cursor = self._conn.cursor()
         cursor.execute("""
-            CREATE TABLE IF NOT EXISTS message_buffer (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                group_id TEXT NOT NULL,
-                user_id TEXT NOT NULL,
-                content TEXT NOT NULL,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # 用户记忆表
+            SELECT user_id, nickname, total_merit, today_merit, today_date, fish_count
+            FROM user_data WHERE group_id = ?
+        """, (group_id,))
+        users = cursor.fetchall()
         cursor.execute("""
-            CREATE TABLE IF NOT EXISTS user_memories (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                group_id TEXT NOT NULL,
-                user_id TEXT NOT NULL,
-                event TEXT NOT NULL,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        self._conn.commit()
-
-    # ========== 用户数据操作 ==========
-    
-    def _check_daily_reset(self, row: sqlite3.Row) -> Tuple[int, int, int]:
-        """检查是否需要每日重置，返回 (today_merit, bait_count, today_length)"""
-        today = date.today().isoformat()
-        today_merit = row["today_merit"] if row["today_date"] == today else 0
-        bait_count = row["bait_count"] if row["bait_date"] == today else 0
-        today_length = row["today_length"] if row["length_date"] == today else None
-        return today_merit, bait_count, today_length
+            SELECT user_id, COUNT(*) FROM fish_collection
+            WHERE group_id = ? GROUP BY user_id
+        """, (group_id,))
+        return users, [(r[0], r[1]) for r in cursor.fetchall()]
     
-    def get_user(self, group_id: str, user_id: str) -> Optional[UserData]:
-        """获取用户完整数据"""
+    def rebuild_leaderboards(self):
+        """从数据库重建全部群的内存排行榜"""
         cursor = self._conn.cursor()
-        cursor.execute("SELECT * FROM user_data WHERE group_id = ? AND user_id = ?", 
-                       (group_id, user_id))
-        row = cursor.fetchone()
-        
-        if not row:
-            return None
-        
-        today_merit, bait_count, today_length = self._check_daily_reset(row)
-        
+        cursor.execute("SELECT DISTINCT group_id FROM user_data")
+        group_ids = [r[0] for r in cursor.fetchall()]
+        self.leaderboards.rebuild(group_ids)
+        logger.info(f"排行榜已重建: {len(group_ids)} 个群")
+    
+    # ========== 异步写入 ==========
+    
+    def submit(self, func: Callable, *args, coalesce_key: Optional[tuple] = None, **kwargs) -> Future:
+        """
+        将写操作交给写线程执行，不等待结果
+        例: db.submit(db.update_nickname, group_id, user_id, nickname,
+                      coalesce_key=("nickname", group_id, user_id))
+        """
+        return self.writer.submit(func, *args, coalesce_key=coalesce_key, **kwargs)
+    
+    async def write(self, func: Callable, *args, coalesce_key: Optional[tuple] = None, **kwargs) -> Any:
+        """将写操作交给写线程执行，并等待提交后的返回值"""
+        return await asyncio.wrap_future(self.submit(func, *args, coalesce_key=coalesce_key, **kwargs))
+    
+    # ========== 用户数据操作 ==========
+    
+    def _row_to_user(self, row: sqlite3.Row) -> UserData:
+        """数据库行转换为 UserData（保留原值，不做每日重置）"""
         try:
             unlocked_titles = json.loads(row["unlocked_titles"] or "[]")
         except:
@@ -220,62 +779,61 @@ class UnifiedDatabase:
             user_id=row["user_id"],
             nickname=row["nickname"] or "",
             total_merit=row["total_merit"],
-            today_merit=today_merit,
+            today_merit=row["today_merit"],
             today_date=row["today_date"],
             knock_count=row["knock_count"],
-            today_length=today_length,
+            today_length=row["today_length"],
             length_date=row["length_date"],
             fish_count=row["fish_count"],
-            bait_count=bait_count,
+            bait_count=row["bait_count"],
             bait_date=row["bait_date"],
             unlocked_titles=unlocked_titles,
             current_title=row["current_title"] or "",
             profile=row["profile"] or "",
             tags=tags,
-            message_count=row["message_count"]
+            message_count=row["message_count"],
+            buffer_count=row["buffer_count"]
         )
     
+    def _apply_daily_reset(self, user: UserData) -> UserData:
+        """检查是否需要每日重置（今日功德、打窝次数、今日长度）"""
+        today = date.today().isoformat()
+        if user.today_date != today:
+            user.today_merit = 0
+        if user.bait_date != today:
+            user.bait_count = 0
+        if user.length_date != today:
+            user.today_length = None
+        return user
+    
+    def get_user(self, group_id: str, user_id: str) -> Optional[UserData]:
+        """获取用户完整数据（优先读缓存）"""
+        key = (group_id, user_id)
+        # 事务内缓存写穿要等提交后才生效，直接读库才能读到本事务的写入，也不回填未提交的数据
+        in_transaction = self._in_transaction()
+        user = None if in_transaction else self.user_cache.get(key)
+        
+        if user is None:
+            generation = self.user_cache.generation
+            cursor = self._conn.cursor()
+            cursor.execute("SELECT * FROM user_data WHERE group_id = ? AND user_id = ?", 
+                           (group_id, user_id))
+            row = cursor.fetchone()
+            
+            if not row:
+                return None
+            
+            user = self._row_to_user(row)
+            if not in_transaction:
+                self.user_cache.put(key, user, generation)
+        
+        return self._apply_daily_reset(user)
+    
     def get_all_users_in_group(self, group_id: str) -> List[UserData]:
         """获取群内所有用户数据"""
         cursor = self._conn.cursor()
         cursor.execute("SELECT * FROM user_data WHERE group_id = ?", (group_id,))
-        rows = cursor.fetchall()
-        
-        users = []
-        for row in rows:
-            today_merit, bait_count, today_length = self._check_daily_reset(row)
-            
-            try:
-                unlocked_titles = json.loads(row["unlocked_titles"] or "[]")
-            except:
-                unlocked_titles = []
-            
-            try:
-                tags = json.loads(row["tags"] or "[]")
-            except:
-                tags = []
-            
-            users.append(UserData(
-                group_id=row["group_id"],
-                user_id=row["user_id"],
-                nickname=row["nickname"] or "",
-                total_merit=row["total_merit"],
-                today_merit=today_merit,
-                today_date=row["today_date"],
-                knock_count=row["knock_count"],
-                today_length=today_length,
-                length_date=row["length_date"],
-                fish_count=row["fish_count"],
-                bait_count=bait_count,
-                bait_date=row["bait_date"],
-                unlocked_titles=unlocked_titles,
-                current_title=row["current_title"] or "",
-                profile=row["profile"] or "",
-                tags=tags,
-                message_count=row["message_count"]
-            ))
-        
-        return users
+        return [self._apply_daily_reset(self._row_to_user(row)) for row in cursor.fetchall()]
     
     def get_or_create_user(self, group_id: str, user_id: str, nickname: str = "") -> UserData:
         """获取或创建用户数据"""
@@ -292,7 +850,9 @@ class UnifiedDatabase:
             INSERT INTO user_data (group_id, user_id, nickname)
             VALUES (?, ?, ?)
         """, (group_id, user_id, nickname))
-        self._conn.commit()
+        self._commit()
+        self._cache_update(group_id, user_id)
+        self._board_update(group_id, BOARD_TOTAL_MERIT, user_id, 0, nickname=nickname)
         
         return UserData(group_id=group_id, user_id=user_id, nickname=nickname)
     
@@ -307,47 +867,45 @@ class UnifiedDatabase:
                 nickname = excluded.nickname,
                 updated_at = excluded.updated_at
         """, (group_id, user_id, nickname, now))
-        self._conn.commit()
+        self._commit()
+        self._cache_update(group_id, user_id, nickname=nickname)
+        self._board_add_user(group_id, user_id, nickname)
+        self._after_commit(lambda: self.leaderboards.set_nickname(group_id, user_id, nickname))
     
     # ========== 功德操作 ==========
     
     def update_merit(self, group_id: str, user_id: str, nickname: str, delta: int) -> Tuple[int, int]:
         """
         更新功德，返回 (今日功德, 总功德)
+        单条 upsert 完成读-改-写，跨日时今日功德从 0 开始累加
         """
         cursor = self._conn.cursor()
         today = date.today().isoformat()
         now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         
-        cursor.execute("SELECT * FROM user_data WHERE group_id = ? AND user_id = ?",
-                       (group_id, user_id))
+        cursor.execute("""
+            INSERT INTO user_data (group_id, user_id, nickname, total_merit,
+                today_merit, today_date, knock_count, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, 1, ?)
+            ON CONFLICT(group_id, user_id) DO UPDATE SET
+                nickname = excluded.nickname,
+                total_merit = total_merit + excluded.total_merit,
+                today_merit = CASE WHEN today_date = excluded.today_date
+                                   THEN today_merit + excluded.today_merit
+                                   ELSE excluded.today_merit END,
+                today_date = excluded.today_date,
+                knock_count = knock_count + 1,
+                updated_at = excluded.updated_at
+            RETURNING today_merit, total_merit, knock_count
+        """, (group_id, user_id, nickname, delta, delta, today, now))
         row = cursor.fetchone()
+        today_merit, total, knock_count = row["today_merit"], row["total_merit"], row["knock_count"]
         
-        if row:
-            total = row["total_merit"]
-            today_merit = row["today_merit"] if row["today_date"] == today else 0
-            knock_count = row["knock_count"]
-            
-            total += delta
-            today_merit += delta
-            knock_count += 1
-            
-            cursor.execute("""
-                UPDATE user_data SET 
-                    nickname = ?, total_merit = ?, today_merit = ?,
-                    today_date = ?, knock_count = ?, updated_at = ?
-                WHERE group_id = ? AND user_id = ?
-            """, (nickname, total, today_merit, today, knock_count, now, group_id, user_id))
-        else:
-            total = delta
-            today_merit = delta
-            cursor.execute("""
-                INSERT INTO user_data (group_id, user_id, nickname, total_merit, 
-                    today_merit, today_date, knock_count, updated_at)
-                VALUES (?, ?, ?, ?, ?, ?, 1, ?)
-            """, (group_id, user_id, nickname, total, today_merit, today, now))
-        
-        self._conn.commit()
+        self._commit()
+        self._cache_update(group_id, user_id, nickname=nickname, total_merit=total,
+                           today_merit=today_merit, today_date=today, knock_count=knock_count)
+        self._board_update(group_id, BOARD_TOTAL_MERIT, user_id, total, nickname=nickname)
+        self._board_update(group_id, BOARD_TODAY_MERIT, user_id, today_merit, day=today)
         return today_merit, total
     
     def deduct_merit(self, group_id: str, user_id: str, nickname: str, amount: int = 10) -> Tuple[int, int]:
@@ -370,7 +928,9 @@ class UnifiedDatabase:
                 length_date = excluded.length_date,
                 updated_at = excluded.updated_at
         """, (group_id, user_id, length, today, now))
-        self._conn.commit()
+        self._commit()
+        self._cache_update(group_id, user_id, today_length=length, length_date=today)
+        self._board_add_user(group_id, user_id)
         return length
     
     def get_length(self, group_id: str, user_id: str) -> Optional[int]:
@@ -397,29 +957,10 @@ class UnifiedDatabase:
                 for r in cursor.fetchall()]
     
     def get_merit_ranking(self, group_id: str, ranking_type: str = "today", limit: int = 10) -> List[Dict]:
-        """获取功德排行榜"""
-        cursor = self._conn.cursor()
-        today = date.today().isoformat()
-        
-        if ranking_type == "today":
-            cursor.execute("""
-                SELECT nickname, user_id, today_merit as merit
-                FROM user_data 
-                WHERE group_id = ? AND today_date = ?
-                ORDER BY today_merit DESC 
-                LIMIT ?
-            """, (group_id, today, limit))
-        else:
-            cursor.execute("""
-                SELECT nickname, user_id, total_merit as merit
-                FROM user_data 
-                WHERE group_id = ?
-                ORDER BY total_merit DESC 
-                LIMIT ?
-            """, (group_id, limit))
-        
-        return [{"nickname": r["nickname"], "user_id": r["user_id"], "merit": r["merit"]} 
-                for r in cursor.fetchall()]
+        """获取功德排行榜（读内存排行榜）"""
+        board = BOARD_TODAY_MERIT if ranking_type == "today" else BOARD_TOTAL_MERIT
+        return [{"nickname": r["nickname"], "user_id": r["user_id"], "merit": r["score"]}
+                for r in self.leaderboards.top(group_id, board, limit)]
 
     # ========== 钓鱼操作 ==========
     
@@ -429,48 +970,43 @@ class UnifiedDatabase:
         today = date.today().isoformat()
         now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         
-        cursor.execute("SELECT bait_count, bait_date FROM user_data WHERE group_id = ? AND user_id = ?",
-                       (group_id, user_id))
-        row = cursor.fetchone()
-        
-        if row:
-            bait_count = row["bait_count"] if row["bait_date"] == today else 0
-            bait_count += 1
-            cursor.execute("""
-                UPDATE user_data SET bait_count = ?, bait_date = ?, updated_at = ?
-                WHERE group_id = ? AND user_id = ?
-            """, (bait_count, today, now, group_id, user_id))
-        else:
-            bait_count = 1
-            cursor.execute("""
-                INSERT INTO user_data (group_id, user_id, bait_count, bait_date, updated_at)
-                VALUES (?, ?, 1, ?, ?)
-            """, (group_id, user_id, today, now))
+        cursor.execute("""
+            INSERT INTO user_data (group_id, user_id, bait_count, bait_date, updated_at)
+            VALUES (?, ?, 1, ?, ?)
+            ON CONFLICT(group_id, user_id) DO UPDATE SET
+                bait_count = CASE WHEN bait_date = excluded.bait_date
+                                  THEN bait_count + 1 ELSE 1 END,
+                bait_date = excluded.bait_date,
+                updated_at = excluded.updated_at
+            RETURNING bait_count
+        """, (group_id, user_id, today, now))
+        bait_count = cursor.fetchone()["bait_count"]
         
-        self._conn.commit()
+        self._commit()
+        self._cache_update(group_id, user_id, bait_count=bait_count, bait_date=today)
+        self._board_add_user(group_id, user_id)
         return bait_count
     
-    def increment_fish_count(self, group_id: str, user_id: str) -> int:
+    def increment_fish_count(self, group_id: str, user_id: str, count: int = 1) -> int:
         """增加钓鱼次数，返回总次数"""
         cursor = self._conn.cursor()
         now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         
         cursor.execute("""
-            UPDATE user_data SET fish_count = fish_count + 1, updated_at = ?
-            WHERE group_id = ? AND user_id = ?
-        """, (now, group_id, user_id))
-        
-        if cursor.rowcount == 0:
-            cursor.execute("""
-                INSERT INTO user_data (group_id, user_id, fish_count, updated_at)
-                VALUES (?, ?, 1, ?)
-            """, (group_id, user_id, now))
-            return 1
+            INSERT INTO user_data (group_id, user_id, fish_count, updated_at)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(group_id, user_id) DO UPDATE SET
+                fish_count = fish_count + excluded.fish_count,
+                updated_at = excluded.updated_at
+            RETURNING fish_count
+        """, (group_id, user_id, count, now))
+        fish_count = cursor.fetchone()["fish_count"]
         
-        cursor.execute("SELECT fish_count FROM user_data WHERE group_id = ? AND user_id = ?",
-                       (group_id, user_id))
-        self._conn.commit()
-        return cursor.fetchone()["fish_count"]
+        self._commit()
+        self._cache_update(group_id, user_id, fish_count=fish_count)
+        self._board_add_user(group_id, user_id)
+        self._board_update(group_id, BOARD_FISH_COUNT, user_id, fish_count)
+        return fish_count
     
     # ========== 图鉴操作 ==========
     
@@ -509,8 +1045,11 @@ class UnifiedDatabase:
             catch_count = 1
             first_catch = now
             is_record = True
+            cursor.execute("SELECT COUNT(*) FROM fish_collection WHERE group_id = ? AND user_id = ?",
+                           (group_id, user_id))
+            self._board_update(group_id, BOARD_COLLECTION, user_id, cursor.fetchone()[0])
         
-        self._conn.commit()
+        self._commit()
         
         return FishRecord(
             fish_id=fish_id,
@@ -521,6 +1060,58 @@ class UnifiedDatabase:
             is_record=is_record
         )
     
+    def add_fish_records(self, group_id: str, user_id: str,
+                         catches: List[Tuple[str, float]]) -> List[FishRecord]:
+        """
+        批量添加钓鱼记录 [(鱼ID, 长度)]，按顺序逐条判断新图鉴/破纪录，
+        返回与 catches 一一对应的记录；每种鱼只读一次、写一次
+        """
+        if not catches:
+            return []
+        cursor = self._conn.cursor()
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        
+        fish_ids = list(dict.fromkeys(fish_id for fish_id, _ in catches))
+        placeholders = ",".join("?" * len(fish_ids))
+        cursor.execute(f"""
+            SELECT fish_id, max_length, catch_count, first_catch
+            FROM fish_collection
+            WHERE group_id = ? AND user_id = ? AND fish_id IN ({placeholders})
+        """, (group_id, user_id, *fish_ids))
+        # fish_id -> [最大长度, 捕获次数, 首次捕获时间]
+        state = {r["fish_id"]: [r["max_length"], r["catch_count"], r["first_catch"]]
+                 for r in cursor.fetchall()}
+        
+        records = []
+        has_new = False
+        for fish_id, length in catches:
+            entry = state.get(fish_id)
+            if entry is None:
+                entry = state[fish_id] = [length, 1, now]
+                is_new = is_record = has_new = True
+            else:
+                is_new = False
+                is_record = length > entry[0]
+                entry[0] = max(entry[0], length)
+                entry[1] += 1
+            records.append(FishRecord(fish_id=fish_id, max_length=entry[0], catch_count=entry[1],
+                                      first_catch=entry[2], is_new=is_new, is_record=is_record))
+        
+        cursor.executemany("""
+            INSERT INTO fish_collection (group_id, user_id, fish_id, max_length, catch_count, first_catch)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(group_id, user_id, fish_id) DO UPDATE SET
+                max_length = excluded.max_length,
+                catch_count = excluded.catch_count
+        """, [(group_id, user_id, fish_id, *state[fish_id]) for fish_id in fish_ids])
+        if has_new:
+            cursor.execute("SELECT COUNT(*) FROM fish_collection WHERE group_id = ? AND user_id = ?",
+                           (group_id, user_id))
+            self._board_update(group_id, BOARD_COLLECTION, user_id, cursor.fetchone()[0])
+        
+        self._commit()
+        return records
+    
     def get_fish_collection(self, group_id: str, user_id: str) -> List[FishRecord]:
         """获取用户图鉴"""
         cursor = self._conn.cursor()
@@ -568,33 +1159,14 @@ class UnifiedDatabase:
         )
     
     def get_fishing_ranking(self, group_id: str, limit: int = 10) -> List[Dict]:
-        """获取钓鱼数量排行"""
-        cursor = self._conn.cursor()
-        cursor.execute("""
-            SELECT nickname, user_id, fish_count
-            FROM user_data 
-            WHERE group_id = ? AND fish_count > 0
-            ORDER BY fish_count DESC 
-            LIMIT ?
-        """, (group_id, limit))
-        return [{"nickname": r["nickname"], "user_id": r["user_id"], "count": r["fish_count"]} 
-                for r in cursor.fetchall()]
+        """获取钓鱼数量排行（读内存排行榜）"""
+        return [{"nickname": r["nickname"], "user_id": r["user_id"], "count": r["score"]}
+                for r in self.leaderboards.top(group_id, BOARD_FISH_COUNT, limit)]
     
     def get_collection_ranking(self, group_id: str, limit: int = 10) -> List[Dict]:
-        """获取图鉴解锁数量排行"""
-        cursor = self._conn.cursor()
-        cursor.execute("""
-            SELECT u.nickname, u.user_id, COUNT(f.fish_id) as count
-            FROM user_data u
-            LEFT JOIN fish_collection f ON u.group_id = f.group_id AND u.user_id = f.user_id
-            WHERE u.group_id = ?
-            GROUP BY u.group_id, u.user_id
-            HAVING count > 0
-            ORDER BY count DESC
-            LIMIT ?
-        """, (group_id, limit))
-        return [{"nickname": r["nickname"], "user_id": r["user_id"], "count": r["count"]} 
-                for r in cursor.fetchall()]
+        """获取图鉴解锁数量排行（读内存排行榜）"""
+        return [{"nickname": r["nickname"], "user_id": r["user_id"], "count": r["score"]}
+                for r in self.leaderboards.top(group_id, BOARD_COLLECTION, limit)]
 
     # ========== 头衔操作 ==========
     
@@ -626,24 +1198,17 @@ class UnifiedDatabase:
                 INSERT INTO user_data (group_id, user_id, unlocked_titles, updated_at)
                 VALUES (?, ?, ?, ?)
             """, (group_id, user_id, json.dumps([title], ensure_ascii=False), now))
+            titles = [title]
+            self._board_add_user(group_id, user_id)
         
-        self._conn.commit()
+        self._commit()
+        self._cache_update(group_id, user_id, unlocked_titles=list(titles))
         return True
     
     def get_user_titles(self, group_id: str, user_id: str) -> List[str]:
         """获取用户已解锁头衔"""
-        cursor = self._conn.cursor()
-        cursor.execute("SELECT unlocked_titles FROM user_data WHERE group_id = ? AND user_id = ?",
-                       (group_id, user_id))
-        row = cursor.fetchone()
-        
-        if not row:
-            return []
-        
-        try:
-            return json.loads(row["unlocked_titles"] or "[]")
-        except:
-            return []
+        user = self.get_user(group_id, user_id)
+        return list(user.unlocked_titles) if user else []
     
     def set_current_title(self, group_id: str, user_id: str, title: str) -> bool:
         """设置当前佩戴头衔"""
@@ -659,16 +1224,14 @@ class UnifiedDatabase:
             UPDATE user_data SET current_title = ?, updated_at = ?
             WHERE group_id = ? AND user_id = ?
         """, (title, now, group_id, user_id))
-        self._conn.commit()
+        self._commit()
+        self._cache_update(group_id, user_id, current_title=title)
         return True
     
     def get_current_title(self, group_id: str, user_id: str) -> str:
         """获取当前佩戴头衔"""
-        cursor = self._conn.cursor()
-        cursor.execute("SELECT current_title FROM user_data WHERE group_id = ? AND user_id = ?",
-                       (group_id, user_id))
-        row = cursor.fetchone()
-        return row["current_title"] if row else ""
+        user = self.get_user(group_id, user_id)
+        return user.current_title if user else ""
     
     # ========== 事件操作 ==========
     
@@ -682,42 +1245,73 @@ class UnifiedDatabase:
             INSERT INTO global_events (group_id, event_type, expire_time, triggered_by)
             VALUES (?, ?, ?, ?)
         """, (group_id, event_type, expire_str, triggered_by))
-        self._conn.commit()
-        return cursor.lastrowid
+        event_id = cursor.lastrowid
+        self._commit()
+        self._after_commit(lambda: self.active_events.add(group_id, event_id, event_type,
+                                                          expire_str, triggered_by))
+        return event_id
     
-    def get_active_events(self, group_id: str) -> List[Dict]:
-        """获取当前活跃事件"""
+    def _load_active_events(self, group_id: str) -> list:
+        """读取一个群未过期的事件"""
         cursor = self._conn.cursor()
         now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
         cursor.execute("""
-            SELECT event_type, expire_time, triggered_by
+            SELECT id, event_type, expire_time, triggered_by
             FROM global_events
             WHERE group_id = ? AND expire_time > ?
         """, (group_id, now))
-        
-        return [{"event_type": r["event_type"], "expire_time": r["expire_time"], 
-                 "triggered_by": r["triggered_by"]} for r in cursor.fetchall()]
+        return cursor.fetchall()
+    
+    def get_active_events(self, group_id: str) -> List[Dict]:
+        """获取当前活跃事件（读内存索引）"""
+        return self.active_events.events(group_id)
     
     def is_event_active(self, group_id: str, event_type: str) -> bool:
         """检查特定事件是否激活"""
+        return self.active_events.is_active(group_id, event_type)
+    
+    def cleanup_expired_events(self, retention_seconds: int = 0) -> int:
+        """清理过期超过 retention_seconds 的事件，返回删除条数"""
+        cursor = self._conn.cursor()
+        cutoff = datetime.fromtimestamp(datetime.now().timestamp() - retention_seconds)
+        cursor.execute("DELETE FROM global_events WHERE expire_time <= ?",
+                       (cutoff.strftime("%Y-%m-%d %H:%M:%S"),))
+        self._commit()
+        return cursor.rowcount
+    
+    # ========== 个人效果操作 ==========
+    
+    def get_user_effects(self, group_id: str, user_id: str) -> Dict[str, Tuple[int, float]]:
+        """获取用户未过期的个人效果 {效果: (值, 过期时间戳)}"""
         cursor = self._conn.cursor()
-        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
         cursor.execute("""
-            SELECT 1 FROM global_events
-            WHERE group_id = ? AND event_type = ? AND expire_time > ?
-            LIMIT 1
-        """, (group_id, event_type, now))
-        
-        return cursor.fetchone() is not None
+            SELECT effect, value, expire_at FROM user_effects
+            WHERE group_id = ? AND user_id = ? AND expire_at > ?
+        """, (group_id, user_id, time.time()))
+        return {r["effect"]: (r["value"], r["expire_at"]) for r in cursor.fetchall()}
     
-    def cleanup_expired_events(self):
-        """清理过期事件"""
+    def set_user_effect(self, group_id: str, user_id: str, effect: str, value: int, expire_at: float):
+        """设置个人效果，值不大于 0 时删除"""
         cursor = self._conn.cursor()
-        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        cursor.execute("DELETE FROM global_events WHERE expire_time <= ?", (now,))
-        self._conn.commit()
+        if value > 0:
+            cursor.execute("""
+                INSERT INTO user_effects (group_id, user_id, effect, value, expire_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(group_id, user_id, effect) DO UPDATE SET
+                    value = excluded.value,
+                    expire_at = excluded.expire_at
+            """, (group_id, user_id, effect, value, expire_at))
+        else:
+            cursor.execute("DELETE FROM user_effects WHERE group_id = ? AND user_id = ? AND effect = ?",
+                           (group_id, user_id, effect))
+        self._commit()
+    
+    def cleanup_expired_effects(self) -> int:
+        """清理过期的个人效果，返回删除条数"""
+        cursor = self._conn.cursor()
+        cursor.execute("DELETE FROM user_effects WHERE expire_at <= ?", (time.time(),))
+        self._commit()
+        return cursor.rowcount
     
     # ========== 人设和对话操作 ==========
     
@@ -729,13 +1323,24 @@ class UnifiedDatabase:
             VALUES (?, ?, ?)
         """, (group_id, user_id, content))
         
+        # 计数列随插入累加，不再对缓冲表 COUNT(*)
         cursor.execute("""
-            SELECT COUNT(*) FROM message_buffer WHERE group_id = ? AND user_id = ?
+            INSERT INTO user_data (group_id, user_id, buffer_count)
+            VALUES (?, ?, 1)
+            ON CONFLICT(group_id, user_id) DO UPDATE SET buffer_count = buffer_count + 1
+            RETURNING buffer_count
         """, (group_id, user_id))
         count = cursor.fetchone()[0]
-        self._conn.commit()
+        self._commit()
+        self._cache_update(group_id, user_id, buffer_count=count)
+        self._board_add_user(group_id, user_id)
         return count
     
+    def get_buffer_count(self, group_id: str, user_id: str) -> int:
+        """获取缓冲消息数量（读用户缓存）"""
+        user = self.get_user(group_id, user_id)
+        return user.buffer_count if user else 0
+    
     def get_buffer_messages(self, group_id: str, user_id: str) -> List[Dict]:
         """获取用户的缓冲消息"""
         cursor = self._conn.cursor()
@@ -751,7 +1356,10 @@ class UnifiedDatabase:
         cursor = self._conn.cursor()
         cursor.execute("DELETE FROM message_buffer WHERE group_id = ? AND user_id = ?", 
                        (group_id, user_id))
-        self._conn.commit()
+        cursor.execute("UPDATE user_data SET buffer_count = 0 WHERE group_id = ? AND user_id = ?",
+                       (group_id, user_id))
+        self._commit()
+        self._cache_update(group_id, user_id, buffer_count=0)
     
     def update_profile(self, group_id: str, user_id: str, profile: str, tags: List[str] = None):
         """更新用户人设"""
@@ -769,70 +1377,119 @@ class UnifiedDatabase:
                 INSERT INTO user_data (group_id, user_id, profile, tags, updated_at)
                 VALUES (?, ?, ?, ?, ?)
             """, (group_id, user_id, profile, tags_json, now))
+            self._board_add_user(group_id, user_id)
         
-        self._conn.commit()
+        self._commit()
+        self._cache_update(group_id, user_id, profile=profile, tags=list(tags or []))
     
     def add_conversation(self, group_id: str, user_id: str, role: str, content: str):
-        """添加对话记录"""
-        cursor = self._conn.cursor()
-        cursor.execute("""
-            INSERT INTO conversation_history (group_id, user_id, role, content)
-            VALUES (?, ?, ?, ?)
-        """, (group_id, user_id, role, content))
-        
-        # 只保留最近20条
-        cursor.execute("""
-            DELETE FROM conversation_history 
-            WHERE group_id = ? AND user_id = ? AND id NOT IN (
-                SELECT id FROM conversation_history 
-                WHERE group_id = ? AND user_id = ?
-                ORDER BY timestamp DESC LIMIT 20
-            )
-        """, (group_id, user_id, group_id, user_id))
-        self._conn.commit()
+        """添加对话记录（每人保留最近 CONVERSATION_CAPACITY 条）"""
+        self.conversations.append(group_id, user_id, role=role, content=content)
+        self._commit()
     
     def get_conversation(self, group_id: str, user_id: str, limit: int = 10) -> List[Dict]:
         """获取对话历史"""
-        cursor = self._conn.cursor()
-        cursor.execute("""
-            SELECT role, content FROM conversation_history
-            WHERE group_id = ? AND user_id = ?
-            ORDER BY timestamp DESC LIMIT ?
-        """, (group_id, user_id, limit))
-        rows = cursor.fetchall()
-        return [{"role": r["role"], "content": r["content"]} for r in reversed(rows)]
+        history = self.conversations.recent(group_id, user_id)
+        return history[-limit:] if limit > 0 else []
     
     def add_memory(self, group_id: str, user_id: str, event: str):
-        """添加重要事件记忆"""
-        cursor = self._conn.cursor()
-        cursor.execute("""
-            INSERT INTO user_memories (group_id, user_id, event)
-            VALUES (?, ?, ?)
-        """, (group_id, user_id, event))
-        
-        # 只保留最近10条
-        cursor.execute("""
-            DELETE FROM user_memories 
-            WHERE group_id = ? AND user_id = ? AND id NOT IN (
-                SELECT id FROM user_memories 
-                WHERE group_id = ? AND user_id = ?
-                ORDER BY timestamp DESC LIMIT 10
-            )
-        """, (group_id, user_id, group_id, user_id))
-        self._conn.commit()
+        """添加重要事件记忆（每人保留最近 MEMORY_CAPACITY 条）"""
+        self.memories.append(group_id, user_id, event=event)
+        self._commit()
     
     def get_memories(self, group_id: str, user_id: str) -> List[Dict]:
-        """获取用户记忆"""
+        """获取用户记忆（新 -> 旧）"""
+        return self.memories.recent(group_id, user_id)[::-1]
+    
+    # ========== 维护 ==========
+    
+    def prune_message_buffer(self, retention_days: int, max_per_user: int) -> int:
+        """删除过旧的缓冲消息并按用户截断到 max_per_user 条，返回删除条数"""
         cursor = self._conn.cursor()
-        cursor.execute("""
-            SELECT event, timestamp FROM user_memories
-            WHERE group_id = ? AND user_id = ?
-            ORDER BY timestamp DESC LIMIT 10
-        """, (group_id, user_id))
-        return [{"event": r["event"], "timestamp": r["timestamp"]} for r in cursor.fetchall()]
+        deleted = 0
+        
+        if retention_days > 0:
+            cursor.execute("DELETE FROM message_buffer WHERE timestamp < datetime('now', ?)",
+                           (f"-{retention_days} days",))
+            deleted += cursor.rowcount
+        
+        if max_per_user > 0:
+            cursor.execute("""
+                DELETE FROM message_buffer WHERE id IN (
+                    SELECT id FROM (
+                        SELECT id, ROW_NUMBER() OVER (
+                            PARTITION BY group_id, user_id ORDER BY id DESC
+                        ) AS rn
+                        FROM message_buffer
+                    ) WHERE rn > ?
+                )
+            """, (max_per_user,))
+            deleted += cursor.rowcount
+        
+        if deleted:
+            # 同步计数列，缓存中的 buffer_count 随之作废
+            cursor.execute("""
+                UPDATE user_data SET buffer_count = (
+                    SELECT COUNT(*) FROM message_buffer b
+                    WHERE b.group_id = user_data.group_id AND b.user_id = user_data.user_id
+                ) WHERE buffer_count > 0
+            """)
+            self._after_commit(self.user_cache.clear)
+        
+        self._commit()
+        return deleted
+    
+    def prune_expired(self) -> Dict[str, int]:
+        """按配置的保留窗口清理过期事件、缓冲消息和个人效果，并更新统计信息，返回删除条数"""
+        events = self.cleanup_expired_events(config.db_event_retention_hours * 3600)
+        buffers = self.prune_message_buffer(config.db_buffer_retention_days,
+                                            config.db_buffer_max_per_user)
+        effects = self.cleanup_expired_effects()
+        self._conn.execute("PRAGMA optimize")
+        return {"events": events, "buffers": buffers, "effects": effects}
+    
+    def incremental_vacuum(self) -> int:
+        """
+        归还空闲页（需 auto_vacuum=INCREMENTAL），返回回收的字节数
+        使用独立的短连接，可在线程池中调用
+        """
+        conn = sqlite3.connect(self.db_path, timeout=5.0)
+        try:
+            page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+            before = conn.execute("PRAGMA page_count").fetchone()[0]
+            # executescript 会把 PRAGMA 执行到底；execute 每次只回收一页
+            conn.executescript("PRAGMA incremental_vacuum;")
+            after = conn.execute("PRAGMA page_count").fetchone()[0]
+            return (before - after) * page_size
+        finally:
+            conn.close()
+    
+    async def run_maintenance(self) -> Dict[str, int]:
+        """定期维护：清理交给写线程串行执行，VACUUM 在线程池中用独立连接执行"""
+        start = time.perf_counter()
+        stats = await self.write(self.prune_expired)
+        stats["reclaimed_bytes"] = await asyncio.to_thread(self.incremental_vacuum)
+        stats["elapsed_ms"] = int((time.perf_counter() - start) * 1000)
+        logger.info(f"数据库维护完成: 过期事件 {stats['events']} 条, 缓冲消息 {stats['buffers']} 条, "
+                    f"个人效果 {stats['effects']} 条, 回收 {stats['reclaimed_bytes'] / 1024:.1f}KB, 耗时 {stats['elapsed_ms']}ms")
+        return stats
+    
+    def checkpoint(self, mode: str = "PASSIVE") -> Optional[Tuple[int, int, int]]:
+        """
+        执行 WAL 检查点，返回 (busy, WAL总页数, 已回写页数)
+        使用独立的短连接，可在线程池中调用
+        """
+        if PRAGMA_PROFILES[self.pragma_profile].get("journal_mode", "").upper() != "WAL":
+            return None
+        conn = sqlite3.connect(self.db_path, timeout=5.0)
+        try:
+            return tuple(conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone())
+        finally:
+            conn.close()
     
     def close(self):
         """关闭数据库连接"""
+        self.writer.close()
         if hasattr(self._local, 'conn') and self._local.conn:
             self._local.conn.close()
             self._local.conn = None
@@ -840,3 +1497,64 @@ class UnifiedDatabase:
 
 # 全局实例
 unified_db = UnifiedDatabase()
+
+
+_checkpoint_task: Optional[asyncio.Task] = None
+_maintenance_task: Optional[asyncio.Task] = None
+
+
+async def _checkpoint_loop(interval: int):
+    """定期执行 WAL 检查点，防止 WAL 文件无限增长"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            result = await asyncio.to_thread(unified_db.checkpoint)
+            if result:
+                logger.debug(f"WAL检查点完成: busy={result[0]}, 日志页={result[1]}, 回写页={result[2]}")
+        except Exception as e:
+            logger.error(f"WAL检查点失败: {e}")
+
+
+async def _maintenance_loop(interval: int):
+    """定期执行数据库维护"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await unified_db.run_maintenance()
+        except Exception as e:
+            logger.error(f"数据库维护失败: {e}")
+
+
+async def _start_checkpoint_task():
+    global _checkpoint_task
+    if config.db_checkpoint_interval > 0:
+        _checkpoint_task = asyncio.create_task(_checkpoint_loop(config.db_checkpoint_interval))
+
+
+async def _stop_checkpoint_task():
+    if _checkpoint_task is not None:
+        _checkpoint_task.cancel()
+
+
+async def _start_maintenance_task():
+    global _maintenance_task
+    if config.db_maintenance_interval > 0:
+        _maintenance_task = asyncio.create_task(_maintenance_loop(config.db_maintenance_interval))
+
+
+async def _stop_maintenance_task():
+    if _maintenance_task is not None:
+        _maintenance_task.cancel()
+
+
+# 启动检查点/维护任务，关闭时刷新写入队列（脱离 NoneBot 单独导入时跳过）
+try:
+    driver = get_driver()
+    driver.on_startup(unified_db.rebuild_leaderboards)
+    driver.on_startup(_start_checkpoint_task)
+    driver.on_startup(_start_maintenance_task)
+    driver.on_shutdown(_stop_checkpoint_task)
+    driver.on_shutdown(_stop_maintenance_task)
+    driver.on_shutdown(unified_db.close)
+except ValueError:
+    pass
@@ -0,0 +1,62 @@
+"""
+加权随机抽样工具
+Walker 别名法（Vose 实现）：建表 O(n)，之后每次抽样 O(1)，
+用于敲木鱼结果、随机事件、轮盘子弹等权重固定的抽取
+"""
+
+import random
+from typing import Generic, List, Sequence, TypeVar
+
+T = TypeVar("T")
+
+
+class AliasSampler(Generic[T]):
+    """按固定权重抽取元素的别名表，权重只需非负、不必归一化"""
+
+    def __init__(self, items: Sequence[T], weights: Sequence[float]):
+        if len(items) != len(weights):
+            raise ValueError("items 与 weights 长度不一致")
+        if not items:
+            raise ValueError("不能从空序列抽样")
+        if any(w < 0 for w in weights):
+            raise ValueError("权重不能为负")
+        total = float(sum(weights))
+        if total <= 0:
+            raise ValueError("权重之和必须大于 0")
+
+        n = len(items)
+        self.items = tuple(items)
+        self.weights = tuple(weights)
+        # 每个槽位保留自身的概率，剩余部分指向 alias 槽位
+        self._prob: List[float] = [0.0] * n
+        self._alias: List[int] = list(range(n))
+
+        scaled = [w * n / total for w in weights]
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            self._prob[s] = scaled[s]
+            self._alias[s] = l
+            scaled[l] -= 1.0 - scaled[s]
+            (small if scaled[l] < 1.0 else large).append(l)
+        # 浮点误差导致的剩余槽位概率视为 1
+        for i in small + large:
+            self._prob[i] = 1.0
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def probability(self, index: int) -> float:
+        """第 index 个元素的抽中概率（按权重归一化）"""
+        return self.weights[index] / sum(self.weights)
+
+    def sample_index(self, rng: random.Random = random) -> int:
+        """抽取一个下标；一个随机数同时决定槽位和槽内取舍"""
+        u = rng.random() * len(self._prob)
+        i = int(u)
+        return i if u - i < self._prob[i] else self._alias[i]
+
+    def sample(self, rng: random.Random = random) -> T:
+        """抽取一个元素"""
+        return self.items[self.sample_index(rng)]
@@ -4,7 +4,6 @@
 功能：累加功德值，有暴击和负面效果，每日排行榜，支持事件系统
 """
 
-import random
 import re
 import time
 from typing import Dict, List, Tuple
@@ -15,6 +14,7 @@ from nonebot.log import logger
 from plugins.unified_db import unified_db
 from plugins.event_service import event_service
 from plugins.title_service import title_service
+from plugins.weighted_sampler import AliasSampler
 
 
 # 敲木鱼结果配置 (delta, weight, message)
@@ -61,6 +61,10 @@ KNOCK_RESULTS = [
     (114514, 0.01, "🤣 哼哼哼啊啊啊啊啊！功德 +114514"),
 ]
 
+# 敲木鱼结果抽样表，导入时建一次
+KNOCK_SAMPLER = AliasSampler([(delta, msg) for delta, _, msg in KNOCK_RESULTS],
+                             [weight for _, weight, _ in KNOCK_RESULTS])
+
 
 def get_knock_result(merit_bonus: int = 0) -> Tuple[int, str]:
     """根据权重随机获取敲木鱼结果"""
@@ -68,14 +72,7 @@ def get_knock_result(merit_bonus: int = 0) -> Tuple[int, str]:
     if merit_bonus > 0:
         return merit_bonus, f"💥 功德大爆发！功德 +{merit_bonus}"
     
-    total_weight = sum(r[1] for r in KNOCK_RESULTS)
-    rand = random.uniform(0, total_weight)
-    current = 0
-    for delta, weight, msg in KNOCK_RESULTS:
-        current += weight
-        if rand <= current:
-            return delta, msg
-    return 1, "🪵 咚~ 功德 +1"
+    return KNOCK_SAMPLER.sample()
 
 
 # 注册命令
@@ -136,7 +133,7 @@ async def handle_knock(bot: Bot, event: Event):
         knock_count = count_knock_chars(raw_text)
         if knock_count > 1:
             penalty = knock_count - 1
-            today_merit, total_merit = unified_db.update_merit(group_id, user_id, nickname, -penalty)
+            today_merit, total_merit = await unified_db.write(unified_db.update_merit, group_id, user_id, nickname, -penalty)
             result = f"🚫 贪心敲了{knock_count}下！功德 -{penalty}\n今日功德: {today_merit} | 总功德: {total_merit}"
             await knock_cmd.finish(Message([
                 MessageSegment.at(user_id),
@@ -147,7 +144,7 @@ async def handle_knock(bot: Bot, event: Event):
         # 检查刷屏
         spam_penalty, spam_count = check_spam(group_id, user_id)
         if spam_penalty > 0:
-            today_merit, total_merit = unified_db.update_merit(group_id, user_id, nickname, -spam_penalty)
+            today_merit, total_merit = await unified_db.write(unified_db.update_merit, group_id, user_id, nickname, -spam_penalty)
             result = f"🚫 敲太快了！10秒内已敲{spam_count}次！功德 -{spam_penalty}\n今日功德: {today_merit} | 总功德: {total_merit}"
             await knock_cmd.finish(Message([
                 MessageSegment.at(user_id),
@@ -161,12 +158,12 @@ async def handle_knock(bot: Bot, event: Event):
         
         # 正常敲木鱼
         delta, msg = get_knock_result(merit_bonus)
-        today_merit, total_merit = unified_db.update_merit(group_id, user_id, nickname, delta)
+        today_merit, total_merit = await unified_db.write(unified_db.update_merit, group_id, user_id, nickname, delta)
         
         result = f"{msg}\n今日功德: {today_merit} | 总功德: {total_merit}"
         
         # 检查头衔解锁
-        new_titles = title_service.check_and_unlock(group_id, user_id)
+        new_titles = await unified_db.write(title_service.check_and_unlock, group_id, user_id)
         if new_titles:
             result += f"\n\n🏆 解锁新头衔：{', '.join(new_titles)}"
             for title in new_titles:
@@ -254,7 +251,7 @@ async def handle_my_merit(bot: Bot, event: Event):
         if not nickname:
             nickname = user_id
         
-        user = unified_db.get_or_create_user(group_id, user_id, nickname)
+        user = await unified_db.write(unified_db.get_or_create_user, group_id, user_id, nickname)
         
         lines = [f"📿 {nickname} 的功德"]
         lines.append(f"今日功德: {user.today_merit}")
@@ -278,7 +275,7 @@ async def handle_my_merit(bot: Bot, event: Event):
 # 为了兼容旧代码，提供 woodfish_db 接口
 class WoodfishDBCompat:
     """兼容旧接口"""
-    def deduct_merit(self, group_id: str, user_id: str, nickname: str, amount: int = 10):
-        return unified_db.deduct_merit(group_id, user_id, nickname, amount)
+    async def deduct_merit(self, group_id: str, user_id: str, nickname: str, amount: int = 10):
+        return await unified_db.write(unified_db.deduct_merit, group_id, user_id, nickname, amount)
 
 woodfish_db = WoodfishDBCompat()
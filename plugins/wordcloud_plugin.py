@@ -4,93 +4,27 @@
 命令：/今日词云
 统计时间：0点开始，8点更新
 使用jieba分词 + 多层过滤机制
+消息攒够一批后在分词进程中分词并累加到每群的词频 Counter，原文随即丢弃，
+内存只与词汇量有关；查询时只需处理尚未分词的少量消息
 """
 
-import re
+import asyncio
+import multiprocessing
 from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
 from datetime import datetime, date
-from typing import Dict, List, Set
-from nonebot import on_command
+from typing import Dict, List, Optional, Set
+from nonebot import get_driver, on_command
 from nonebot.adapters.onebot.v11 import Bot, Event, GroupMessageEvent, Message, MessageSegment
 from nonebot.log import logger
 
-try:
-    import jieba
-    import jieba.posseg as pseg
-    JIEBA_AVAILABLE = True
-except ImportError:
-    JIEBA_AVAILABLE = False
-    logger.warning("jieba未安装，词云功能将使用简单分词")
-
-
-# ========== 停用词库 ==========
-
-# 基础停用词（虚词、代词、连词等）
-BASIC_STOP_WORDS = {
-    "的", "了", "是", "在", "我", "有", "和", "就", "不", "人", "都", "一", "一个", "上", "也", "很", "到",
-    "说", "要", "去", "你", "会", "着", "没有", "看", "好", "自己", "这", "那", "他", "她", "它", "我们",
-    "你们", "他们", "这个", "那个", "这些", "那些", "这样", "那样", "怎么", "什么", "哪里", "为什么",
-    "因为", "所以", "但是", "然后", "如果", "虽然", "可是", "而且", "或者", "还是", "不过", "只是",
-    "已经", "还", "再", "又", "才", "就", "都", "只", "也", "还是", "更", "最", "非常", "十分", "特别",
-    "比较", "有点", "一点", "一些", "许多", "很多", "一直", "总是", "经常", "有时", "偶尔", "从来",
-    "能", "会", "可以", "应该", "必须", "需要", "想", "要", "得", "过", "来", "去", "给", "被", "把",
-    "让", "叫", "使", "由", "对", "向", "从", "以", "为", "于", "与", "及", "而", "或", "且", "则",
-}
-
-# 语气词（重点过滤）
-MODAL_WORDS = {
-    "啊", "呀", "哇", "呢", "吧", "嘛", "咯", "喽", "哦", "哟", "嘿", "嗨", "哈", "呵", "嘻", "嘿嘿",
-    "哈哈", "呵呵", "嘻嘻", "嘿嘿", "啦", "哪", "呐", "嘞", "喔", "唷", "哎", "哎呀", "哎哟", "唉",
-    "嗯", "嗯嗯", "嘛", "么", "嘞", "咧", "喵", "呜", "呜呜", "嘤", "嘤嘤", "嘶", "嘶嘶", "嘿咻",
-    "哼", "哼哼", "嗷", "嗷嗷", "嗷呜", "呃", "额", "emm", "emmm", "ummm", "嗷呜", "嗯哼", "嗯呐",
-}
-
-# 网络用语/表情词
-INTERNET_SLANG = {
-    "哈哈哈", "哈哈哈哈", "哈哈哈哈哈", "嘿嘿嘿", "嘻嘻嘻", "呵呵呵", "嘤嘤嘤", "呜呜呜", "嘤嘤嘤嘤",
-    "草", "草草草", "卧槽", "我去", "我靠", "牛逼", "牛批", "厉害", "666", "233", "2333", "23333",
-    "hhh", "hhhh", "hhhhh", "www", "wwww", "wwwww", "orz", "OTZ", "囧", "囧rz",
-}
-
-# 无意义单字（只过滤单字，词组中的不过滤）
-MEANINGLESS_SINGLE = {
-    "个", "些", "样", "种", "次", "下", "点", "会", "能", "要", "想", "看", "说", "做", "去", "来",
-    "给", "对", "把", "被", "让", "叫", "用", "从", "在", "到", "向", "往", "由", "为", "以", "及",
-}
-
-# 特殊符号和标点
-PUNCTUATION = {
-    "/", "、", "，", "。", "！", "？", "：", "；", """, """, "'", "'", "（", "）", "[", "]", "{", "}", 
-    "【", "】", "《", "》", "—", "…", "·", "~", "@", "#", "$", "%", "^", "&", "*", "+", "=", "|", "\\",
-    "<", ">", ".", ",", "!", "?", ":", ";", "'", '"', "(", ")", "-", "_", "`", "、", "，", "。",
-}
-
-# 合并所有停用词
-ALL_STOP_WORDS = BASIC_STOP_WORDS | MODAL_WORDS | INTERNET_SLANG | PUNCTUATION
-
-# 保留的词性（jieba分词用）
-KEEP_POS = {
-    'n',   # 名词
-    'nr',  # 人名
-    'ns',  # 地名
-    'nt',  # 机构名
-    'nz',  # 其他专名
-    'v',   # 动词
-    'vn',  # 名动词
-    'a',   # 形容词
-    'an',  # 名形词
-    'i',   # 成语
-    'l',   # 习用语
-    'eng', # 英文
-}
-
-# 自定义词典（群聊常见词组）
-CUSTOM_WORDS = [
-    "钓鱼", "敲木鱼", "木鱼", "功德", "小猪", "塔罗牌", "占卜", "运势", "今日长度",
-    "俄罗斯轮盘", "轮盘", "词云", "人设", "小喵", "猫娘", "群友", "机器人",
-    "打工人", "社畜", "摸鱼", "划水", "内卷", "躺平", "emo", "破防", "绷不住",
-]
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import config
+from plugins.wordcloud_tokenizer import JIEBA_AVAILABLE, count_words, load_jieba
 
 
 class WordCloudManager:
@@ -99,109 +33,138 @@ class WordCloudManager:
     def __init__(self):
         self.data_dir = Path("data/wordcloud")
         self.data_dir.mkdir(parents=True, exist_ok=True)
-        self.group_messages: Dict[str, List[str]] = {}
+        # 每群今日词频、消息数，以及还没分词的消息
+        self.group_counters: Dict[str, Counter] = {}
+        self.group_counts: Dict[str, int] = {}
+        self.group_pending: Dict[str, List[str]] = {}
         self.group_dates: Dict[str, str] = {}
         self.group_wordclouds: Dict[str, Dict] = {}
+        # 每群正在后台分词的任务，同一群同一时间只有一个
+        self._flush_tasks: Dict[str, asyncio.Task] = {}
+        # 分词进程池，首次使用时创建
+        self._executor: Optional[ProcessPoolExecutor] = None
         
-        # 初始化jieba
+        # 初始化jieba：分词进程由 initializer 自行加载，主进程只在 wordcloud_workers 为 0
+        # 或进程池故障时退回线程分词（以及无事件循环时就地分词）才用到
         if JIEBA_AVAILABLE:
-            # 添加自定义词典
-            for word in CUSTOM_WORDS:
-                jieba.add_word(word)
+            load_jieba()
             logger.info("jieba分词初始化完成，已加载自定义词典")
     
     def add_message(self, group_id: str, text: str):
-        """添加消息到缓冲"""
+        """添加消息到缓冲，攒够 wordcloud_batch_size 条后在后台分词"""
         today = str(date.today())
         
         # 检查是否需要重置（新的一天）
         if group_id not in self.group_dates or self.group_dates[group_id] != today:
-            self.group_messages[group_id] = []
+            self.group_counters[group_id] = Counter()
+            self.group_counts[group_id] = 0
+            self.group_pending[group_id] = []
             self.group_dates[group_id] = today
             if group_id in self.group_wordclouds:
                 del self.group_wordclouds[group_id]
         
         # 添加消息
-        if group_id not in self.group_messages:
-            self.group_messages[group_id] = []
-        self.group_messages[group_id].append(text)
+        self.group_counts[group_id] += 1
+        pending = self.group_pending[group_id]
+        pending.append(text)
+        if len(pending) >= config.wordcloud_batch_size:
+            self._schedule_flush(group_id)
     
-    def extract_words_jieba(self, text: str) -> List[str]:
-        """使用jieba分词提取词语（推荐）"""
-        words = []
-        
-        # 使用词性标注分词
-        word_pairs = pseg.cut(text)
-        
-        for word, pos in word_pairs:
-            # 多层过滤
-            # 1. 过滤停用词
-            if word in ALL_STOP_WORDS:
-                continue
-            
-            # 2. 过滤单字无意义词
-            if len(word) == 1 and word in MEANINGLESS_SINGLE:
-                continue
-            
-            # 3. 只保留2-4字的词
-            if len(word) < 2 or len(word) > 4:
-                continue
-            
-            # 4. 词性过滤（只保留有意义的词性）
-            if pos not in KEEP_POS:
-                continue
-            
-            # 5. 过滤纯数字和纯英文
-            if word.isdigit() or word.isalpha():
-                continue
-            
-            words.append(word)
-        
-        return words
+    def _get_executor(self) -> Optional[ProcessPoolExecutor]:
+        """
+        分词进程池；wordcloud_workers 为 0 时返回 None，改在线程中分词
+        用 spawn 而不是 fork：机器人进程里已有写线程、图片服务器等线程，
+        fork 可能把它们持有的锁带进子进程导致死锁；子进程只导入 wordcloud_tokenizer 并加载词典
+        """
+        if self._executor is None and config.wordcloud_workers > 0:
+            self._executor = ProcessPoolExecutor(max_workers=config.wordcloud_workers,
+                                                 mp_context=multiprocessing.get_context("spawn"),
+                                                 initializer=load_jieba)
+        return self._executor
     
-    def extract_words_simple(self, text: str) -> List[str]:
-        """简单分词（jieba不可用时的备用方案）"""
-        # 移除特殊字符和数字
-        text = re.sub(r'[0-9a-zA-Z\s]+', ' ', text)
-        
-        words = []
-        
-        # 提取2-4字词组
-        for length in [2, 3, 4]:
-            for i in range(len(text) - length + 1):
-                word = text[i:i+length]
-                if len(word) == length and word not in ALL_STOP_WORDS:
-                    words.append(word)
-        
-        return words
+    def start(self):
+        """预先启动分词进程并加载词典，避免第一批消息等待子进程启动"""
+        executor = self._get_executor()
+        if executor is not None:
+            executor.submit(load_jieba)
+    
+    async def count_words_async(self, texts: List[str]) -> Counter:
+        """在分词进程池中统计一批消息的词频，不阻塞事件循环"""
+        executor = self._get_executor()
+        if executor is not None:
+            try:
+                return await asyncio.get_running_loop().run_in_executor(executor, count_words, texts)
+            except BrokenProcessPool as e:
+                # 分词进程意外退出，关闭旧进程池、下次重建，这一批改在线程中处理
+                logger.warning(f"词云分词进程异常，重建进程池: {e}")
+                if self._executor is executor:
+                    self.shutdown()
+        return await asyncio.to_thread(count_words, texts)
+    
+    def shutdown(self):
+        """关闭分词进程池"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+    
+    def _merge(self, group_id: str, day: str, counter: Counter):
+        """把一批分词结果计入词频；分词期间已经跨天的旧结果丢弃"""
+        if self.group_dates.get(group_id) == day:
+            self.group_counters[group_id].update(counter)
+    
+    def _schedule_flush(self, group_id: str):
+        """启动该群的后台分词任务（已有任务在跑时由它顺带处理新消息）"""
+        if group_id in self._flush_tasks:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # 没有事件循环（脚本直接调用）时就地分词
+            texts = self.group_pending[group_id]
+            self.group_pending[group_id] = []
+            self._merge(group_id, self.group_dates[group_id], count_words(texts))
+            return
+        self._flush_tasks[group_id] = loop.create_task(self._drain(group_id))
+    
+    async def _drain(self, group_id: str):
+        """在分词进程池中分词，直到该群没有待处理消息"""
+        try:
+            while self.group_pending.get(group_id):
+                texts = self.group_pending[group_id]
+                self.group_pending[group_id] = []
+                day = self.group_dates[group_id]
+                try:
+                    counter = await self.count_words_async(texts)
+                except Exception as e:
+                    # 进程池故障已在 count_words_async 中退回线程重试，到这里说明这批消息本身分词失败；
+                    # 不再计入消息数，免得统计条数包含没算进词频的消息
+                    logger.error(f"词云分词异常，丢弃 {len(texts)} 条消息: {e}")
+                    if self.group_dates.get(group_id) == day:
+                        self.group_counts[group_id] -= len(texts)
+                    continue
+                self._merge(group_id, day, counter)
+        finally:
+            self._flush_tasks.pop(group_id, None)
+    
+    async def flush(self, group_id: str):
+        """把该群尚未分词的消息全部计入词频"""
+        if self.group_pending.get(group_id):
+            self._schedule_flush(group_id)
+        task = self._flush_tasks.get(group_id)
+        if task is not None:
+            await task
     
     def generate_wordcloud(self, group_id: str) -> Dict:
         """生成词云数据"""
-        if group_id not in self.group_messages:
+        if not self.group_counts.get(group_id):
             return {"words": [], "count": 0, "generated_at": ""}
         
-        messages = self.group_messages[group_id]
-        if not messages:
-            return {"words": [], "count": 0, "generated_at": ""}
-        
-        # 提取所有词语
-        all_words = []
-        for msg in messages:
-            if JIEBA_AVAILABLE:
-                words = self.extract_words_jieba(msg)
-            else:
-                words = self.extract_words_simple(msg)
-            all_words.extend(words)
-        
-        # 统计词频
-        word_counter = Counter(all_words)
-        
-        # 获取前30个高频词
-        top_words = word_counter.most_common(30)
+        # 获取前30个高频词（尚未分词的消息需先 flush）
+        top_words = self.group_counters[group_id].most_common(30)
         
         result = {
             "words": [{"word": w, "count": c} for w, c in top_words],
-            "count": len(messages),
+            "count": self.group_counts[group_id],
             "generated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
             "method": "jieba" if JIEBA_AVAILABLE else "simple"
         }
@@ -232,8 +195,14 @@ class WordCloudManager:
         
         return True
     
+    async def get_wordcloud_async(self, group_id: str) -> Dict:
+        """获取词云；需要生成时先在分词进程中处理剩余消息，不阻塞事件循环"""
+        if self.should_update_wordcloud(group_id):
+            await self.flush(group_id)
+        return self.get_wordcloud(group_id)
+    
     def get_wordcloud(self, group_id: str) -> Dict:
-        """获取词云（如果需要则生成）"""
+        """获取词云（如果需要则生成）；未分词的消息不会计入，异步环境请用 get_wordcloud_async"""
         if self.should_update_wordcloud(group_id):
             return self.generate_wordcloud(group_id)
         elif group_id in self.group_wordclouds:
@@ -245,6 +214,14 @@ class WordCloudManager:
 # 全局实例
 wordcloud_manager = WordCloudManager()
 
+# 启动时拉起分词进程，关闭时结束（脱离 NoneBot 单独导入时跳过）
+try:
+    driver = get_driver()
+    driver.on_startup(wordcloud_manager.start)
+    driver.on_shutdown(wordcloud_manager.shutdown)
+except ValueError:
+    pass
+
 
 # 注册命令
 wordcloud_cmd = on_command("今日词云", aliases={"词云", "热词"}, priority=5, block=True)
@@ -267,7 +244,7 @@ async def handle_wordcloud(bot: Bot, event: Event):
             return
         
         # 获取词云
-        wordcloud_data = wordcloud_manager.get_wordcloud(group_id)
+        wordcloud_data = await wordcloud_manager.get_wordcloud_async(group_id)
         
         if not wordcloud_data["words"]:
             await wordcloud_cmd.finish("今天还没有足够的聊天记录喵~")
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+钓鱼经济蒙特卡洛模拟
+离线驱动 FishingService / EventService / TitleService，用虚拟时钟推进时间，
+统计稀有度/闪光/暗黑分布、功德流向、随机事件和头衔解锁率，并测量每秒钓鱼次数
+用法: python simulate.py [--casts 100000] [--users 50] [--knocks 1] [--interval 30] [--seed 42]
+"""
+
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import date, datetime
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+
+class SimClock:
+    """
+    虚拟时钟：替换业务模块里的 time/datetime/date，
+    让事件过期、每日重置、鱼的活跃时段按模拟时间走，而不是按真实耗时
+    """
+
+    def __init__(self, start: float):
+        self.now = start
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+    def install(self, *modules):
+        clock = self
+
+        class SimTime:
+            def __getattr__(self, name):
+                return getattr(time, name)
+
+            @staticmethod
+            def time() -> float:
+                return clock.now
+
+        class SimDateTime(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return datetime.fromtimestamp(clock.now, tz)
+
+        class SimDate(date):
+            @classmethod
+            def today(cls):
+                return date.fromtimestamp(clock.now)
+
+        replacements = {"time": SimTime(), "datetime": SimDateTime, "date": SimDate}
+        for module in modules:
+            for name, value in replacements.items():
+                if hasattr(module, name):
+                    setattr(module, name, value)
+
+
+def vectorized_distribution(service, casts: int, today_merit: int, bait_count: int,
+                            seed: int) -> dict:
+    """
+    无事件、不分时段时的理论分布（NumPy 向量化），作为完整模拟的对照：
+    按 _calculate_probabilities 的稀有度概率和闪光/暗黑概率一次性抽 casts 次
+    """
+    rarities = list(service.BASE_PROBABILITIES)
+    probs = service._calculate_probabilities(today_merit, bait_count, {})
+    rng = np.random.default_rng(seed)
+    drawn = rng.choice(len(rarities), size=casts, p=[probs[r] for r in rarities])
+    shiny_chance = 0.15 if today_merit >= 100 else service.BASE_SHINY_CHANCE
+    shiny = rng.random(casts) < shiny_chance
+    dark = ~shiny & (rng.random(casts) < service.BASE_DARK_CHANCE)
+    counts = np.bincount(drawn, minlength=len(rarities))
+    return {
+        "rarity": {r.value: int(c) / casts for r, c in zip(rarities, counts)},
+        "shiny": float(shiny.mean()),
+        "dark": float(dark.mean()),
+    }
+
+
+def run_simulation(args) -> dict:
+    """按参数跑完整模拟，返回统计结果"""
+    import plugins.unified_db as db_module
+    import plugins.event_service as event_module
+    import plugins.fishing_service as fishing_module
+    import plugins.title_service as title_module
+    from plugins.unified_db import UnifiedDatabase
+    from plugins.woodfish_plugin import get_knock_result
+
+    db = UnifiedDatabase(f"{args.workdir}/simulate.db", pragma_profile="performance")
+    # 让服务层使用模拟库
+    for module in (event_module, fishing_module, title_module):
+        module.unified_db = db
+    event_module.EventService._effects_cache.clear()
+
+    clock = SimClock(datetime(2025, 1, 1, 8).timestamp())
+    clock.install(db_module, event_module, fishing_module)
+
+    event_service = event_module.event_service
+    title_service = title_module.title_service
+    fishing = fishing_module.FishingService()
+
+    # 统计触发的随机事件
+    event_counts = Counter()
+    trigger = event_service.trigger_random_event
+
+    def counting_trigger(*a, **kw):
+        result = trigger(*a, **kw)
+        if result:
+            event_counts[result[0].name] += 1
+        return result
+
+    event_service.trigger_random_event = counting_trigger
+
+    group_id = "sim"
+    users = [f"user{i}" for i in range(args.users)]
+    rarity_counts = Counter()
+    failures = Counter()
+    shiny = dark = caught = 0
+    knock_merit = fish_merit = 0
+    first_unlock = {}  # (user, title) -> 第几次钓鱼时解锁
+
+    start = time.perf_counter()
+    try:
+        for cast in range(args.casts):
+            clock.advance(args.interval)
+            user_id = random.choice(users)
+
+            for _ in range(args.knocks):
+                effects = event_service.get_active_effects(group_id)
+                delta, _ = get_knock_result(effects.get("merit_bonus", 0))
+                db.update_merit(group_id, user_id, user_id, delta)
+                knock_merit += delta
+
+            result = fishing.fish(group_id, user_id, user_id)
+            fish_merit += result.merit_change
+            if not result.success:
+                failures[result.message] += 1
+            for r in (result, result.extra_fish):
+                if r and r.fish:
+                    caught += 1
+                    rarity_counts[r.fish.rarity.value] += 1
+                    shiny += r.fish.is_shiny
+                    dark += r.fish.is_dark
+
+            for title in title_service.check_and_unlock(group_id, user_id):
+                first_unlock.setdefault((user_id, title), cast + 1)
+    finally:
+        event_service.trigger_random_event = trigger
+    elapsed = time.perf_counter() - start
+
+    total_merit = sum(u.total_merit for u in db.get_all_users_in_group(group_id))
+    db.close()
+
+    unlocks = {}
+    for title in title_module.TitleService.ALL_TITLES:
+        casts_at = [c for (_, t), c in first_unlock.items() if t == title]
+        unlocks[title] = (len(casts_at) / len(users),
+                          round(statistics.median(casts_at)) if casts_at else None)
+
+    return {
+        "elapsed": elapsed,
+        "casts_per_sec": args.casts / elapsed,
+        "caught": caught,
+        "rarity": {k: v / caught for k, v in rarity_counts.items()} if caught else {},
+        "shiny": shiny / caught if caught else 0,
+        "dark": dark / caught if caught else 0,
+        "failures": failures,
+        "events": event_counts,
+        "knock_merit": knock_merit,
+        "fish_merit": fish_merit,
+        "event_merit": total_merit - knock_merit - fish_merit,
+        "total_merit": total_merit,
+        "unlocks": unlocks,
+        "sim_days": args.casts * args.interval / 86400,
+    }
+
+
+def print_report(stats: dict, args, expected: dict = None):
+    casts = args.casts
+    print(f"模拟 {casts} 次钓鱼 / {args.users} 人 / 约 {stats['sim_days']:.1f} 天，"
+          f"耗时 {stats['elapsed']:.1f}s，{stats['casts_per_sec']:.0f} 次/秒")
+
+    print(f"\n钓到 {stats['caught']} 条（含双倍收获）")
+    print(f"{'稀有度':<12}{'模拟':>10}{'理论':>10}")
+    for rarity in ("common", "rare", "epic", "legendary"):
+        theory = f"{expected['rarity'][rarity]:>10.2%}" if expected else f"{'-':>10}"
+        print(f"{rarity:<12}{stats['rarity'].get(rarity, 0):>10.2%}{theory}")
+    for name in ("shiny", "dark"):
+        theory = f"{expected[name]:>10.2%}" if expected else f"{'-':>10}"
+        print(f"{name:<12}{stats[name]:>10.2%}{theory}")
+
+    print("\n未钓到：")
+    for message, count in stats["failures"].most_common():
+        print(f"  {count / casts:>7.2%}  {message}")
+
+    print("\n功德流向：")
+    print(f"  敲木鱼   {stats['knock_merit']:>+10}")
+    print(f"  钓鱼     {stats['fish_merit']:>+10}")
+    print(f"  个人事件 {stats['event_merit']:>+10}")
+    print(f"  总功德   {stats['total_merit']:>10}  (人均 {stats['total_merit'] / args.users:.0f})")
+
+    print("\n随机事件（前 10）：")
+    for name, count in stats["events"].most_common(10):
+        print(f"  {count:>8}  {name}")
+
+    print(f"\n{'头衔':<10}{'解锁率':>8}{'解锁时钓鱼次数中位数':>22}")
+    for title, (rate, median) in stats["unlocks"].items():
+        print(f"{title:<10}{rate:>8.0%}{median if median is not None else '-':>22}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="钓鱼经济蒙特卡洛模拟")
+    parser.add_argument("--casts", type=int, default=100000, help="钓鱼总次数")
+    parser.add_argument("--users", type=int, default=50, help="参与的用户数")
+    parser.add_argument("--knocks", type=int, default=1, help="每次钓鱼前敲木鱼的次数")
+    parser.add_argument("--interval", type=float, default=30, help="相邻两次钓鱼间隔的模拟秒数")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    parser.add_argument("--theory-merit", type=int, default=100,
+                        help="理论分布对照使用的今日功德（>=100 时闪光概率提高）")
+    args = parser.parse_args()
+
+    # 临时库优先放在内存盘上；模块导入时的全局实例也写在这里，避免碰真实数据
+    shm = Path("/dev/shm")
+    args.workdir = tempfile.mkdtemp(prefix="qqbot-sim-", dir=shm if shm.is_dir() else None)
+    os.chdir(args.workdir)
+    random.seed(args.seed)
+
+    try:
+        stats = run_simulation(args)
+
+        expected = None
+        if NUMPY_AVAILABLE:
+            from plugins.fishing_service import FishingService
+            expected = vectorized_distribution(FishingService(), args.casts, args.theory_merit, 0, args.seed)
+        else:
+            print("未安装 numpy，跳过理论分布对照")
+        print_report(stats, args, expected)
+    finally:
+        # 内存盘上的临时库不删会一直占内存
+        shutil.rmtree(args.workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()